@@ -9,8 +9,14 @@ https://docs.djangoproject.com/en/4.1/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+
+from Harvest.handlers import StreamingASGIHandler
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Harvest.settings')
+# read-only pages are served by async views, without a thread hop for each of them
+os.environ.setdefault('HARVEST_ASYNC_VIEWS', '1')
 
-application = get_asgi_application()
+# like django.core.asgi.get_asgi_application(), with streamed exports read from database off the event loop
+django.setup(set_prefix=False)
+application = StreamingASGIHandler()
@@ -0,0 +1,103 @@
+"""
+Database configuration read from environment variables.
+
+HARVEST_DB_ENGINE selects the profile:
+
+sqlite (default)
+    HARVEST_DB_NAME            path of database file, db.sqlite3 in project directory by default
+    HARVEST_DB_BUSY_TIMEOUT    milliseconds a connection waits for a lock held by another one (5000)
+    HARVEST_DB_JOURNAL_MODE    WAL by default, so readers don't block the writer and the other way round
+    HARVEST_DB_SYNCHRONOUS     NORMAL by default, which is durable enough in WAL mode and much faster
+    HARVEST_DB_MMAP_SIZE       bytes of database file read through memory map (256 MiB)
+    HARVEST_DB_CONN_MAX_AGE    seconds a connection is reused for, 0 closes it after each request (0)
+    HARVEST_DB_IMMEDIATE       1 (default) starts transactions with BEGIN IMMEDIATE, so parallel writers
+                               wait for each other instead of failing with "database is locked", 0 turns it off
+
+postgresql
+    HARVEST_DB_NAME, HARVEST_DB_USER, HARVEST_DB_PASSWORD, HARVEST_DB_HOST, HARVEST_DB_PORT
+    HARVEST_DB_CONN_MAX_AGE    seconds persistent connections are kept open for (60)
+    HARVEST_DB_POOLER          set to "pgbouncer" when connecting through PgBouncer in transaction mode,
+                               connections are then pooled by PgBouncer instead of kept by Django
+    HARVEST_DB_SSLMODE         sslmode of connection, left to libpq default when not set
+
+Read replicas
+    HARVEST_DB_REPLICAS        comma separated replicas of the primary, file paths for sqlite and host[:port]
+                               for postgresql, other settings are the same as primary's. They are added
+                               as aliases replica1, replica2, ... used by harvest.routers.ReplicaRouter
+    HARVEST_DB_REPLICA_PIN     seconds user's reads stay on primary after their harvests change (5)
+
+SQLite pragmas are applied to each new connection by a connection_created hook (harvest/db.py).
+"""
+from pathlib import Path
+from typing import Mapping
+
+
+def sqlite_pragmas(environ: Mapping[str, str]) -> dict[str, str]:
+    """Pragmas executed on each new SQLite connection, in order"""
+    return {
+        "journal_mode": environ.get("HARVEST_DB_JOURNAL_MODE", "WAL"),
+        "synchronous": environ.get("HARVEST_DB_SYNCHRONOUS", "NORMAL"),
+        "busy_timeout": str(int(environ.get("HARVEST_DB_BUSY_TIMEOUT", 5000))),
+        "mmap_size": str(int(environ.get("HARVEST_DB_MMAP_SIZE", 256 * 2 ** 20))),
+        "foreign_keys": "ON",
+    }
+
+
+def database_config(environ: Mapping[str, str], base_dir: Path) -> dict:
+    """
+    Settings of default database for profile selected by HARVEST_DB_ENGINE.
+
+    :raises ValueError: when engine is not supported
+    """
+    engine = environ.get("HARVEST_DB_ENGINE", "sqlite")
+
+    if engine == "sqlite":
+        busy_timeout = int(environ.get("HARVEST_DB_BUSY_TIMEOUT", 5000))
+        immediate = environ.get("HARVEST_DB_IMMEDIATE", "1") == "1"
+        return {
+            "ENGINE": "harvest.backends.sqlite3" if immediate else "django.db.backends.sqlite3",
+            "NAME": environ.get("HARVEST_DB_NAME", base_dir / "db.sqlite3"),
+            "CONN_MAX_AGE": int(environ.get("HARVEST_DB_CONN_MAX_AGE", 0)),
+            # timeout of sqlite3 module, in seconds, covers locks met while connecting and applying pragmas
+            "OPTIONS": {"timeout": busy_timeout / 1000},
+        }
+
+    if engine == "postgresql":
+        pgbouncer = environ.get("HARVEST_DB_POOLER") == "pgbouncer"
+        config = {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": environ.get("HARVEST_DB_NAME", "harvest"),
+            "USER": environ.get("HARVEST_DB_USER", ""),
+            "PASSWORD": environ.get("HARVEST_DB_PASSWORD", ""),
+            "HOST": environ.get("HARVEST_DB_HOST", ""),
+            "PORT": environ.get("HARVEST_DB_PORT", ""),
+            "CONN_MAX_AGE": int(environ.get("HARVEST_DB_CONN_MAX_AGE", 0 if pgbouncer else 60)),
+            # persistent connections broken while idle are replaced instead of failing a request
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": {},
+        }
+        if pgbouncer:
+            # named cursors don't survive across transactions pooled on different server connections
+            config["DISABLE_SERVER_SIDE_CURSORS"] = True
+        if "HARVEST_DB_SSLMODE" in environ:
+            config["OPTIONS"]["sslmode"] = environ["HARVEST_DB_SSLMODE"]
+        return config
+
+    raise ValueError(f"Unsupported HARVEST_DB_ENGINE {engine}, choose sqlite or postgresql")
+
+
+def replica_configs(environ: Mapping[str, str], primary: dict) -> dict[str, dict]:
+    """Settings of read replicas listed in HARVEST_DB_REPLICAS, by alias"""
+    replicas = {}
+    for i, location in enumerate(filter(None, environ.get("HARVEST_DB_REPLICAS", "").split(",")), start=1):
+        # in tests replicas are the test database itself
+        config = {**primary, "OPTIONS": dict(primary["OPTIONS"]), "TEST": {"MIRROR": "default"}}
+        if primary["ENGINE"] == "django.db.backends.postgresql":
+            config["HOST"], _, port = location.strip().partition(":")
+            config["PORT"] = port or primary["PORT"]
+        else:
+            # opened read-only, so a missing file fails to connect instead of being created empty
+            config["ENGINE"] = "django.db.backends.sqlite3"
+            config["NAME"] = f"file:{Path(location.strip()).resolve()}?mode=ro"
+        replicas[f"replica{i}"] = config
+    return replicas
@@ -0,0 +1,34 @@
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIHandler
+
+
+class StreamingASGIHandler(ASGIHandler):
+    """
+    ASGI handler reading streaming responses in a worker thread.
+
+    Django 4.1 iterates them on the event loop, where the queries of a streamed export aren't allowed,
+    so each part is fetched with sync_to_async instead, on the thread the sync view ran on.
+    """
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+
+        response_headers = []
+        for header, value in response.items():
+            if isinstance(header, str):
+                header = header.encode("ascii")
+            if isinstance(value, str):
+                value = value.encode("latin1")
+            response_headers.append((bytes(header), bytes(value)))
+        for c in response.cookies.values():
+            response_headers.append((b"Set-Cookie", c.output(header="").encode("ascii").strip()))
+        await send({"type": "http.response.start", "status": response.status_code, "headers": response_headers})
+
+        parts = iter(response)
+        next_part = sync_to_async(next, thread_sensitive=True)
+        while (part := await next_part(parts, None)) is not None:
+            for chunk, _ in self.chunk_bytes(part):
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body"})
+        await sync_to_async(response.close, thread_sensitive=True)()
@@ -10,8 +10,14 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
+import importlib.util
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
+from Harvest.database import database_config, replica_configs, sqlite_pragmas
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -23,15 +29,18 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = 'django-insecure--*pa6-kj-(f1o_v=p@x=n9)u7(og(vo&e^b%@$pn%4yxy*ua9='
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# HARVEST_DEBUG=0 turns it off, e.g. when measuring performance, as debug mode records every query
+DEBUG = os.environ.get('HARVEST_DEBUG', '1') == '1'
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = [host for host in os.environ.get('HARVEST_ALLOWED_HOSTS', '').split(',') if host] \
+    or ([] if DEBUG else ['localhost', '127.0.0.1'])
 
 
 # Application definition
 
+# Font Awesome is served from harvest/static/harvest/fontawesome/, subset of fontawesomefree package
+# made by subset_fontawesome command
 INSTALLED_APPS = [
-    'fontawesomefree',
     'harvest.apps.HarvestConfig',
     'django.contrib.admin',
     'django.contrib.auth',
@@ -49,17 +58,52 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'harvest.routers.read_your_writes_middleware',
 ]
 
+# per-request query count and timings in Server-Timing header and "harvest.instrumentation" log,
+# see harvest/instrumentation.py
+HARVEST_INSTRUMENTATION = os.environ.get('HARVEST_INSTRUMENTATION', '') == '1'
+if HARVEST_INSTRUMENTATION:
+    MIDDLEWARE.insert(0, 'harvest.instrumentation.ProfilingMiddleware')
+
+# queries allowed per request of a view (by url name), requests over budget are logged as warnings
+HARVEST_QUERY_BUDGETS = {
+    'default': int(os.environ.get('HARVEST_QUERY_BUDGET', 10)),
+}
+
+# collected static files (STATIC_ROOT) served by Django itself, with immutable cache headers and precompressed
+# copies, see harvest/static_server.py
+if os.environ.get('HARVEST_SERVE_STATIC', '') == '1':
+    MIDDLEWARE.insert(MIDDLEWARE.index('django.middleware.security.SecurityMiddleware') + 1,
+                      'harvest.static_server.StaticFilesMiddleware')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'harvest.instrumentation': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
 ROOT_URLCONF = 'Harvest.urls'
 
+# parsed templates are kept in memory by cached loader, in debug mode too, where it is reset when templates change;
+# HARVEST_TEMPLATE_CACHE=0 parses them on every render
+TEMPLATE_LOADERS = ['django.template.loaders.filesystem.Loader', 'django.template.loaders.app_directories.Loader']
+if os.environ.get('HARVEST_TEMPLATE_CACHE', '1') == '1':
+    TEMPLATE_LOADERS = [('django.template.loaders.cached.Loader', TEMPLATE_LOADERS)]
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates']
         ,
-        'APP_DIRS': True,
         'OPTIONS': {
+            'loaders': TEMPLATE_LOADERS,
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -70,18 +114,99 @@ TEMPLATES = [
     },
 ]
 
+# Jinja2 is optional, when installed its templates of hot pages (harvest/jinja2/) can be rendered instead of Django
+# ones by views listed in HARVEST_JINJA2_VIEWS, like "index,harvest_list"
+if importlib.util.find_spec('jinja2'):
+    TEMPLATES.append({
+        'BACKEND': 'django.template.backends.jinja2.Jinja2',
+        'NAME': 'jinja2',
+        'DIRS': [],
+        'APP_DIRS': True,
+        'OPTIONS': {
+            'environment': 'harvest.jinja2_env.environment',
+            'context_processors': [
+                'django.contrib.auth.context_processors.auth',
+            ],
+        },
+    })
+
+# template engine (NAME of TEMPLATES entry) rendering pages of given views, first engine having the template if not set
+HARVEST_TEMPLATE_ENGINES = {view: 'jinja2' for view in os.environ.get('HARVEST_JINJA2_VIEWS', '').split(',') if view}
+if HARVEST_TEMPLATE_ENGINES and not importlib.util.find_spec('jinja2'):
+    raise ImproperlyConfigured('HARVEST_JINJA2_VIEWS needs Jinja2 installed: pip install jinja2')
+
 WSGI_APPLICATION = 'Harvest.wsgi.application'
 
+# serve read-only harvest pages with async views, enabled by Harvest/asgi.py
+HARVEST_ASYNC_VIEWS = os.environ.get('HARVEST_ASYNC_VIEWS', '') == '1'
+
 
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
+# profile and its tuning are selected with HARVEST_DB_* environment variables, see Harvest/database.py
+
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': database_config(os.environ, BASE_DIR),
 }
+DATABASES.update(replica_configs(os.environ, DATABASES['default']))
+
+# reads of dashboard, list and reporting commands go to a replica, when there is one available
+DATABASE_ROUTERS = ['harvest.routers.ReplicaRouter']
+
+HARVEST_DB_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+
+# seconds reads of a client go to primary after its write, told by cookie set by read_your_writes_middleware
+HARVEST_DB_REPLICA_PIN = float(os.environ.get('HARVEST_DB_REPLICA_PIN', 5))
+
+SQLITE_PRAGMAS = sqlite_pragmas(os.environ)
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+# HARVEST_CACHE selects backend of cached dashboard and list pages: locmem (default), file or db,
+# the db backend needs its table created first with "python manage.py createcachetable"
+
+CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'harvest',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('HARVEST_CACHE_LOCATION', BASE_DIR / 'cache'),
+    },
+    'db': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': os.environ.get('HARVEST_CACHE_LOCATION', 'harvest_cache'),
+    },
+}
+
+CACHES = {
+    'default': CACHE_BACKENDS[os.environ.get('HARVEST_CACHE', 'locmem')],
+}
+
+SHARED_CACHE = not CACHES['default']['BACKEND'].endswith('LocMemCache')
+
+# cached pages and {% cache %} fragments are keyed on data versions bumped on writes, which reach every process
+# only through a shared cache: management commands and other workers writing harvests can't bump versions kept in
+# local memory of a web process, so with it pages are cached only when forced by HARVEST_PAGE_CACHE=1
+HARVEST_PAGE_CACHE = os.environ.get('HARVEST_PAGE_CACHE', '1' if SHARED_CACHE else '0') == '1'
+
+# ETag and Last-Modified of pages come from data versions kept in the cache, so all processes serving requests have to
+# share it; local memory cache is per process, with it conditional GET is on only when forced by
+# HARVEST_CONDITIONAL_GET=1, for a single process deployment
+HARVEST_CONDITIONAL_GET = os.environ.get('HARVEST_CONDITIONAL_GET', '1' if SHARED_CACHE else '0') == '1'
+
+# cached pages are invalidated on writes by version bump, timeout only bounds memory held by stale ones
+HARVEST_CACHE_TIMEOUT = int(os.environ.get('HARVEST_CACHE_TIMEOUT', 3600))
+
+# requests each user can make to JSON API per number of seconds, counted in the default cache
+HARVEST_API_RATE_LIMIT = (int(os.environ.get('HARVEST_API_RATE_LIMIT', 600)), 60)
+
+# failed Basic auth attempts to JSON API each client address can make per number of seconds
+HARVEST_API_AUTH_RATE_LIMIT = (int(os.environ.get('HARVEST_API_AUTH_RATE_LIMIT', 10)), 60)
 
 
 # Password validation
@@ -120,6 +245,13 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+STATIC_ROOT = os.environ.get('HARVEST_STATIC_ROOT', BASE_DIR / 'staticfiles')
+
+# HARVEST_STATIC_PIPELINE=1 makes collectstatic write files with content hash in their names and gzip and brotli
+# copies of them, which templates then link to, see harvest/storage.py
+if os.environ.get('HARVEST_STATIC_PIPELINE', '') == '1':
+    STATICFILES_STORAGE = 'harvest.storage.CompressedManifestStaticFilesStorage'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
 
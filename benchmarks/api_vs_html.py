@@ -0,0 +1,69 @@
+"""
+Compare cost of serving harvest lists as JSON API pages and as HTML harvest_list pages.
+
+Usage: python -m benchmarks.api_vs_html [--harvests N] [--limits N ...] [--repeat N]
+
+Pages of given sizes are requested through Django's test client, with all middleware, with
+page caching disabled. Reported are milliseconds per page and microseconds per listed row.
+HTML pages are measured only for sizes offered by the list (at most 10 rows).
+"""
+import argparse
+import time
+
+from benchmarks.common import seed, setup_django, teardown_django
+
+
+def measure(client, url: str, params: dict, repeat: int) -> float:
+    """Best of repeated requests, in seconds"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.get(url, params)
+        timings.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.status_code
+    return min(timings)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--harvests", type=int, default=5000, help="Number of harvests of listed user")
+    parser.add_argument("--limits", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+    try:
+        from django.contrib.auth.models import User
+        from django.test import Client, override_settings
+        from django.test.utils import setup_test_environment
+        from django.urls import reverse
+
+        from harvest.views import PAGE_LIMITS
+
+        setup_test_environment()
+        seed(1, args.harvests)
+        client = Client()
+        client.force_login(User.objects.get())
+
+        pages = {
+            "html": (reverse("harvest:harvest-list"), lambda limit: {"harvests-per-page": limit}),
+            "api": (reverse("harvest:api-harvests"), lambda limit: {"limit": limit}),
+            "api ?fields=date,amount": (reverse("harvest:api-harvests"),
+                                        lambda limit: {"limit": limit, "fields": "date,amount"}),
+        }
+        caches = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+        with override_settings(CACHES=caches, HARVEST_API_RATE_LIMIT=(10 ** 9, 60)):
+            for limit in args.limits:
+                for name, (url, params) in pages.items():
+                    if name == "html" and limit > PAGE_LIMITS[-1]:
+                        continue
+                    elapsed = measure(client, url, params(limit), args.repeat)
+                    print(f"{name:>24}, {limit:>5} rows: {elapsed * 1000:>8.2f} ms/page, "
+                          f"{elapsed * 1_000_000 / limit:>7.1f} us/row")
+    finally:
+        teardown_django()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
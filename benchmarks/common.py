@@ -0,0 +1,48 @@
+"""Helpers shared by benchmark scripts, run them from repository root like `python -m benchmarks.<name>`"""
+import os
+import sys
+from io import StringIO
+from typing import Optional
+
+import django
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup_django(db_name: Optional[str] = None) -> None:
+    """
+    Configure Django and create a fresh, migrated benchmark database.
+
+    :param db_name: path of SQLite file to use, in-memory database when None
+    """
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "Harvest.settings")
+    django.setup()
+
+    from django.db import connection
+
+    if db_name:
+        connection.settings_dict["TEST"]["NAME"] = db_name
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+
+
+def teardown_django() -> None:
+    from django.db import connection
+
+    connection.creation.destroy_test_db(connection.settings_dict["NAME"], verbosity=0)
+
+
+def seed(n_users: int, harvests_per_user: int, first_year: int = 2000, seed_value: int = 7) -> None:
+    """
+    Fill database with valid harvests of new users with seed_harvests command.
+
+    Seasons since first_year are added until they have room for harvests_per_user harvests of each user.
+    """
+    from django.core.management import call_command
+
+    from harvest.management.commands.seed_harvests import FRUITS, season_days
+
+    n_seasons = -(-harvests_per_user // (len(season_days(first_year, whole_year=False)) * len(FRUITS)))
+    call_command("seed_harvests", users=n_users, harvests=n_users * harvests_per_user, first_year=first_year,
+                 last_year=first_year + max(n_seasons, 1) - 1, seed=seed_value, prefix="bench", stdout=StringIO())
@@ -0,0 +1,126 @@
+"""
+Stress SQLite database with parallel writers and count lock errors, with and without connection tuning.
+
+Usage: python -m benchmarks.db_concurrency [--writers N ...] [--operations N]
+
+Each writer thread has its own connection, like a request thread of a threaded server, and runs
+a mix of the app's write paths: adding, editing and deleting harvests, each in a transaction
+together with its rollup update. Profiles:
+
+  default   Django's defaults, rollback journal and full sync
+  tuned     pragmas from SQLITE_PRAGMAS (WAL, synchronous=NORMAL, busy_timeout, mmap) and
+            write transactions started with BEGIN IMMEDIATE, see Harvest/database.py
+
+Reported are completed operations per second, p99 latency and number of "database is locked" errors.
+"""
+import argparse
+import datetime
+import decimal
+import itertools
+import os
+import random
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import seed, setup_django, teardown_django
+
+PROFILES = {
+    "default": ("django.db.backends.sqlite3", {"journal_mode": "DELETE", "synchronous": "FULL"}, {}),
+    # None stands for settings made from environment
+    "tuned": (None, None, None),
+}
+
+# days after 2100-01-01 of added harvests, unique across writers and runs
+NEW_DAYS = itertools.count()
+
+
+def use_profile(name: str, tuned: tuple) -> None:
+    from django.conf import settings
+    from django.db import connections
+
+    engine, pragmas, options = (t if p is None else p for p, t in zip(PROFILES[name], tuned))
+    settings.SQLITE_PRAGMAS = pragmas
+    settings.DATABASES["default"].update(ENGINE=engine, OPTIONS=dict(options))
+    connections.close_all()
+
+
+def writer(user_ids: list[int], n_operations: int, seed_value: int) -> tuple[list[float], int]:
+    from django.db import OperationalError, connection, transaction
+
+    from harvest.models import Harvest
+
+    rnd = random.Random(seed_value)
+    latencies, errors = [], 0
+    try:
+        for _ in range(n_operations):
+            owner_id = rnd.choice(user_ids)
+            started = time.perf_counter()
+            try:
+                with transaction.atomic():
+                    operation = rnd.random()
+                    if operation < 0.5:
+                        Harvest(owner_id=owner_id, fruit=rnd.choice(Harvest.FRUITS)[0],
+                                date=datetime.date(2100, 1, 1) + datetime.timedelta(days=next(NEW_DAYS)),
+                                amount=rnd.randint(10, 5000), price=decimal.Decimal("1.50")).save()
+                    else:
+                        harvest = Harvest.objects.filter(owner_id=owner_id).order_by("?").first()
+                        if operation < 0.8:
+                            harvest.amount += 1
+                            harvest.save(update_fields=["amount"])
+                        else:
+                            harvest.delete()
+            except OperationalError as e:
+                if "locked" not in str(e):
+                    raise
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+    finally:
+        connection.close()
+    return latencies, errors
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--operations", type=int, default=100, help="Number of operations of each writer")
+    args = parser.parse_args()
+
+    db_dir = tempfile.TemporaryDirectory()
+    setup_django(os.path.join(db_dir.name, "bench.sqlite3"))
+    try:
+        from django.conf import settings
+        from django.contrib.auth.models import User
+
+        database = settings.DATABASES["default"]
+        tuned = (database["ENGINE"], settings.SQLITE_PRAGMAS, database["OPTIONS"])
+        seed(20, 200)
+        user_ids = list(User.objects.values_list("pk", flat=True))
+
+        for profile in PROFILES:
+            use_profile(profile, tuned)
+            for n_writers in args.writers:
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=n_writers) as pool:
+                    results = list(pool.map(writer, [user_ids] * n_writers, [args.operations] * n_writers,
+                                            range(n_writers)))
+                elapsed = time.perf_counter() - started
+                latencies = [latency for result in results for latency in result[0]]
+                errors = sum(result[1] for result in results)
+                p99 = statistics.quantiles(latencies, n=100, method="inclusive")[98] * 1000 if latencies else 0
+                print(f"{profile:>8}, {n_writers:>3} writers: {len(latencies) / elapsed:>8.1f} ops/s, "
+                      f"p99 {p99:>8.1f} ms, lock errors {errors:>5}")
+            # rows added by this profile's runs would collide with the next one's
+            from harvest.models import Harvest, HarvestSeasonRollup
+            Harvest.objects.filter(date__year__gte=2100).delete()
+            HarvestSeasonRollup.objects.rebuild()
+    finally:
+        teardown_django()
+        db_dir.cleanup()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
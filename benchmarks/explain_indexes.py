@@ -0,0 +1,73 @@
+"""
+Show SQLite query plans of the harvest query shapes used by harvest_list, index and gen_csv.
+
+Usage: python -m benchmarks.explain_indexes [--users N] [--harvests-per-user N]
+
+Exits with status 1 when any query shape, other than the unfiltered full export,
+is answered with a full table scan.
+"""
+import argparse
+import sys
+
+from benchmarks.common import seed, setup_django, teardown_django
+
+
+def query_shapes(owner) -> list:
+    from harvest.models import Harvest, HarvestSeasonRollup
+
+    year = Harvest.objects.filter(owner=owner).first().date.year
+    return [
+        ("harvest_list", "page", Harvest.objects.filter(owner=owner)[20:25]),
+        ("harvest_list", "page filtered by fruit", Harvest.objects.filter(owner=owner, fruit="apple")[20:25]),
+        ("harvest_list", "count filtered by fruit", Harvest.objects.filter(owner=owner, fruit="apple")
+         .order_by().values("id")),
+        ("index", "recent harvests", Harvest.objects.filter(owner=owner).order_by("date")[:5]),
+        ("index", "season summary (rollup)", HarvestSeasonRollup.objects.filter(owner=owner, year=year)
+         .order_by("fruit").values("fruit", "n_harvests", "total_amount", "total_value")),
+        ("index", "seasons (rollup)", HarvestSeasonRollup.objects.filter(owner=owner)
+         .order_by("year").values_list("year", flat=True).distinct()),
+        ("index", "season summary (harvests)", Harvest.objects.filter(owner=owner, date__year=year)
+         .order_by("fruit").values("fruit").totals()),
+        ("gen_csv", "all harvests", Harvest.objects.all()),
+        ("gen_csv", "--user-id", Harvest.objects.filter(owner=owner)),
+        ("gen_csv", "--year", Harvest.objects.filter(date__year=year)),
+        ("gen_csv", "--user-id --fruit --year", Harvest.objects.filter(owner=owner, fruit="apple",
+                                                                      date__year=year)),
+    ]
+
+
+def is_table_scan(plan: str) -> bool:
+    return any(" SCAN " in f" {line} " and "USING" not in line for line in plan.splitlines())
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--harvests-per-user", type=int, default=2000)
+    args = parser.parse_args()
+
+    setup_django()
+    try:
+        from django.contrib.auth.models import User
+        from django.db import connection
+
+        seed(args.users, args.harvests_per_user)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+        scans = 0
+        for view, name, queryset in query_shapes(User.objects.order_by("pk").first()):
+            plan = queryset.explain()
+            scan = is_table_scan(plan)
+            if scan and name != "all harvests":
+                scans += 1
+            print(f"{view:<13} {name:<27} {'TABLE SCAN' if scan else 'index'}")
+            for line in plan.splitlines():
+                print(f"{'':<14}{line}")
+        return 1 if scans else 0
+    finally:
+        teardown_django()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""
+Export synthetic harvests with gen_csv and report throughput and memory.
+
+Usage: python -m benchmarks.gen_csv_export [--rows N] [--chunk-size N ...] [--trace-heap]
+       python -m benchmarks.gen_csv_export --partition-by owner|year|fruit --workers N [N ...]
+
+The second form compares parallel partitioned exports with given numbers of worker
+processes; the database is stored in a temporary file so that workers can share it.
+
+Peak RSS of the process is reported after seeding and after each export, so growth
+caused by exporting is visible. With --trace-heap peak Python heap of each export is
+measured with tracemalloc too, which slows exports down noticeably.
+"""
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from io import StringIO
+
+from benchmarks.common import seed, setup_django, teardown_django
+
+
+def peak_rss_mib() -> float:
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_chunked(args) -> None:
+    from django.core.management import call_command
+
+    for chunk_size in args.chunk_size:
+        if args.trace_heap:
+            tracemalloc.start()
+        started = time.perf_counter()
+        call_command("gen_csv", test=1, chunk_size=chunk_size, stdout=StringIO())
+        elapsed = time.perf_counter() - started
+        report = (f"chunk size {chunk_size:>6}: {args.rows / elapsed:>10,.0f} rows/s, "
+                  f"{elapsed:.1f}s, peak RSS {peak_rss_mib():.1f} MiB")
+        if args.trace_heap:
+            report += f", peak heap {tracemalloc.get_traced_memory()[1] / 2 ** 20:.1f} MiB"
+            tracemalloc.stop()
+        print(report)
+
+
+def run_partitioned(args) -> None:
+    from django.core.management import call_command
+
+    first_elapsed = None
+    for workers in args.workers:
+        started = time.perf_counter()
+        call_command("gen_csv", test=1, partition_by=args.partition_by, workers=workers,
+                     chunk_size=args.chunk_size[0], stdout=StringIO())
+        elapsed = time.perf_counter() - started
+        first_elapsed = first_elapsed or elapsed
+        print(f"{workers:>3} workers: {args.rows / elapsed:>10,.0f} rows/s, {elapsed:.1f}s, "
+              f"speedup {first_elapsed / elapsed:.2f}x over {args.workers[0]} workers")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--chunk-size", type=int, nargs="+", default=[2000])
+    parser.add_argument("--trace-heap", action="store_true")
+    parser.add_argument("--partition-by", choices=["owner", "year", "fruit"])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1])
+    args = parser.parse_args()
+
+    db_dir = tempfile.TemporaryDirectory()
+    setup_django(os.path.join(db_dir.name, "bench.sqlite3") if args.partition_by else None)
+    try:
+        started = time.perf_counter()
+        seed(args.users, args.rows // args.users)
+        print(f"Seeded {args.rows} harvests in {time.perf_counter() - started:.1f}s, "
+              f"peak RSS {peak_rss_mib():.1f} MiB")
+
+        with tempfile.TemporaryDirectory() as out_dir:
+            cwd = os.getcwd()
+            os.chdir(out_dir)
+            try:
+                if args.partition_by:
+                    run_partitioned(args)
+                else:
+                    run_chunked(args)
+            finally:
+                os.chdir(cwd)
+        return 0
+    finally:
+        teardown_django()
+        db_dir.cleanup()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,337 @@
+"""
+Load test the whole site over HTTP with concurrent user sessions.
+
+Usage: python -m benchmarks.load_test [--server wsgi|asgi] [--concurrency N ...] [--duration S]
+                                      [--users N] [--harvests N] [--think S] [--output PATH]
+
+A database in a temporary file is seeded with seed_harvests and the project is started on
+it in a separate process, with debug mode off:
+
+  wsgi   Django's threaded WSGI server (the one of runserver), no extra packages needed
+  asgi   uvicorn serving Harvest/asgi.py (async read-only views), needs uvicorn installed
+
+Every virtual user repeats sessions of one seeded user: log in, open the dashboard, page
+through harvest list with cursor links, add a harvest, find it through JSON API, edit and
+delete it, log out. Each concurrency level runs for --duration seconds.
+
+Reported for every URL name are requests, error rate and p50 / p95 / p99 latency, and for
+the run requests and sessions per second. A response with other status than expected by
+the session (e.g. 200 of a form with errors instead of redirect) counts as an error.
+Clients run in threads of this process, on the same machine as the server.
+"""
+import argparse
+import datetime
+import html
+import http.client
+import json
+import os
+import random
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from http.cookies import SimpleCookie
+from io import StringIO
+from typing import Optional
+from urllib.parse import urlencode
+
+from benchmarks.common import REPO_ROOT, setup_django
+
+PASSWORD = "loadtestpass"
+FIRST_YEAR, LAST_YEAR = 2010, 2022
+# harvests added by sessions fall in the season after the seeded ones, so they never collide with them
+ADDED_YEAR = LAST_YEAR + 1
+NEXT_PAGE = re.compile(r'href="(\?[^"]*cursor=[^"]+)"')
+
+
+def serve(server: str, port: int) -> None:
+    """Run project server in this process, until it's terminated"""
+    if server == "asgi":
+        import uvicorn
+
+        uvicorn.run("Harvest.asgi:application", host="127.0.0.1", port=port, log_level="warning")
+        return
+
+    import django
+    from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+    from django.core.wsgi import get_wsgi_application
+
+    django.setup()
+
+    class QuietHandler(WSGIRequestHandler):
+        # headers and body are written separately, with Nagle's algorithm the body waits for delayed ACK
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+    class Server(ThreadedWSGIServer):
+        # backlog for many virtual users connecting at once
+        request_queue_size = 128
+
+    httpd = Server(("127.0.0.1", port), QuietHandler)
+    httpd.set_app(get_wsgi_application())
+    httpd.serve_forever()
+
+
+class Session:
+    """HTTP client of one virtual user, with cookies and persistent connection"""
+
+    def __init__(self, port: int, stats: "Stats"):
+        self.port = port
+        self.stats = stats
+        self.cookies = {}
+        self.connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+
+    def request(self, name: str, method: str, path: str, expected: int,
+                data: Optional[dict] = None) -> tuple[int, str]:
+        """Make request, record its latency under URL name and return status and body"""
+        headers = {"Cookie": "; ".join(f"{k}={v}" for k, v in self.cookies.items())}
+        body = None
+        if data is not None:
+            body = urlencode({**data, "csrfmiddlewaretoken": self.cookies.get("csrftoken", "")})
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+            headers["Referer"] = f"http://127.0.0.1:{self.port}{path}"
+
+        started = time.perf_counter()
+        try:
+            status, content = self._send(method, path, body, headers)
+        except (OSError, http.client.HTTPException):
+            self.stats.record(name, time.perf_counter() - started, error=True)
+            raise
+        self.stats.record(name, time.perf_counter() - started, error=status != expected)
+        return status, content
+
+    def _send(self, method: str, path: str, body: Optional[str], headers: dict) -> tuple[int, str]:
+        for attempt in range(2):
+            try:
+                self.connection.request(method, path, body=body, headers=headers)
+                response = self.connection.getresponse()
+                content = response.read().decode()
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # server closed persistent connection, retried once on a new one
+                self.connection.close()
+                if attempt:
+                    raise
+        for header in response.headers.get_all("Set-Cookie") or []:
+            for key, morsel in SimpleCookie(header).items():
+                self.cookies[key] = morsel.value
+        return response.status, content
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+class Stats:
+    """Latencies and errors per URL name, shared by virtual users"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.sessions = 0
+
+    def record(self, name: str, latency: float, error: bool) -> None:
+        with self.lock:
+            self.latencies[name].append(latency)
+            self.errors[name] += error
+
+    def report(self, elapsed: float) -> dict:
+        names = {}
+        for name, latencies in sorted(self.latencies.items()):
+            quantiles = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 \
+                else [latencies[0]] * 99
+            names[name] = {"requests": len(latencies),
+                           "error_rate": round(self.errors[name] / len(latencies), 4),
+                           **{f"p{p}_ms": round(quantiles[p - 1] * 1000, 2) for p in (50, 95, 99)}}
+        n_requests = sum(len(latencies) for latencies in self.latencies.values())
+        n_errors = sum(self.errors.values())
+        return {"requests": n_requests,
+                "requests_per_second": round(n_requests / elapsed, 1),
+                "sessions_per_second": round(self.sessions / elapsed, 2),
+                "error_rate": round(n_errors / n_requests, 4) if n_requests else 0,
+                "urls": names}
+
+
+def user_session(session: Session, paths: dict, username: str, pages: int, day: int,
+                 rnd: random.Random, think: float) -> None:
+    """One visit of a user, from logging in to logging out"""
+    def pause():
+        if think:
+            time.sleep(rnd.uniform(0, 2 * think))
+
+    session.request("login", "GET", paths["login"], 200)
+    session.request("login", "POST", paths["login"], 302, {"username": username, "password": PASSWORD})
+    pause()
+    session.request("harvest:home", "GET", paths["home"], 200)
+    pause()
+
+    next_page = f"?{urlencode({'harvests-per-page': 10})}"
+    for _ in range(pages):
+        _, content = session.request("harvest:harvest-list", "GET", paths["list"] + next_page, 200)
+        links = NEXT_PAGE.findall(content)
+        if not links:
+            break
+        # previous page link comes first
+        next_page = html.unescape(links[-1])
+        pause()
+
+    harvest = {"date": (datetime.date(ADDED_YEAR, 1, 1) + datetime.timedelta(days=day)).isoformat(),
+               "fruit": rnd.choice(["raspberry", "strawberry", "apple", "cherry"]),
+               "amount": rnd.randint(10, 5000), "price": f"{rnd.randint(10, 5000) / 100:.2f}"}
+    session.request("harvest:harvest-add", "GET", paths["add"], 200)
+    session.request("harvest:harvest-add", "POST", paths["add"], 301, harvest)
+    pause()
+
+    query = urlencode({"date_from": harvest["date"], "date_to": harvest["date"], "fruit": harvest["fruit"],
+                       "fields": "id"})
+    status, content = session.request("harvest:api-harvests", "GET", f"{paths['api']}?{query}", 200)
+    results = json.loads(content).get("results") if status == 200 else None
+    if results:
+        edit, delete = (paths[name].replace("0", str(results[0]["id"])) for name in ("edit", "delete"))
+        session.request("harvest:harvest-edit", "GET", edit, 200)
+        session.request("harvest:harvest-edit", "POST", edit, 301, {**harvest, "amount": rnd.randint(10, 5000)})
+        pause()
+        session.request("harvest:harvest-delete", "GET", delete, 200)
+        session.request("harvest:harvest-delete", "POST", delete, 301, {})
+    session.request("logout", "GET", paths["logout"], 200)
+
+
+def run_level(port: int, paths: dict, usernames: list[str], concurrency: int, duration: float,
+              pages: int, think: float) -> dict:
+    stats = Stats()
+    deadline = time.perf_counter() + duration
+
+    def virtual_user(i: int) -> None:
+        rnd = random.Random(i)
+        session = Session(port, stats)
+        n_sessions = 0
+        try:
+            while time.perf_counter() < deadline:
+                try:
+                    # each virtual user has its own seeded user, so added harvests of its sessions never collide
+                    user_session(session, paths, usernames[i], pages, n_sessions % 365, rnd, think)
+                except (OSError, http.client.HTTPException, ValueError):
+                    session.close()
+                    session = Session(port, stats)
+                n_sessions += 1
+        finally:
+            session.close()
+            with stats.lock:
+                stats.sessions += n_sessions
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=virtual_user, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return stats.report(time.perf_counter() - started)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(port: int, process: subprocess.Popen, timeout: float = 30) -> None:
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("Server didn't start listening in time")
+
+
+def print_report(concurrency: int, report: dict) -> None:
+    print(f"\nconcurrency {concurrency}: {report['requests_per_second']} req/s, "
+          f"{report['sessions_per_second']} sessions/s, error rate {report['error_rate']:.2%}")
+    print(f"  {'url name':<24} {'requests':>8} {'errors':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, url in report["urls"].items():
+        print(f"  {name:<24} {url['requests']:>8} {url['error_rate']:>7.2%} "
+              f"{url['p50_ms']:>8.1f} {url['p95_ms']:>8.1f} {url['p99_ms']:>8.1f}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--server", choices=["wsgi", "asgi"], default="wsgi")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--duration", type=float, default=30, help="Seconds each concurrency level runs for")
+    parser.add_argument("--users", type=int, default=100, help="Seeded users, at least the highest concurrency")
+    parser.add_argument("--harvests", type=int, default=1000, help="Seeded harvests of each user")
+    parser.add_argument("--pages", type=int, default=3, help="Harvest list pages visited in each session")
+    parser.add_argument("--think", type=float, default=0, help="Mean seconds of pause between user actions")
+    parser.add_argument("--output", help="Write results to JSON file")
+    parser.add_argument("--serve", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port)
+        return 0
+    if args.server == "asgi":
+        try:
+            import uvicorn  # noqa: F401
+        except ImportError:
+            parser.error("asgi server needs uvicorn, install it with: pip install uvicorn")
+
+    n_users = max(args.users, *args.concurrency)
+    db_dir = tempfile.TemporaryDirectory()
+    db_name = os.path.join(db_dir.name, "load.sqlite3")
+    setup_django(db_name)
+    try:
+        from django.core.management import call_command
+        from django.db import connections
+        from django.urls import reverse
+
+        started = time.perf_counter()
+        call_command("seed_harvests", harvests=n_users * args.harvests, users=n_users, prefix="load",
+                     password=PASSWORD, first_year=FIRST_YEAR, last_year=LAST_YEAR, stdout=StringIO())
+        connections.close_all()
+        print(f"Seeded {n_users} users with {args.harvests} harvests each in {time.perf_counter() - started:.1f}s")
+        paths = {"login": reverse("login"), "logout": reverse("logout"), "home": reverse("harvest:home"),
+                 "list": reverse("harvest:harvest-list"), "add": reverse("harvest:harvest-add"),
+                 "api": reverse("harvest:api-harvests"),
+                 "edit": reverse("harvest:harvest-edit", args=[0]),
+                 "delete": reverse("harvest:harvest-delete", args=[0])}
+        usernames = [f"load{i}" for i in range(n_users)]
+
+        port = free_port()
+        env = {**os.environ, "HARVEST_DB_NAME": db_name, "HARVEST_DEBUG": "0",
+               "HARVEST_API_RATE_LIMIT": str(10 ** 9), "DJANGO_SETTINGS_MODULE": "Harvest.settings"}
+        server = subprocess.Popen([sys.executable, "-m", "benchmarks.load_test", "--serve", args.server,
+                                   "--port", str(port)], cwd=REPO_ROOT, env=env)
+        results = {"server": args.server, "users": n_users, "harvests_per_user": args.harvests,
+                   "duration": args.duration, "levels": {}}
+        try:
+            wait_for(port, server)
+            for concurrency in args.concurrency:
+                report = run_level(port, paths, usernames, concurrency, args.duration, args.pages, args.think)
+                results["levels"][concurrency] = report
+                print_report(concurrency, report)
+        finally:
+            server.terminate()
+            server.wait()
+
+        if args.output:
+            with open(args.output, mode="w") as f:
+                json.dump(results, f, indent=2)
+            print(f"\nResults written to {args.output}")
+    finally:
+        db_dir.cleanup()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
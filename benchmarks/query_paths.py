@@ -0,0 +1,171 @@
+"""
+Time core query paths on databases seeded with seed_harvests at growing sizes and save results as JSON.
+
+Usage: python -m benchmarks.query_paths [--rows N ...] [--rows-per-user N] [--repeat N]
+                                        [--output PATH] [--compare PATH]
+
+For each size a fresh database file is seeded (with the same seed, so runs are comparable) and
+timed are: dashboard summary and page, first and deep harvest list pages, gen_csv export of
+everything and of one user, list_users and list_user_harvest. Pages are requested through
+Django's test client with caching disabled, as a user owning --rows-per-user harvests.
+
+Every path is repeated --repeat times, but not longer than --max-seconds; best and median
+times are saved. With --compare, times are shown next to ones of an earlier results file.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from io import StringIO
+from typing import Callable
+
+from benchmarks.common import REPO_ROOT, setup_django, teardown_django
+
+SEED = 0
+
+
+def measure(run: Callable[[], None], repeat: int, max_seconds: float) -> dict:
+    """Time run repeatedly, at least once, return best and median time in milliseconds"""
+    timings = []
+    deadline = time.perf_counter() + max_seconds
+    while len(timings) < repeat and (not timings or time.perf_counter() < deadline):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    return {"runs": len(timings),
+            "best_ms": round(min(timings) * 1000, 3),
+            "median_ms": round(statistics.median(timings) * 1000, 3)}
+
+
+def query_paths(rows_per_user: int) -> dict[str, Callable[[], None]]:
+    """Timed paths, run as the first seeded user"""
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from django.test import Client
+    from django.urls import reverse
+
+    from harvest.models import Harvest
+    from harvest.views import dashboard_data
+
+    user = User.objects.filter(username__startswith="seed").order_by("pk").first()
+    season = Harvest.objects.filter(owner=user).latest("date").date.year
+    client = Client()
+    client.force_login(user)
+    list_url = reverse("harvest:harvest-list")
+    # the largest page size offered by the list
+    per_page = 10
+    deep_page = max(rows_per_user // per_page // 2, 1)
+
+    def get(url: str, params: dict) -> Callable[[], None]:
+        def run():
+            response = client.get(url, params)
+            assert response.status_code == 200, response.status_code
+        return run
+
+    def command(name: str, *args, **options) -> Callable[[], None]:
+        return lambda: call_command(name, *args, stdout=StringIO(), **options)
+
+    return {
+        "dashboard summary": lambda: dashboard_data(user, season),
+        "dashboard page": get(reverse("harvest:home"), {"season": season}),
+        "list first page": get(list_url, {"harvests-per-page": per_page}),
+        "list deep page": get(list_url, {"harvests-per-page": per_page, "page": deep_page}),
+        "gen_csv all": command("gen_csv", test=1),
+        "gen_csv user": command("gen_csv", test=1, user_id=user.pk),
+        "list_users": command("list_users"),
+        "list_user_harvest": command("list_user_harvest", user.pk),
+    }
+
+
+def run_size(n_rows: int, args) -> list[dict]:
+    from django.core.management import call_command
+    from django.test import override_settings
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    db_dir = tempfile.TemporaryDirectory()
+    # file database, so that each size starts from empty one
+    setup_django(os.path.join(db_dir.name, "bench.sqlite3"))
+    setup_test_environment()
+    try:
+        n_users = max(n_rows // args.rows_per_user, 1)
+        started = time.perf_counter()
+        call_command("seed_harvests", harvests=n_rows, users=n_users, seed=SEED,
+                     first_year=args.first_year, last_year=args.last_year, stdout=StringIO())
+        print(f"Seeded {n_rows} harvests of {n_users} users in {time.perf_counter() - started:.1f}s")
+
+        results = []
+        caches = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+        with override_settings(CACHES=caches), tempfile.TemporaryDirectory() as out_dir:
+            cwd = os.getcwd()
+            # gen_csv writes to current directory
+            os.chdir(out_dir)
+            try:
+                for name, run in query_paths(min(args.rows_per_user, n_rows)).items():
+                    results.append({"rows": n_rows, "path": name, **measure(run, args.repeat, args.max_seconds)})
+            finally:
+                os.chdir(cwd)
+        return results
+    finally:
+        teardown_test_environment()
+        teardown_django()
+        db_dir.cleanup()
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    parser.add_argument("--rows-per-user", type=int, default=1000)
+    parser.add_argument("--first-year", type=int, default=2010)
+    parser.add_argument("--last-year", type=int, default=2022)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--max-seconds", type=float, default=10, help="Time limit of repeating one path")
+    parser.add_argument("--output", default="query_paths.json")
+    parser.add_argument("--compare", help="Earlier results file to compare with")
+    args = parser.parse_args()
+
+    previous = {}
+    if args.compare:
+        with open(args.compare) as f:
+            previous = {(r["rows"], r["path"]): r for r in json.load(f)["results"]}
+
+    results = []
+    for n_rows in args.rows:
+        for result in run_size(n_rows, args):
+            results.append(result)
+            report = f"{n_rows:>9} rows  {result['path']:<20} {result['best_ms']:>10.2f} ms best, " \
+                     f"{result['median_ms']:>10.2f} ms median"
+            before = previous.get((n_rows, result["path"]))
+            if before:
+                report += f", {before['best_ms'] / result['best_ms']:.2f}x vs {before['best_ms']:.2f} ms"
+            print(report)
+
+    import django
+    with open(args.output, mode="w") as f:
+        json.dump({
+            "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "seed": SEED,
+            "rows_per_user": args.rows_per_user,
+            "results": results,
+        }, f, indent=2)
+    print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
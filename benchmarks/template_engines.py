@@ -0,0 +1,51 @@
+"""
+Compare rows of harvest list rendered per second by Django template engine and Jinja2.
+
+Usage: python -m benchmarks.template_engines [--rows N ...] [--repeat N]
+
+harvest_list.html of each engine (templates/ and harvest/jinja2/) is rendered with a page of
+given number of rows, through engines configured in settings, with fragment caching disabled
+and data fetched before timing. index.html is rendered too, it has a fixed number of rows.
+Needs Jinja2 installed.
+"""
+import argparse
+
+from benchmarks.common import seed, setup_django, teardown_django
+from benchmarks.template_render import contexts, measure
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10, 100, 1000, 5000])
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    setup_django()
+    try:
+        from django.contrib.auth.models import User
+        from django.template import engines
+        from django.test import override_settings
+
+        if "jinja2" not in engines:
+            parser.error("Jinja2 is not installed, install it with: pip install jinja2")
+        seed(1, max(args.rows))
+        user = User.objects.get()
+
+        caches = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+        with override_settings(CACHES=caches):
+            for n_rows in args.rows:
+                for name, (request, context) in contexts(user, n_rows).items():
+                    for engine in ("django", "jinja2"):
+                        template = engines[engine].get_template(name)
+                        best, median = measure(lambda: template.render(context, request), args.repeat)
+                        rows = n_rows if name.endswith("harvest_list.html") else None
+                        rate = f", {rows / best * 1000:>9,.0f} rows/s" if rows else ""
+                        print(f"{name:>26}, {n_rows:>5} rows, {engine:>6}: "
+                              f"{best:>8.3f} ms best, {median:>8.3f} ms median{rate}")
+    finally:
+        teardown_django()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
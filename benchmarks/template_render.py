@@ -0,0 +1,108 @@
+"""
+Measure render time of harvest_list.html and index.html with and without template and fragment caching.
+
+Usage: python -m benchmarks.template_render [--rows N ...] [--repeat N]
+
+Templates are rendered with the project's template settings and a request of a user owning
+given number of harvests, listed all on one page. Data is fetched before timing, so only
+rendering is measured, in three configurations:
+
+  uncached       templates are loaded and parsed on every render (HARVEST_TEMPLATE_CACHE=0)
+  cached-loader  parsed templates are reused, fragments are rendered every time
+  fragments      parsed templates are reused and {% cache %} fragments are served from warm cache
+
+Dashboard shows 5 recent harvests and a summary per fruit whatever number of rows, so only
+the list grows with it. Reported are best and median milliseconds per render.
+"""
+import argparse
+import datetime
+import statistics
+import time
+from typing import Callable
+
+from benchmarks.common import seed, setup_django, teardown_django
+
+TEMPLATES = ("harvest/harvest_list.html", "harvest/index.html")
+
+
+def measure(render: Callable[[], str], repeat: int) -> tuple[float, float]:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        render()
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1000, statistics.median(timings) * 1000
+
+
+def template_backend(cached_loader: bool):
+    """Template backend of project settings, with or without cached loader"""
+    from django.conf import settings
+    from django.template.backends.django import DjangoTemplates
+
+    config = settings.TEMPLATES[0]
+    loaders = ["django.template.loaders.filesystem.Loader", "django.template.loaders.app_directories.Loader"]
+    if cached_loader:
+        loaders = [("django.template.loaders.cached.Loader", loaders)]
+    return DjangoTemplates({"NAME": "benchmark", "DIRS": config["DIRS"], "APP_DIRS": False,
+                            "OPTIONS": {**config["OPTIONS"], "loaders": loaders}})
+
+
+def contexts(user, n_rows: int) -> dict:
+    """Request and context of rendered templates, like the views build them"""
+    from django.test import RequestFactory
+
+    from harvest.models import Harvest
+    from harvest.pagination import keyset_paginate
+    from harvest.views import LIST_FIELDS, PAGE_LIMITS, dashboard_data, fragment_context
+
+    request = RequestFactory().get("/")
+    request.user = user
+    page_obj = keyset_paginate(Harvest.objects.filter(owner=user), cursor=None, limit=n_rows)
+    season = Harvest.objects.filter(owner=user).latest("date").date.year
+    return {
+        "harvest/harvest_list.html": (request, {
+            "fields": LIST_FIELDS, "page_limits": PAGE_LIMITS, "limit": n_rows, "fruit": "all", "user": user,
+            "harvests_n": n_rows, "cursor_mode": True, "page_obj": page_obj, "page_key": "cursor None",
+            "harvests": page_obj.object_list, **fragment_context(request)}),
+        "harvest/index.html": (request, {
+            "date": datetime.date.today(), "chosen_season": season, **fragment_context(request),
+            **dashboard_data(user, season)}),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10, 1000])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    setup_django()
+    try:
+        from django.contrib.auth.models import User
+        from django.test import override_settings
+
+        seed(len(args.rows), max(args.rows))
+        users = User.objects.order_by("pk")
+        dummy = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+        local = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+        configurations = (("uncached", False, dummy), ("cached-loader", True, dummy), ("fragments", True, local))
+
+        for user, n_rows in zip(users, args.rows):
+            for mode, cached_loader, caches in configurations:
+                backend = template_backend(cached_loader)
+                with override_settings(CACHES=caches):
+                    for name, (request, context) in contexts(user, n_rows).items():
+                        def render():
+                            return backend.get_template(name).render(context, request)
+                        # fills loader and fragment caches
+                        render()
+                        best, median = measure(render, args.repeat)
+                        print(f"{name:>26}, {n_rows:>5} rows, {mode:>13}: "
+                              f"{best:>7.3f} ms best, {median:>7.3f} ms median")
+    finally:
+        teardown_django()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
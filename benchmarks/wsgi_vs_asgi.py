@@ -0,0 +1,156 @@
+"""
+Compare throughput and latency of read-only pages served through WSGI and ASGI handlers.
+
+Usage: python -m benchmarks.wsgi_vs_asgi [--users N] [--harvests N] [--requests N] [--concurrency N ...] [--cache]
+
+Requests go through Django's in-process test handlers, with all middleware, to a seeded
+database in a temporary file. Each mode is measured at every given concurrency:
+
+  wsgi         sync views, concurrent requests handled by a pool of threads, like a threaded WSGI server
+  asgi-sync    sync views under ASGI, each view runs in a thread hop from the event loop
+  asgi-async   async views (HARVEST_ASYNC_VIEWS), queries made with the async ORM
+
+Page caching is disabled unless --cache is given, so that every request reaches the database.
+Reported are requests per second and p50 / p99 latency in milliseconds.
+"""
+import argparse
+import asyncio
+import importlib
+import os
+import queue
+import random
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import seed, setup_django, teardown_django
+
+PAGES = [
+    ("harvest:home", {"season": 2000}),
+    ("harvest:harvest-list", {}),
+    ("harvest:harvest-list", {"page": 3}),
+    ("harvest:harvest-list", {"fruit": "apple", "harvests-per-page": 10}),
+]
+
+
+def use_async_views(enabled: bool) -> None:
+    """Route read-only pages to async or sync views, as Harvest/asgi.py does with HARVEST_ASYNC_VIEWS"""
+    from django.conf import settings
+    from django.urls import clear_url_caches
+
+    settings.HARVEST_ASYNC_VIEWS = enabled
+    importlib.reload(importlib.import_module("harvest.urls"))
+    importlib.reload(importlib.import_module(settings.ROOT_URLCONF))
+    clear_url_caches()
+
+
+def requests_plan(n_requests: int) -> list[tuple[str, dict]]:
+    from django.urls import reverse
+
+    rnd = random.Random(7)
+    return [(reverse(name), params) for name, params in (rnd.choice(PAGES) for _ in range(n_requests))]
+
+
+def percentile(latencies: list[float], p: float) -> float:
+    return statistics.quantiles(latencies, n=100, method="inclusive")[int(p) - 1] * 1000
+
+
+def logged_in_clients(client_class, users, n: int) -> list:
+    """Clients logged in upfront, as logging in writes to database which would lock it during measurement"""
+    clients = []
+    for _ in range(n):
+        client = client_class()
+        client.force_login(random.choice(users))
+        clients.append(client)
+    return clients
+
+
+def run_wsgi(users, plan: list, concurrency: int) -> tuple[float, list[float]]:
+    from django.test import Client
+
+    clients = queue.SimpleQueue()
+    for client in logged_in_clients(Client, users, concurrency):
+        clients.put(client)
+    local = threading.local()
+
+    def request(item) -> float:
+        if not hasattr(local, "client"):
+            local.client = clients.get()
+        started = time.perf_counter()
+        response = local.client.get(*item)
+        assert response.status_code == 200, response.status_code
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(request, plan))
+    return time.perf_counter() - started, latencies
+
+
+def run_asgi(users, plan: list, concurrency: int) -> tuple[float, list[float]]:
+    from django.test import AsyncClient
+
+    clients = logged_in_clients(AsyncClient, users, concurrency)
+
+    async def worker(client, items) -> list[float]:
+        latencies = []
+        for item in items:
+            started = time.perf_counter()
+            response = await client.get(*item)
+            assert response.status_code == 200, response.status_code
+            latencies.append(time.perf_counter() - started)
+        return latencies
+
+    async def run() -> list[float]:
+        results = await asyncio.gather(*(worker(client, plan[i::concurrency]) for i, client in enumerate(clients)))
+        return [latency for latencies in results for latency in latencies]
+
+    started = time.perf_counter()
+    latencies = asyncio.run(run())
+    return time.perf_counter() - started, latencies
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--harvests", type=int, default=500, help="Number of harvests of each user")
+    parser.add_argument("--requests", type=int, default=2000, help="Number of requests in each run")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--cache", action="store_true", help="Keep page cache enabled")
+    args = parser.parse_args()
+
+    db_dir = tempfile.TemporaryDirectory()
+    # threads of WSGI mode need a database shared by their connections
+    setup_django(os.path.join(db_dir.name, "bench.sqlite3"))
+    try:
+        from django.contrib.auth.models import User
+        from django.test import override_settings
+        from django.test.utils import setup_test_environment
+
+        # lets test clients through ALLOWED_HOSTS
+        setup_test_environment()
+        seed(args.users, args.harvests)
+        users = list(User.objects.all())
+        plan = requests_plan(args.requests)
+        print(f"{args.users} users with {args.harvests} harvests each, {args.requests} requests per run")
+
+        caches = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+        with override_settings(**({} if args.cache else {"CACHES": caches})):
+            for mode, runner, async_views in (("wsgi", run_wsgi, False),
+                                              ("asgi-sync", run_asgi, False),
+                                              ("asgi-async", run_asgi, True)):
+                use_async_views(async_views)
+                for concurrency in args.concurrency:
+                    elapsed, latencies = runner(users, plan, concurrency)
+                    print(f"{mode:>10}, concurrency {concurrency:>4}: {len(latencies) / elapsed:>8.1f} req/s, "
+                          f"p50 {percentile(latencies, 50):>7.1f} ms, p99 {percentile(latencies, 99):>7.1f} ms")
+    finally:
+        teardown_django()
+        db_dir.cleanup()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,117 @@
+"""
+Weekly and monthly series of harvests per fruit across seasons, with year-over-year comparison.
+
+Series of each season are cached separately (cache.cached_for_seasons), so past seasons
+are computed once and only seasons whose harvests changed are queried again.
+"""
+import datetime
+import decimal
+from functools import partial, reduce
+from operator import or_
+from typing import Optional
+
+from django.contrib.auth.models import User
+from django.db.models import Avg, Q
+from django.db.models.functions import ExtractYear, TruncMonth, TruncWeek
+
+from .cache import cached_for_seasons
+from .models import Harvest
+
+BUCKETS = {
+    "week": TruncWeek,
+    "month": TruncMonth,
+}
+
+CENTS = decimal.Decimal("0.01")
+
+# measures compared between seasons
+MEASURES = ("total_amount", "total_value", "avg_price")
+
+
+def season_series(owner: User, years: list[int], bucket: str = "month",
+                  fruit: Optional[str] = None) -> dict[int, list]:
+    """
+    Totals of owner's harvests per bucket (week or month) and fruit in given seasons, with one grouped query.
+
+    :return: dict like {year: [{"period": date, "fruit": str, "n_harvests": int, "total_amount": int,
+        "total_value": Decimal, "avg_price": Decimal}, ...]}, rows ordered by period and fruit
+    """
+    if not years:
+        return {}
+    # date ranges instead of __year lookup, so that rows are found with (owner, date) index
+    seasons = reduce(or_, (Q(date__gte=datetime.date(year, 1, 1), date__lt=datetime.date(year + 1, 1, 1))
+                           for year in years))
+    harvests = Harvest.objects.filter(seasons, owner=owner)
+    if fruit:
+        harvests = harvests.filter(fruit=fruit)
+
+    rows = harvests.annotate(year=ExtractYear("date"), period=BUCKETS[bucket]("date"))\
+        .values("year", "period", "fruit")\
+        .totals()\
+        .annotate(avg_price=Avg("price"))\
+        .order_by("year", "period", "fruit")
+
+    series = {year: [] for year in years}
+    for row in rows:
+        # SQLite returns sums and averages of decimals without fixed precision
+        row["total_value"] = row["total_value"].quantize(CENTS)
+        row["avg_price"] = row["avg_price"].quantize(CENTS)
+        series[row.pop("year")].append(row)
+    return series
+
+
+def cached_season_series(owner: User, years: list[int], bucket: str = "month",
+                         fruit: Optional[str] = None) -> dict[int, list]:
+    """season_series, with series of seasons already computed taken from cache"""
+    return cached_for_seasons(owner, years, ("analytics", bucket, fruit or "all"),
+                              partial(season_series, owner, bucket=bucket, fruit=fruit))
+
+
+def _slot(period: datetime.date, bucket: str) -> int:
+    """Position of bucket within its season, matched between seasons"""
+    return period.month if bucket == "month" else period.isocalendar()[1]
+
+
+def _change(current, previous) -> Optional[float]:
+    if not previous or current is None:
+        return None
+    return round(float((current - previous) / previous), 4)
+
+
+def year_over_year(series: dict[int, list], years: list[int], bucket: str) -> list[dict]:
+    """
+    Rows of given seasons next to the same bucket (month or ISO week) and fruit of the previous season.
+
+    :param series: result of season_series, containing previous seasons of compared ones
+    :return: list of dicts with year, period, fruit and for every measure its value,
+        value in previous season (None when there was none) and relative change
+    """
+    comparison = []
+    for year in years:
+        previous = {(_slot(row["period"], bucket), row["fruit"]): row for row in series.get(year - 1, [])}
+        for row in series.get(year, []):
+            previous_row = previous.get((_slot(row["period"], bucket), row["fruit"]), {})
+            compared = {"year": year, "period": row["period"], "fruit": row["fruit"]}
+            for measure in MEASURES:
+                compared[measure] = row[measure]
+                compared[f"previous_{measure}"] = previous_row.get(measure)
+                compared[f"{measure}_change"] = _change(row[measure], previous_row.get(measure))
+            comparison.append(compared)
+    return comparison
+
+
+def analytics(owner: User, years: list[int], bucket: str = "month", fruit: Optional[str] = None,
+              compare: bool = False) -> dict:
+    """Series of given seasons, flattened to rows with year, and their year-over-year comparison when asked for"""
+    years = sorted(set(years))
+    queried = sorted(set(years) | {year - 1 for year in years if year > datetime.MINYEAR}) if compare else years
+    series = cached_season_series(owner, queried, bucket, fruit)
+    result = {
+        "bucket": bucket,
+        "fruit": fruit,
+        "years": years,
+        "series": [{"year": year, **row} for year in years for row in series[year]],
+    }
+    if compare:
+        result["year_over_year"] = year_over_year(series, years, bucket)
+    return result
@@ -0,0 +1,425 @@
+"""
+JSON API for harvests of authenticated user.
+
+  GET     api/harvests/              list, filtered with ?fruit=, ?year=, ?date_from=, ?date_to=,
+                                     paginated with ?cursor= and ?limit=, sparse with ?fields=date,amount
+  POST    api/harvests/              create harvest
+  GET     api/harvests/<id>/         single harvest, ?fields= applies too
+  PATCH   api/harvests/<id>/         change some fields of harvest
+  DELETE  api/harvests/<id>/         delete harvest
+  POST    api/harvests/bulk/         create list of harvests
+  PATCH   api/harvests/bulk/         change list of harvests, each given with its id
+  DELETE  api/harvests/bulk/         delete harvests with ids given as {"ids": [...]}
+  GET     api/analytics/             weekly or monthly series per fruit, see harvest_analytics
+
+Clients authenticate with session (unsafe methods need CSRF token then) or HTTP Basic auth.
+Requests are rate limited per user and failed Basic auth attempts per client address, see
+HARVEST_API_RATE_LIMIT and HARVEST_API_AUTH_RATE_LIMIT settings. Rows are serialized
+straight from values() dicts, without model instances.
+"""
+import base64
+import binascii
+import datetime
+import json
+import time
+from functools import partial, wraps
+from typing import Optional
+
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.db import IntegrityError, transaction
+from django.db.models import QuerySet
+from django.http import HttpRequest, HttpResponse, JsonResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from django.views.decorators.csrf import csrf_exempt
+
+from .analytics import BUCKETS, analytics
+from .cache import cached_for_user, get_cache
+from .forms import HarvestForm, HarvestFormSet
+from .models import MAX_HARVEST_ID, Harvest, HarvestSeasonRollup
+from .pagination import keyset_paginate
+from .routers import replica_reads, wrote_recently
+from .views import save_harvest
+
+FIELDS = ("id", "date", "fruit", "amount", "price")
+WRITABLE_FIELDS = ("date", "fruit", "amount", "price")
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+# years accepted in filters, seasons are selected by date range ending with the next year
+MIN_YEAR, MAX_YEAR = datetime.MINYEAR, datetime.MAXYEAR - 1
+
+# most harvests in one bulk request, the same as in batch form
+MAX_BULK = HarvestFormSet.max_num
+
+
+class ApiError(Exception):
+    """Error reported to client as JSON body with given status"""
+
+    def __init__(self, status: int, errors, headers: Optional[dict] = None):
+        super().__init__(errors)
+        self.status = status
+        self.errors = errors
+        self.headers = headers or {}
+
+
+def _basic_auth_user(request: HttpRequest):
+    """User from Authorization: Basic header, None when header isn't there"""
+    header = request.headers.get("Authorization", "")
+    scheme, _, credentials = header.partition(" ")
+    if scheme.lower() != "basic":
+        return None
+    # failed attempts are limited per client address, so passwords can't be guessed at the rate of requests
+    n_failures, seconds = getattr(settings, "HARVEST_API_AUTH_RATE_LIMIT", (10, 60))
+    key, window = _window_key(f"auth:{request.META.get('REMOTE_ADDR')}", seconds)
+    if get_cache().get(key, 0) >= n_failures:
+        raise ApiError(429, "Too many failed authentication attempts", {"Retry-After": _retry_after(window, seconds)})
+    try:
+        username, _, password = base64.b64decode(credentials).decode().partition(":")
+    except (binascii.Error, UnicodeDecodeError):
+        username, password = None, None
+    user = authenticate(request, username=username, password=password) if username else None
+    if user is None:
+        _count(key, seconds)
+        raise ApiError(401, "Invalid username or password", {"WWW-Authenticate": 'Basic realm="harvest"'})
+    return user
+
+
+def _window_key(scope: str, seconds: int) -> tuple[str, int]:
+    """Cache key of counter of scope in current window of given seconds, and number of the window"""
+    window = int(time.time() // seconds)
+    return f"harvest:api:rate:{scope}:{window}", window
+
+
+def _retry_after(window: int, seconds: int) -> str:
+    return str(int((window + 1) * seconds - time.time()) + 1)
+
+
+def _count(key: str, seconds: int) -> int:
+    """Increment window counter, which expires together with the window, and return its value"""
+    cache = get_cache()
+    cache.add(key, 0, timeout=seconds)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        return 1
+
+
+def _check_rate_limit(user) -> dict:
+    """
+    Count request of user in current window of HARVEST_API_RATE_LIMIT (requests, seconds).
+
+    :return: rate limit headers for response
+    :raises ApiError: 429 when user is over the limit
+    """
+    n_requests, seconds = getattr(settings, "HARVEST_API_RATE_LIMIT", (600, 60))
+    key, window = _window_key(f"user:{user.pk}", seconds)
+    used = _count(key, seconds)
+    headers = {"X-RateLimit-Limit": str(n_requests), "X-RateLimit-Remaining": str(max(n_requests - used, 0))}
+    if used > n_requests:
+        raise ApiError(429, "Request limit exceeded", {**headers, "Retry-After": _retry_after(window, seconds)})
+    return headers
+
+
+def api_view(methods: tuple[str, ...]):
+    """
+    Turn view returning (status, data) into JSON API endpoint accepting given methods.
+
+    Authenticates request, enforces CSRF for session authenticated unsafe requests, counts request
+    against user's rate limit, parses JSON body into request.json and reports ApiError as JSON.
+    """
+    def decorator(view):
+        @csrf_exempt
+        @wraps(view)
+        def wrapper(request: HttpRequest, *args, **kwargs):
+            headers = {}
+            try:
+                if request.method not in methods:
+                    raise ApiError(405, f"Method {request.method} not allowed", {"Allow": ", ".join(methods)})
+                user = _basic_auth_user(request)
+                if user is not None:
+                    request.user = user
+                elif not request.user.is_authenticated:
+                    raise ApiError(401, "Authentication credentials were not provided")
+                elif request.method not in ("GET", "HEAD", "OPTIONS") and \
+                        CsrfViewMiddleware(lambda r: None).process_view(request, None, (), {}) is not None:
+                    raise ApiError(403, "CSRF check failed")
+                headers = _check_rate_limit(request.user)
+
+                request.json = None
+                if request.body:
+                    try:
+                        request.json = json.loads(request.body)
+                    except ValueError:
+                        raise ApiError(400, "Request body is not valid JSON")
+                status, data = view(request, *args, **kwargs)
+            except ApiError as e:
+                headers.update(e.headers)
+                status, data = e.status, {"errors": e.errors}
+
+            response = HttpResponse(status=status) if data is None else JsonResponse(data, status=status, safe=False)
+            for name, value in headers.items():
+                response.headers[name] = value
+            return response
+        return wrapper
+    return decorator
+
+
+def _fields(request: HttpRequest) -> list[str]:
+    """Fields selected with ?fields=, all by default"""
+    raw = request.GET.get("fields")
+    if not raw:
+        return list(FIELDS)
+    fields = [f.strip() for f in raw.split(",") if f.strip()]
+    unknown = [f for f in fields if f not in FIELDS]
+    if unknown or not fields:
+        raise ApiError(400, f"Unknown fields: {', '.join(unknown)}, choose from {', '.join(FIELDS)}")
+    return fields
+
+
+def _filtered(request: HttpRequest) -> QuerySet:
+    """Harvests of user filtered with ?fruit=, ?year=, ?date_from= and ?date_to="""
+    harvests = Harvest.objects.filter(owner=request.user)
+    fruit = request.GET.get("fruit")
+    if fruit:
+        if fruit not in dict(Harvest.FRUITS):
+            raise ApiError(400, f"Unknown fruit {fruit}")
+        harvests = harvests.filter(fruit=fruit)
+    if request.GET.get("year"):
+        harvests = harvests.filter(date__year=_year(request.GET["year"]))
+    try:
+        if request.GET.get("date_from"):
+            harvests = harvests.filter(date__gte=datetime.date.fromisoformat(request.GET["date_from"]))
+        if request.GET.get("date_to"):
+            harvests = harvests.filter(date__lte=datetime.date.fromisoformat(request.GET["date_to"]))
+    except ValueError:
+        raise ApiError(400, "Dates have to be in YYYY-MM-DD format")
+    return harvests
+
+
+def _year(raw: str) -> int:
+    """Year of filter, one with a next year, as seasons are selected by date range"""
+    try:
+        year = int(raw)
+    except ValueError:
+        raise ApiError(400, "Year has to be a number")
+    if not MIN_YEAR <= year <= MAX_YEAR:
+        raise ApiError(400, f"Years have to be between {MIN_YEAR} and {MAX_YEAR}")
+    return year
+
+
+def _years(raw: str) -> list[int]:
+    """Years of comma separated list"""
+    return [_year(year) for year in raw.split(",")]
+
+
+def _limit(request: HttpRequest) -> int:
+    try:
+        limit = int(request.GET.get("limit", DEFAULT_LIMIT))
+    except ValueError:
+        raise ApiError(400, "Limit has to be a number")
+    return min(max(limit, 1), MAX_LIMIT)
+
+
+def list_page(harvests: QuerySet, fields: list[str], cursor: Optional[str], limit: int) -> dict:
+    """Page of harvest rows with given fields and cursors of neighbouring pages, in picklable form for caching"""
+    # date and id locate rows for cursors, they are dropped from output when not asked for
+    extra = [f for f in ("id", "date") if f not in fields]
+    page = keyset_paginate(harvests.values(*fields, *extra), cursor=cursor, limit=limit)
+    next_cursor, previous_cursor = page.next_cursor, page.previous_cursor
+    rows = page.object_list
+    if extra:
+        for row in rows:
+            for f in extra:
+                del row[f]
+    return {"results": rows, "next": next_cursor, "previous": previous_cursor}
+
+
+def _page_link(request: HttpRequest, cursor: Optional[str]) -> Optional[str]:
+    if cursor is None:
+        return None
+    params = request.GET.copy()
+    params["cursor"] = cursor
+    return request.build_absolute_uri(f"{request.path}?{params.urlencode()}")
+
+
+def _harvest_data(harvest: Harvest, fields=FIELDS) -> dict:
+    return {f: getattr(harvest, f) for f in fields}
+
+
+def _form_errors(form) -> dict:
+    return {field: list(messages) for field, messages in form.errors.items()}
+
+
+def _form_data(item, harvest: Optional[Harvest] = None) -> dict:
+    """Data of HarvestForm from JSON object, missing fields are taken from harvest being changed"""
+    if not isinstance(item, dict):
+        raise ApiError(400, "Harvest has to be a JSON object")
+    data = _harvest_data(harvest, WRITABLE_FIELDS) if harvest else {}
+    data.update({f: item[f] for f in WRITABLE_FIELDS if f in item})
+    return data
+
+
+def _items(request: HttpRequest) -> list:
+    items = request.json
+    if not isinstance(items, list) or not items:
+        raise ApiError(400, "Request body has to be a non-empty JSON array")
+    if len(items) > MAX_BULK:
+        raise ApiError(400, f"At most {MAX_BULK} harvests can be sent at once")
+    return items
+
+
+@api_view(("GET", "POST"))
+def harvests(request: HttpRequest):
+    """List harvests of user or create a new one"""
+    if request.method == "POST":
+        form = HarvestForm(request.user, None, _form_data(request.json))
+        if not form.is_valid():
+            raise ApiError(400, _form_errors(form))
+        harvest = Harvest(owner=form.owner, **form.cleaned_data)
+        if not save_harvest(form, harvest):
+            raise ApiError(409, _form_errors(form))
+        return 201, _harvest_data(harvest)
+
+    fields, limit, cursor = _fields(request), _limit(request), request.GET.get("cursor")
+    filtered = _filtered(request)
+    key = ("api", request.GET.urlencode())
+    with replica_reads(pinned=wrote_recently(request)):
+        page = cached_for_user(request.user, key, partial(list_page, filtered, fields, cursor, limit))
+    return 200, {**page, "next": _page_link(request, page["next"]),
+                 "previous": _page_link(request, page["previous"])}
+
+
+@api_view(("GET", "PATCH", "DELETE"))
+def harvest_detail(request: HttpRequest, pk: int):
+    """Get, change or delete single harvest of user"""
+    harvest = Harvest.objects.filter(pk=pk, owner=request.user).first()
+    if harvest is None:
+        raise ApiError(404, "Harvest not found")
+
+    if request.method == "DELETE":
+        harvest.delete()
+        return 204, None
+    if request.method == "PATCH":
+        form = HarvestForm(request.user, pk, data=_form_data(request.json, harvest), instance=harvest)
+        if not form.is_valid():
+            raise ApiError(400, _form_errors(form))
+        if form.changed_data and not save_harvest(form, harvest, update_fields=form.changed_data):
+            raise ApiError(409, _form_errors(form))
+    return 200, _harvest_data(harvest, _fields(request))
+
+
+@api_view(("POST", "PATCH", "DELETE"))
+def harvests_bulk(request: HttpRequest):
+    """Create, change or delete many harvests of user, all or none of them"""
+    if request.method == "DELETE":
+        ids = (request.json or {}).get("ids") if isinstance(request.json, dict) else None
+        # ids are checked to be positive ints in range of id column, exactly, as bool is an int too
+        if not isinstance(ids, list) or not all(type(i) is int and 0 < i <= MAX_HARVEST_ID for i in ids):
+            raise ApiError(400, 'Request body has to be like {"ids": [1, 2]}')
+        if len(ids) > MAX_BULK:
+            raise ApiError(400, f"At most {MAX_BULK} harvests can be deleted at once")
+        deleted = Harvest.objects.filter(owner=request.user, pk__in=ids).bulk_delete()
+        return 200, {"deleted": deleted}
+
+    items = _items(request)
+    if request.method == "POST":
+        return 201, {"results": [_harvest_data(h) for h in bulk_create(request.user, items)]}
+    return 200, {"results": [_harvest_data(h) for h in bulk_update(request.user, items)]}
+
+
+def _check_duplicates(user, forms: list[HarvestForm], errors: list[dict], exclude_ids=()) -> None:
+    """Add errors of harvests repeated in batch or taken by other harvests, checked with one query"""
+    keys = {}
+    for form, error in zip(forms, errors):
+        key = (user.pk, form.instance.date, form.instance.fruit)
+        if key in keys:
+            error["__all__"] = ["Harvest with given fruit and date is repeated"]
+        keys.setdefault(key, error)
+    taken = Harvest.objects.exclude(pk__in=exclude_ids).existing_keys(list(keys))
+    for key in taken:
+        keys[key]["__all__"] = ["Harvest with given fruit and date already exists"]
+
+
+def bulk_create(user, items: list) -> list[Harvest]:
+    """Validate every harvest, insert them with one query and add their totals to rollups"""
+    # each item is validated on its own, batch formset would skip ones equal to its initial values
+    forms = [HarvestForm(user, None, data=_form_data(item), check_duplicates=False) for item in items]
+    errors = [_form_errors(form) if not form.is_valid() else {} for form in forms]
+    if not any(errors):
+        _check_duplicates(user, forms, errors)
+    if any(errors):
+        raise ApiError(400, errors)
+
+    harvests = [Harvest(owner=user, **form.cleaned_data) for form in forms]
+    try:
+        with transaction.atomic():
+            Harvest.objects.bulk_create(harvests)
+            # bulk_create doesn't send signals
+            HarvestSeasonRollup.objects.add_harvests(harvests)
+    except IntegrityError:
+        raise ApiError(409, "Some of harvests were created meanwhile")
+    return harvests
+
+
+def bulk_update(user, items: list) -> list[Harvest]:
+    """Validate changes of harvests, write them with one query and move their totals between rollups"""
+    if not all(isinstance(item, dict) and isinstance(item.get("id"), int) for item in items):
+        raise ApiError(400, "Each harvest has to be a JSON object with id")
+    ids = [item["id"] for item in items]
+    if len(set(ids)) != len(ids):
+        raise ApiError(400, "Harvests can't repeat")
+    found = Harvest.objects.filter(owner=user).in_bulk(ids)
+    missing = [i for i in ids if i not in found]
+    if missing:
+        raise ApiError(404, f"Harvests not found: {', '.join(map(str, missing))}")
+
+    forms = [HarvestForm(user, item["id"], data=_form_data(item, found[item["id"]]), instance=found[item["id"]],
+                         check_duplicates=False)
+             for item in items]
+    errors = [_form_errors(form) if not form.is_valid() else {} for form in forms]
+    if not any(errors):
+        _check_duplicates(user, forms, errors, exclude_ids=ids)
+    if any(errors):
+        raise ApiError(400, errors)
+
+    changed = [form.instance for form in forms if form.changed_data]
+    fields = sorted({f for form in forms for f in form.changed_data})
+    if changed:
+        try:
+            with transaction.atomic():
+                Harvest.objects.bulk_update(changed, fields)
+                # bulk_update doesn't send signals
+                HarvestSeasonRollup.objects.move_harvests(changed)
+        except IntegrityError:
+            raise ApiError(409, "Harvests can't swap their fruit and date")
+    return [form.instance for form in forms]
+
+
+# most seasons in one analytics request
+MAX_SEASONS = 20
+
+
+@api_view(("GET",))
+def harvest_analytics(request: HttpRequest):
+    """
+    Series of amount, value and average price per fruit and ?bucket= (month or week) in chosen ?years=2021,2022,
+    all seasons of user by default, optionally for one ?fruit=. With ?compare=1 every bucket is also compared
+    with the same bucket of the previous season.
+    """
+    bucket = request.GET.get("bucket", "month")
+    if bucket not in BUCKETS:
+        raise ApiError(400, f"Bucket has to be one of {', '.join(BUCKETS)}")
+    fruit = request.GET.get("fruit") or None
+    if fruit and fruit not in dict(Harvest.FRUITS):
+        raise ApiError(400, f"Unknown fruit {fruit}")
+    years = _years(request.GET["years"]) if request.GET.get("years") else None
+
+    with replica_reads(pinned=wrote_recently(request)):
+        if years is None:
+            years = HarvestSeasonRollup.objects.seasons(owner=request.user)[-MAX_SEASONS:]
+        if len(years) > MAX_SEASONS:
+            raise ApiError(400, f"At most {MAX_SEASONS} seasons can be requested at once")
+        result = analytics(request.user, years, bucket, fruit, compare=request.GET.get("compare") == "1")
+    return 200, result
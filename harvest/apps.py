@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class HarvestConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'harvest'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from . import signals  # noqa: F401
+        from .db import apply_sqlite_pragmas
+
+        connection_created.connect(apply_sqlite_pragmas, dispatch_uid="harvest_sqlite_pragmas")
@@ -0,0 +1,172 @@
+"""
+Async versions of read-only views, served instead of sync ones under ASGI (see HARVEST_ASYNC_VIEWS setting).
+
+Queries go through Django's async ORM interface, so requests don't occupy a worker thread
+for the whole view. Login check, conditional GET and cache lookups are done here too,
+as Django's own decorators for them are sync only in this version.
+
+Export stays a sync view streaming its rows, Harvest/handlers.py reads them off the event loop.
+"""
+import datetime
+from functools import partial, wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.contrib.auth.views import redirect_to_login
+from django.core.paginator import Page, Paginator
+from django.http import HttpRequest
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .cache import acached_for_user, adata_state
+from .instrumentation import render
+from .models import Harvest, HarvestSeasonRollup
+from .pagination import akeyset_paginate
+from .routers import choose_replica, reads_from, wrote_recently
+from .views import LIST_FIELDS, PAGE_LIMITS, chosen_season, fragment_context, harvests_etag, \
+    harvests_last_modified, list_params, template_engine
+
+
+async def get_user(request: HttpRequest) -> User:
+    """Resolve lazy request.user, which loads session and user with sync queries, in one thread hop per request"""
+    if not getattr(request, "_user_resolved", False):
+        await sync_to_async(lambda: request.user.is_authenticated)()
+        request._user_resolved = True
+    return request.user
+
+
+def login_required(view):
+    """Async counterpart of django.contrib.auth.decorators.login_required"""
+    @wraps(view)
+    async def wrapper(request: HttpRequest, *args, **kwargs):
+        user = await get_user(request)
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def conditional_harvests_page(view):
+    """Async counterpart of views.conditional_harvests_page"""
+    @wraps(view)
+    async def wrapper(request: HttpRequest, *args, **kwargs):
+        user = await get_user(request)
+        if user.is_authenticated:
+            # read by harvests_etag and harvests_last_modified instead of looking the state up again
+            request._harvest_data_state = await adata_state(user)
+        etag = harvests_etag(request)
+        last_modified = harvests_last_modified(request)
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+
+        response = None
+        if request.method in ("GET", "HEAD"):
+            response = get_conditional_response(request, etag=etag and quote_etag(etag), last_modified=timestamp)
+        if response is None:
+            response = await view(request, *args, **kwargs)
+
+        if etag and not response.has_header("ETag"):
+            response.headers["ETag"] = quote_etag(etag)
+        if timestamp and not response.has_header("Last-Modified"):
+            response.headers["Last-Modified"] = http_date(timestamp)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+    return wrapper
+
+
+def reads_from_replica(view):
+    """Async counterpart of views.reads_from_replica"""
+    @wraps(view)
+    async def wrapper(request: HttpRequest, *args, **kwargs):
+        # pin is read from cookie, only choosing a replica may connect to it
+        alias = None if wrote_recently(request) else await sync_to_async(choose_replica)()
+        with reads_from(alias):
+            return await view(request, *args, **kwargs)
+    return wrapper
+
+
+async def _alist(queryset) -> list:
+    return [obj async for obj in queryset]
+
+
+async def dashboard_data(user: User, season: int) -> dict:
+    """
+    Async version of views.dashboard_data.
+
+    Queries are awaited one after another, running them with asyncio.gather wouldn't overlap them,
+    as async ORM of Django 4.1 runs every query in the same single thread.
+    """
+    seasons = await HarvestSeasonRollup.objects.aseasons(owner=user)
+    recent_harvests = await _alist(Harvest.objects.filter(owner=user).order_by("date").all()[:5])
+    season_summary = await HarvestSeasonRollup.objects.aseason_summary(owner=user, year=season)
+
+    return {"recent_harvests": recent_harvests,
+            "season_summary": season_summary,
+            "seasons": seasons}
+
+
+async def numbered_page(paginator: Paginator, page_number) -> tuple[list, int, int]:
+    """Async version of views.numbered_page"""
+    paginator.count = await paginator.object_list.acount()
+    page = paginator.get_page(page_number)
+    return await _alist(page.object_list), page.number, paginator.count
+
+
+@conditional_harvests_page
+@reads_from_replica
+async def index(request: HttpRequest):
+    """Async version of views.index"""
+    context = {"date": datetime.date.today()}
+
+    user = await get_user(request)
+    if user.is_authenticated:
+        season = chosen_season(request)
+        context['chosen_season'] = season
+        context.update(fragment_context(request))
+        context.update(await acached_for_user(user, ("index", season), partial(dashboard_data, user, season)))
+
+    # rendered in a thread, as {% cache %} fragments are looked up with sync cache API, which queries db backend
+    return await sync_to_async(render)(request,
+                                       template_name="harvest/index.html",
+                                       context=context,
+                                       using=template_engine("index"))
+
+
+@login_required
+@conditional_harvests_page
+@reads_from_replica
+async def harvest_list(request: HttpRequest):
+    """Async version of views.harvest_list"""
+    user = request.user
+    harvests, fruit, limit, page_number = list_params(request)
+    cursor_mode = page_number is None
+
+    if cursor_mode:
+        cursor = request.GET.get(key="cursor")
+        page_obj = await acached_for_user(user, ("list", fruit, "cursor", cursor, limit),
+                                          partial(akeyset_paginate, harvests, cursor=cursor, limit=limit))
+        # total isn't shown in cursor mode, sync view only offers it lazily and a template can't await it
+        harvests_n = None
+    else:
+        paginator = Paginator(harvests, per_page=limit)
+        object_list, number, paginator.count = await acached_for_user(
+            user, ("list", fruit, "page", page_number, limit), partial(numbered_page, paginator, page_number))
+        page_obj = Page(object_list, number, paginator)
+        harvests_n = paginator.count
+
+    context = {
+        "fields": LIST_FIELDS,
+        "page_limits": PAGE_LIMITS,
+        "limit": limit,
+        "fruit": fruit,
+        "user": user,
+        "harvests_n": harvests_n,
+        "cursor_mode": cursor_mode,
+        "page_obj": page_obj,
+        "page_key": f"cursor {cursor}" if cursor_mode else f"page {page_obj.number}",
+        "harvests": page_obj.object_list,
+        **fragment_context(request)
+    }
+    return await sync_to_async(render)(request,
+                                       template_name="harvest/harvest_list.html",
+                                       context=context,
+                                       using=template_engine("harvest_list"))
@@ -0,0 +1,15 @@
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    SQLite backend starting transactions with BEGIN IMMEDIATE.
+
+    Deferred transaction which reads first takes write lock only on its first write, and if another
+    connection has written meanwhile, SQLite fails it with "database is locked" right away instead of
+    waiting busy_timeout. Taking the lock upfront makes concurrent writers queue on busy_timeout instead.
+    Reads outside transactions are unaffected, they don't block and aren't blocked in WAL mode.
+    """
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute("BEGIN IMMEDIATE")
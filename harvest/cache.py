@@ -0,0 +1,222 @@
+import datetime
+import time
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .routers import current_replica
+
+# version of all users' data, bumped when rollups are rebuilt for everyone
+GLOBAL_VERSION_KEY = "harvest:version"
+HITS_KEY = "harvest:stats:hits"
+MISSES_KEY = "harvest:stats:misses"
+
+
+def get_cache():
+    return caches[getattr(settings, "HARVEST_CACHE_ALIAS", "default")]
+
+
+def _version_key(owner_id: int) -> str:
+    return f"harvest:version:{owner_id}"
+
+
+def _new_version() -> int:
+    # version recreated after eviction must not match one used before, so it starts from current time
+    return time.time_ns()
+
+
+def _changed_key(version_key: str) -> str:
+    return f"{version_key}:changed"
+
+
+def _bump(keys: list[str]) -> None:
+    cache = get_cache()
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _new_version(), timeout=None)
+    cache.set_many({_changed_key(key): timezone.now() for key in keys}, timeout=None)
+
+
+def _season_version_key(owner_id: int, year: int) -> str:
+    return f"harvest:version:{owner_id}:season:{year}"
+
+
+def invalidate(owner_ids: Optional[Iterable[int]] = None, using: str = "default",
+               seasons: Iterable[tuple[int, int]] = ()) -> None:
+    """
+    Bump data version of given users (of all users when owner_ids is None), so their cached pages are no longer used.
+
+    Versions are bumped right away and again after the surrounding transaction commits,
+    so that pages read and cached before the commit don't outlive it.
+
+    :param seasons: (owner_id, year) of seasons whose harvests changed, their data cached
+        with cached_for_season is no longer used either
+    """
+    if owner_ids is None:
+        keys = [GLOBAL_VERSION_KEY]
+    else:
+        keys = [_version_key(owner_id) for owner_id in set(owner_ids)]
+    keys += [_season_version_key(owner_id, year) for owner_id, year in set(seasons)]
+    if not keys:
+        return
+    _bump(keys)
+    if connections[using].in_atomic_block:
+        transaction.on_commit(lambda: _bump(keys), using=using)
+
+
+def data_state(user: User) -> tuple[str, Optional[datetime.datetime]]:
+    """
+    Current version of user's harvest data and time of its last known change, read with one cache lookup.
+
+    :return: tuple (version, last changed), last changed is None when no change was recorded since cache was emptied
+    """
+    cache = get_cache()
+    user_key = _version_key(user.pk)
+    state = cache.get_many([GLOBAL_VERSION_KEY, user_key,
+                            _changed_key(GLOBAL_VERSION_KEY), _changed_key(user_key)])
+    if user_key not in state:
+        state[user_key] = cache.get_or_set(user_key, _new_version, timeout=None)
+
+    # join date tells apart accounts which reuse id of a deleted user
+    joined = int(user.date_joined.timestamp() * 1_000_000)
+    version = f"{state.get(GLOBAL_VERSION_KEY, 0)}.{user.pk}.{joined}.{state[user_key]}"
+    changes = [state[k] for k in (_changed_key(GLOBAL_VERSION_KEY), _changed_key(user_key)) if k in state]
+    return version, max(changes, default=None)
+
+
+async def adata_state(user: User) -> tuple[str, Optional[datetime.datetime]]:
+    """Async version of data_state, run in one thread hop as cache backends have no native async API"""
+    return await sync_to_async(data_state)(user)
+
+
+def _count(key: str, n: int = 1) -> None:
+    if not n:
+        return
+    cache = get_cache()
+    try:
+        cache.incr(key, n)
+    except ValueError:
+        cache.add(key, n, timeout=None)
+
+
+def caching_pages() -> bool:
+    """Whether values are cached for users, which is only right with cache shared by all processes writing harvests"""
+    return getattr(settings, "HARVEST_PAGE_CACHE", False)
+
+
+def read_version(version: str) -> str:
+    """
+    Data version qualified by replica reads go to now.
+
+    Values read from a lagging replica are kept apart, so that client reading its own writes from primary
+    isn't served them under the same version.
+    """
+    alias = current_replica()
+    return version if alias is None else f"{version}@{alias}"
+
+
+def _data_key(version: str, parts: tuple) -> str:
+    return ":".join(str(p) for p in ("harvest", version, *parts))
+
+
+def _lookup(user: User, parts: tuple) -> tuple[str, Any]:
+    """Key of value for user and value cached under it, None on miss, counted as hit or miss"""
+    version, _ = data_state(user)
+    key = _data_key(read_version(version), parts)
+    value = get_cache().get(key)
+    _count(MISSES_KEY if value is None else HITS_KEY)
+    return key, value
+
+
+def cached_for_user(user: User, parts: tuple, compute: Callable[[], Any]) -> Any:
+    """
+    Get value for user from cache or compute and store it, under key valid until user's harvests change.
+
+    Value is computed every time when pages aren't cached, see caching_pages.
+
+    :param user: owner of harvests the value is computed from
+    :param parts: rest of the key, like ("index", season)
+    :param compute: function computing the value on cache miss, has to return picklable value
+    """
+    if not caching_pages():
+        return compute()
+    key, value = _lookup(user, parts)
+    if value is None:
+        value = compute()
+        get_cache().set(key, value, timeout=getattr(settings, "HARVEST_CACHE_TIMEOUT", 3600))
+    return value
+
+
+def cached_for_seasons(user: User, years: Iterable[int], parts: tuple,
+                       compute: Callable[[list[int]], dict[int, Any]]) -> dict[int, Any]:
+    """
+    Get values computed from user's harvests of single seasons, from cache or computed together for missing ones.
+
+    Unlike cached_for_user, values stay valid while harvests of other seasons change
+    and values of past seasons are kept without timeout, so they are computed once.
+
+    :param compute: function computing values of given seasons, by year, has to return picklable values
+    :return: values by year
+    """
+    years = sorted(set(years))
+    if not caching_pages():
+        return compute(years) if years else {}
+    cache = get_cache()
+    season_keys = {year: _season_version_key(user.pk, year) for year in years}
+    state = cache.get_many([GLOBAL_VERSION_KEY, *season_keys.values()])
+    for season_key in season_keys.values():
+        if season_key not in state:
+            state[season_key] = cache.get_or_set(season_key, _new_version, timeout=None)
+
+    joined = int(user.date_joined.timestamp() * 1_000_000)
+    keys = {year: _data_key(read_version(f"{state.get(GLOBAL_VERSION_KEY, 0)}.{user.pk}.{joined}.{year}."
+                                         f"{state[season_key]}"), parts)
+            for year, season_key in season_keys.items()}
+    cached = cache.get_many(list(keys.values()))
+    values = {year: cached[key] for year, key in keys.items() if key in cached}
+    missing = [year for year in years if year not in values]
+    _count(HITS_KEY, len(values))
+    _count(MISSES_KEY, len(missing))
+
+    if missing:
+        computed = compute(missing)
+        current_year = datetime.date.today().year
+        # past seasons stay cached for good, current one expires like pages, as it changes often
+        cache.set_many({keys[year]: computed[year] for year in missing if year < current_year}, timeout=None)
+        cache.set_many({keys[year]: computed[year] for year in missing if year >= current_year},
+                       timeout=getattr(settings, "HARVEST_CACHE_TIMEOUT", 3600))
+        values.update(computed)
+    return values
+
+
+async def acached_for_user(user: User, parts: tuple, compute: Callable[[], Awaitable]) -> Any:
+    """Async version of cached_for_user, compute is a coroutine function"""
+    if not caching_pages():
+        return await compute()
+    key, value = await sync_to_async(_lookup)(user, parts)
+    if value is None:
+        value = await compute()
+        await get_cache().aset(key, value, timeout=getattr(settings, "HARVEST_CACHE_TIMEOUT", 3600))
+    return value
+
+
+def cache_stats() -> dict:
+    """Hit and miss counters of cached pages, shared by processes using the same cache backend"""
+    counters = get_cache().get_many([HITS_KEY, MISSES_KEY])
+    hits, misses = counters.get(HITS_KEY, 0), counters.get(MISSES_KEY, 0)
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": hits / (hits + misses) if hits + misses else 0.0,
+    }
+
+
+def reset_cache_stats() -> None:
+    get_cache().delete_many([HITS_KEY, MISSES_KEY])
@@ -0,0 +1,14 @@
+from django.conf import settings
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs) -> None:
+    """Tune each new SQLite connection with pragmas from SQLITE_PRAGMAS setting, see Harvest/database.py"""
+    if connection.vendor != "sqlite":
+        return
+    read_only = "mode=ro" in str(connection.settings_dict["NAME"])
+    with connection.cursor() as cursor:
+        for name, value in getattr(settings, "SQLITE_PRAGMAS", {}).items():
+            if read_only and name == "journal_mode":
+                # journal mode is stored in the file, replicas opened read-only keep the one set by their writer
+                continue
+            cursor.execute(f"PRAGMA {name} = {value}")
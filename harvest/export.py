@@ -0,0 +1,130 @@
+import csv
+import gzip
+import hashlib
+import os
+from io import StringIO
+from itertools import islice
+from typing import Iterable, Iterator
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import QuerySet
+
+from .models import Harvest
+
+EXPORT_CHUNK_SIZE = 2000
+
+# lookup used to select rows of single partition of export
+PARTITION_LOOKUPS = {
+    "owner": "owner_id",
+    "year": "date__year",
+    "fruit": "fruit",
+}
+
+
+def export_header() -> list[str]:
+    """Names of exported columns, owner is exported by username"""
+    return [f.name for f in Harvest._meta.get_fields()]
+
+
+def iter_row_chunks(harvests: QuerySet, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[list[tuple]]:
+    """
+    Yield lists of at most chunk_size rows, streamed from database with server-side iteration.
+
+    Rows are plain tuples from values_list, owner is exported by username with a join,
+    so memory use and number of queries don't grow with number of exported harvests.
+    """
+    columns = ["owner__username" if field == "owner" else field for field in export_header()]
+    rows = harvests.values_list(*columns).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def csv_pieces(row_chunks: Iterable[list[tuple]]) -> Iterator[str]:
+    """Yield CSV document with header, one piece of text per chunk of rows"""
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(export_header())
+    for rows in row_chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def ndjson_pieces(row_chunks: Iterable[list[tuple]]) -> Iterator[str]:
+    """Yield newline delimited JSON objects, one piece of text per chunk of rows"""
+    header = export_header()
+    encoder = DjangoJSONEncoder()
+    for rows in row_chunks:
+        yield "".join(encoder.encode(dict(zip(header, row))) + "\n" for row in rows)
+
+
+def stream_csv(harvests: QuerySet, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[str]:
+    """Yield CSV document with header, one piece of text per chunk of rows"""
+    return csv_pieces(iter_row_chunks(harvests, chunk_size))
+
+
+def stream_ndjson(harvests: QuerySet, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[str]:
+    """Yield newline delimited JSON objects, one piece of text per chunk of rows"""
+    return ndjson_pieces(iter_row_chunks(harvests, chunk_size))
+
+
+def write_csv(harvests: QuerySet, path: str, chunk_size: int = EXPORT_CHUNK_SIZE, compress: bool = False) -> int:
+    """
+    Write harvests to CSV file, gzipped if compress is set.
+
+    :return: number of exported harvests
+    """
+    opener = gzip.open if compress else open
+    n_rows = 0
+    with opener(path, mode="wt", newline="") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(export_header())
+        for rows in iter_row_chunks(harvests, chunk_size):
+            writer.writerows(rows)
+            n_rows += len(rows)
+    return n_rows
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, mode="rb") as f:
+        for block in iter(lambda: f.read(2 ** 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def partition_keys(harvests: QuerySet, partition_by: str) -> list:
+    """Distinct values of partitioning key among harvests, in ascending order"""
+    if partition_by == "year":
+        return [d.year for d in harvests.dates("date", "year")]
+    field = PARTITION_LOOKUPS[partition_by]
+    return list(harvests.order_by(field).values_list(field, flat=True).distinct())
+
+
+def init_export_worker() -> None:
+    """Prepare worker process, each worker opens its own database connection on first query"""
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+
+def export_partition(filters: dict, path: str, chunk_size: int = EXPORT_CHUNK_SIZE, compress: bool = False) -> dict:
+    """
+    Export harvests matching filters to a file, meant to be run in worker process.
+
+    :param filters: keyword arguments for Harvest.objects.filter selecting single partition
+    :return: manifest entry with file name, number of rows and sha256 checksum of the file
+    """
+    n_rows = write_csv(Harvest.objects.filter(**filters), path, chunk_size, compress)
+    return {
+        "file": os.path.basename(path),
+        "rows": n_rows,
+        "sha256": file_sha256(path),
+    }
@@ -6,8 +6,9 @@ from django.contrib.auth.models import User
 
 from django import forms
 from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from django.db import IntegrityError, transaction
 
-from .models import Harvest
+from .models import EARLIEST_HARVEST_DATE, Harvest, HarvestSeasonRollup
 
 
 class HarvestForm(forms.ModelForm):
@@ -45,10 +46,13 @@ class HarvestForm(forms.ModelForm):
 
         }
 
-    def __init__(self, owner: User, h_id: Optional[int] = None, *args, **kwargs):
+    def __init__(self, owner: User, h_id: Optional[int] = None, *args, check_duplicates: bool = True, **kwargs):
         super().__init__(*args, **kwargs)
         self.owner = owner
         self.h_id = h_id
+        self.check_duplicates = check_duplicates
+        # changes are detected against instance (or initial) values, not against hidden copy of callable default
+        self.fields['date'].show_hidden_initial = False
         self.fields['date'].widget.attrs.update({"class": "harvest-date"})
         self.fields['fruit'].widget.attrs.update({"class": "harvest-fruit"})
         self.fields['amount'].widget.attrs.update({"class": "harvest-amount"})
@@ -68,13 +72,83 @@ class HarvestForm(forms.ModelForm):
         h_id = self.h_id
 
         if h_date:
-            if h_date < date(year=1997, month=1, day=1):
+            if h_date < EARLIEST_HARVEST_DATE:
                 raise forms.ValidationError("Earliest accepted harvest year is 1997")
 
-        if Harvest.objects.filter(date=h_date).filter(owner=h_owner)\
-                .filter(fruit=h_fruit).exclude(id=h_id).first():
+        if self.check_duplicates and self.changes_unique_key() and \
+                Harvest.objects.filter(owner=h_owner, date=h_date, fruit=h_fruit).exclude(id=h_id).exists():
             raise forms.ValidationError("Harvest with given fruit and date already exists")
 
+    def changes_unique_key(self) -> bool:
+        """
+        Whether saving form could collide with another harvest of owner.
+
+        Owner isn't a form field, so ModelForm skips the unique constraint and this is the only duplicate check.
+        """
+        return self.instance.pk is None or "date" in self.changed_data or "fruit" in self.changed_data
+
+
+class BaseHarvestFormSet(forms.BaseFormSet):
+    """Formset of harvests added together, checked for duplicates with one query for the whole batch"""
+
+    def __init__(self, owner: User, *args, **kwargs):
+        self.owner = owner
+        super().__init__(*args, form_kwargs={"owner": owner, "check_duplicates": False}, **kwargs)
+
+    def add_fields(self, form, index):
+        super().add_fields(form, index)
+        # initials matching values submitted by browser for untouched rows, so that those count as unchanged
+        form.fields['date'].initial = date.today
+        form.fields['fruit'].initial = Harvest.FRUITS[0][0]
+
+    def filled_forms(self) -> list[HarvestForm]:
+        return [form for form in self.forms if form.has_changed()]
+
+    def clean(self):
+        if any(self.errors):
+            return
+        if not self.filled_forms():
+            raise forms.ValidationError("Fill in at least one harvest")
+
+        keys = {}
+        for form in self.filled_forms():
+            key = (self.owner.pk, form.cleaned_data["date"], form.cleaned_data["fruit"])
+            if key in keys:
+                form.add_error(None, "Harvest with given fruit and date is repeated in this batch")
+            keys.setdefault(key, form)
+        self.check_existing(keys)
+
+    @staticmethod
+    def check_existing(keys: dict) -> bool:
+        """Add error to forms of (owner_id, date, fruit) keys taken by existing harvests, True if there were any"""
+        taken = Harvest.objects.existing_keys(list(keys))
+        for key in taken:
+            keys[key].add_error(None, "Harvest with given fruit and date already exists")
+        return bool(taken)
+
+    def save(self) -> Optional[list[Harvest]]:
+        """
+        Insert all filled in harvests with single query in one transaction.
+
+        :return: created harvests, None when some of them were created since validation, reported as form errors
+        """
+        forms_by_key = {(self.owner.pk, form.cleaned_data["date"], form.cleaned_data["fruit"]): form
+                        for form in self.filled_forms()}
+        harvests = [Harvest(owner=self.owner, **form.cleaned_data) for form in forms_by_key.values()]
+        try:
+            with transaction.atomic():
+                Harvest.objects.bulk_create(harvests)
+                # bulk_create doesn't send signals
+                HarvestSeasonRollup.objects.add_harvests(harvests)
+        except IntegrityError:
+            if not self.check_existing(forms_by_key):
+                raise
+            return None
+        return harvests
+
+
+HarvestFormSet = forms.formset_factory(HarvestForm, formset=BaseHarvestFormSet, extra=7, max_num=100)
+
 
 class CustomSignupForm(UserCreationForm):
 
@@ -0,0 +1,146 @@
+"""
+Per-request SQL query count, database time, template render time and Python time.
+
+Enabled with HARVEST_INSTRUMENTATION=1, which adds ProfilingMiddleware. Each response then gets
+Server-Timing header and a JSON line is logged to "harvest.instrumentation" logger, at WARNING
+level when view made more queries than its budget (HARVEST_QUERY_BUDGETS setting). Template time
+is that of pages rendered with render() of this module, which views use instead of Django's shortcut.
+
+profile() measures the same for any block of code, e.g. in tests:
+
+    with profile(budget=5) as p:
+        client.get(url)
+    p.queries, p.db_time
+"""
+import json
+import logging
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from django.conf import settings
+from django.db import connections
+from django import shortcuts
+from django.http import HttpRequest, HttpResponse
+
+logger = logging.getLogger(__name__)
+
+# statements of transaction control, not counted as queries
+TRANSACTION_CONTROL = ("BEGIN", "SAVEPOINT", "RELEASE SAVEPOINT", "ROLLBACK TO SAVEPOINT", "COMMIT", "ROLLBACK")
+
+_active: ContextVar[Optional["Profile"]] = ContextVar("harvest_profile", default=None)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class Profile:
+    """Measurements of a profiled block, times are in seconds"""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.total_time = 0.0
+        self.sql: list[str] = []
+
+    @property
+    def python_time(self) -> float:
+        """Time spent outside of database and templates"""
+        return max(self.total_time - self.db_time - self.render_time, 0.0)
+
+    def server_timing(self) -> str:
+        """Value of Server-Timing header"""
+        metrics = [("db", self.db_time, f"{self.queries} queries"), ("render", self.render_time, "Templates"),
+                   ("python", self.python_time, "Python"), ("total", self.total_time, "Total")]
+        return ", ".join(f'{name};dur={seconds * 1000:.1f};desc="{desc}"' for name, seconds, desc in metrics)
+
+    def as_dict(self) -> dict:
+        return {
+            "queries": self.queries,
+            "db_ms": round(self.db_time * 1000, 2),
+            "render_ms": round(self.render_time * 1000, 2),
+            "python_ms": round(self.python_time * 1000, 2),
+            "total_ms": round(self.total_time * 1000, 2),
+        }
+
+    def __call__(self, execute, sql, params, many, context):
+        """Execute wrapper timing every statement"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            if not sql.startswith(TRANSACTION_CONTROL):
+                self.queries += 1
+                self.sql.append(sql)
+
+
+def render(request: HttpRequest, template_name: str, context: Optional[dict] = None, content_type=None,
+           status: Optional[int] = None, using: Optional[str] = None) -> HttpResponse:
+    """
+    django.shortcuts.render, measuring rendering less queries made during it into active profile.
+
+    Used by views instead of the shortcut, so that pages are measured whichever template engine renders them.
+    """
+    current = _active.get()
+    if current is None:
+        return shortcuts.render(request, template_name, context, content_type, status, using)
+    started, db_time = time.perf_counter(), current.db_time
+    try:
+        return shortcuts.render(request, template_name, context, content_type, status, using)
+    finally:
+        current.render_time += time.perf_counter() - started - (current.db_time - db_time)
+
+
+@contextmanager
+def profile(budget: Optional[int] = None) -> Iterator[Profile]:
+    """
+    Measure queries made in this thread through all database connections, and time spent in them and in templates.
+
+    :param budget: raise QueryBudgetExceeded when more queries are made, not checked when None
+    """
+    measured = Profile()
+    token = _active.set(measured)
+    started = time.perf_counter()
+    try:
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(measured))
+            yield measured
+    finally:
+        measured.total_time = time.perf_counter() - started
+        _active.reset(token)
+    if budget is not None and measured.queries > budget:
+        raise QueryBudgetExceeded(f"{measured.queries} queries made, budget is {budget}:\n" + "\n".join(measured.sql))
+
+
+def query_budget(view_name: Optional[str]) -> Optional[int]:
+    """Budget of view with given url name (like "harvest:harvest-list"), default one when it has none"""
+    budgets = getattr(settings, "HARVEST_QUERY_BUDGETS", {})
+    return budgets.get(view_name, budgets.get("default"))
+
+
+class ProfilingMiddleware:
+    """Report profile of each request in Server-Timing header and log line"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest):
+        with profile() as measured:
+            response = self.get_response(request)
+
+        match = request.resolver_match
+        view_name = match.view_name if match else None
+        budget = query_budget(view_name)
+        over_budget = budget is not None and measured.queries > budget
+        response.headers["Server-Timing"] = measured.server_timing()
+
+        record = {"view": view_name, "method": request.method, "path": request.path,
+                  "status": response.status_code, **measured.as_dict(),
+                  "query_budget": budget, "over_budget": over_budget}
+        logger.log(logging.WARNING if over_budget else logging.INFO, json.dumps(record), extra={"profile": record})
+        return response
@@ -0,0 +1,63 @@
+"""
+Jinja2 environment of templates in harvest/jinja2/, rendering pages the same as their Django counterparts.
+
+Values are localized like Django templates do it, and Django's {% url %}, {% static %},
+capfirst filter and {% cache %} fragments are offered as globals and filters:
+
+    {% call cache(fragment_timeout, "rows", data_version, using=fragment_cache) %}...{% endcall %}
+"""
+import datetime
+import decimal
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.utils import make_template_fragment_key
+from django.templatetags.static import static
+from django.urls import reverse
+from django.utils.formats import localize
+from django.utils.text import capfirst
+from django.utils.translation import get_language
+from jinja2 import Environment
+from markupsafe import Markup
+
+
+@lru_cache(maxsize=16384)
+def _localized(kind: type, text: str, value, language: str) -> str:
+    # keyed on text too, as equal decimals like 1.0 and 1.00 are shown differently
+    return localize(value)
+
+
+def localize_value(value):
+    """
+    Localize output value like Django templates do, with formatted dates and decimals reused between renders.
+
+    Dates and decimals are most of values of harvest tables and formatting them is the costliest part of rendering.
+    """
+    if isinstance(value, str) or (type(value) is int and not settings.USE_THOUSAND_SEPARATOR):
+        return value
+    if isinstance(value, (datetime.date, decimal.Decimal)) and not isinstance(value, datetime.datetime):
+        return _localized(type(value), str(value), value, get_language())
+    return localize(value)
+
+
+def url(name: str, *args) -> str:
+    return reverse(name, args=args)
+
+
+def cache(timeout: int, fragment_name: str, *vary_on, using: str = "default", caller) -> Markup:
+    """Output of call block, cached under the same kind of key as Django's {% cache %} fragment"""
+    fragment_cache = caches[using]
+    key = make_template_fragment_key(f"jinja2:{fragment_name}", vary_on)
+    value = fragment_cache.get(key)
+    if value is None:
+        value = str(caller())
+        fragment_cache.set(key, value, timeout)
+    return Markup(value)
+
+
+def environment(**options) -> Environment:
+    env = Environment(finalize=localize_value, **options)
+    env.globals.update({"cache": cache, "static": static, "url": url})
+    env.filters["capfirst"] = capfirst
+    return env
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from harvest.cache import cache_stats, invalidate, reset_cache_stats
+
+
+class Command(BaseCommand):
+    """Command showing hit and miss counters of cached dashboard and list pages"""
+    help = """Command showing hit and miss counters of cached dashboard and list pages,
+              counters of locmem cache are per process, so they are only meaningful with file or db cache"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset',
+                            action='store_true',
+                            help="Reset counters after showing them")
+        parser.add_argument('--invalidate',
+                            action='store_true',
+                            help="Invalidate cached pages of all users")
+
+    def handle(self, *args, **options):
+        stats = cache_stats()
+        self.stdout.write(f"Cache hits: {stats['hits']}, misses: {stats['misses']},"
+                          f" hit ratio: {stats['hit_ratio']:.1%}")
+        if options.get('reset'):
+            reset_cache_stats()
+            self.stdout.write("Counters reset")
+        if options.get('invalidate'):
+            invalidate()
+            self.stdout.write("Cached pages invalidated")
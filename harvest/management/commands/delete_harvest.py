@@ -1,16 +1,42 @@
+import datetime
+
 from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
+from harvest.management.utils import read_ids
 from harvest.models import Harvest
 
 
 class Command(BaseCommand):
     """Command deleting harvests with specified ids"""
-    help = "Command deleting harvests with specified id(s)"
+    help = "Command deleting harvests with specified id(s), or in bulk by ids from file, date or fruit"
 
     def add_arguments(self, parser):
-        parser.add_argument('harvest_id', nargs='+', type=int)
+        parser.add_argument('harvest_id', nargs='*', type=int)
+        parser.add_argument('--ids-from-file',
+                            type=str,
+                            help="Delete harvests with ids listed in file, one per line")
+        parser.add_argument('--older-than',
+                            type=datetime.date.fromisoformat,
+                            help="Delete harvests dated before given date (YYYY-MM-DD)")
+        parser.add_argument('--fruit',
+                            type=str,
+                            help="Delete harvests of given fruit")
+        parser.add_argument('--dry-run',
+                            action='store_true',
+                            help="Only report how many harvests would be deleted")
+        parser.add_argument('--batch-size',
+                            type=int,
+                            default=1000,
+                            help="Number of harvests deleted with single query in bulk mode")
 
     def handle(self, *args, **options):
+        bulk = any(options.get(o) for o in ("ids_from_file", "older_than", "fruit"))
+        if bulk:
+            self.bulk_delete(options)
+            return
+        if not options['harvest_id']:
+            raise CommandError("Specify harvest id(s) or one of --ids-from-file, --older-than, --fruit")
 
         for h_id in options['harvest_id']:
             try:
@@ -21,3 +47,30 @@ class Command(BaseCommand):
 
             except Harvest.DoesNotExist:
                 self.stdout.write(f"Harvest with id {h_id} does not exist")
+
+    def bulk_delete(self, options):
+        """Delete all harvests matching given options with a few set-based queries in one transaction"""
+        if options['batch_size'] < 1:
+            raise CommandError("Batch size has to be positive")
+
+        harvests = Harvest.objects.all()
+        if options.get('older_than'):
+            harvests = harvests.filter(date__lt=options['older_than'])
+        if options.get('fruit'):
+            harvests = harvests.filter(fruit=options['fruit'])
+
+        ids = list(options['harvest_id'])
+        if options.get('ids_from_file'):
+            ids += read_ids(options['ids_from_file'])
+        batch_size = options['batch_size']
+        # long id lists are split, so that no query exceeds database limit of parameters
+        selections = [harvests.filter(pk__in=ids[i:i + batch_size]) for i in range(0, len(ids), batch_size)] \
+            if ids else [harvests]
+
+        if options.get('dry_run'):
+            self.stdout.write(f"Would delete {sum(s.count() for s in selections)} harvests")
+            return
+
+        with transaction.atomic():
+            n_deleted = sum(s.bulk_delete(batch_size=batch_size) for s in selections)
+        self.stdout.write(f"Deleted {n_deleted} harvests")
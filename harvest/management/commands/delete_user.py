@@ -1,15 +1,43 @@
+import datetime
+
 from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth.models import User
+from django.db import transaction
+
+from harvest.management.utils import read_ids
+from harvest.models import Harvest
 
 
 class Command(BaseCommand):
     """Command to delete user by id"""
-    help = "Command to delete user by id"
+    help = "Command to delete user by id, or users in bulk by ids from file or date they joined"
 
     def add_arguments(self, parser):
-        parser.add_argument('user_id', nargs='+', type=int)
+        parser.add_argument('user_id', nargs='*', type=int)
+        parser.add_argument('--ids-from-file',
+                            type=str,
+                            help="Delete users with ids listed in file, one per line")
+        parser.add_argument('--older-than',
+                            type=datetime.date.fromisoformat,
+                            help="Delete users who joined before given date (YYYY-MM-DD)")
+        parser.add_argument('--include-staff',
+                            action='store_true',
+                            help="Delete staff members and superusers too in bulk mode, they are kept otherwise")
+        parser.add_argument('--dry-run',
+                            action='store_true',
+                            help="Only report how many users and harvests would be deleted")
+        parser.add_argument('--batch-size',
+                            type=int,
+                            default=1000,
+                            help="Number of users deleted at once in bulk mode")
 
     def handle(self, *args, **options):
+        if options.get('ids_from_file') or options.get('older_than'):
+            self.bulk_delete(options)
+            return
+        if not options['user_id']:
+            raise CommandError("Specify user id(s) or one of --ids-from-file, --older-than")
+
         for u_id in options['user_id']:
             try:
                 self.stdout.write(f"Deleting user with id: {u_id}")
@@ -19,3 +47,45 @@ class Command(BaseCommand):
 
             except User.DoesNotExist:
                 self.stdout.write(f"User with given id does not exist")
+
+    def bulk_delete(self, options):
+        """
+        Delete users matching given options in batches, within one transaction.
+
+        Harvests of every batch are removed with set-based queries first, so the
+        cascade from users doesn't load and signal every harvest one by one.
+        Staff members and superusers are deleted only with --include-staff.
+        """
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError("Batch size has to be positive")
+
+        users = User.objects.all()
+        if not options.get('include_staff'):
+            users = users.filter(is_staff=False, is_superuser=False)
+        if options.get('older_than'):
+            users = users.filter(date_joined__date__lt=options['older_than'])
+
+        ids = list(options['user_id'])
+        if options.get('ids_from_file'):
+            ids += read_ids(options['ids_from_file'])
+        if ids:
+            # long id lists are split, so that no query exceeds database limit of parameters
+            ids = [u_id for i in range(0, len(ids), batch_size)
+                   for u_id in users.filter(pk__in=ids[i:i + batch_size]).values_list("id", flat=True)]
+        else:
+            ids = list(users.values_list("id", flat=True))
+        batches = [ids[i:i + batch_size] for i in range(0, len(ids), batch_size)]
+
+        if options.get('dry_run'):
+            n_harvests = sum(Harvest.objects.filter(owner_id__in=batch).count() for batch in batches)
+            self.stdout.write(f"Would delete {len(ids)} users and {n_harvests} harvests")
+            return
+
+        n_harvests = 0
+        with transaction.atomic():
+            for batch in batches:
+                # season rollups of these users are removed by the cascade below
+                n_harvests += Harvest.objects.filter(owner_id__in=batch).bulk_delete(update_rollups=False)
+                User.objects.filter(pk__in=batch).delete()
+        self.stdout.write(f"Deleted {len(ids)} users and {n_harvests} harvests")
@@ -1,11 +1,17 @@
-import csv
 import datetime
+import json
+import multiprocessing
 import os
+from concurrent.futures import ProcessPoolExecutor
 
 from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth.models import User
+from django.db import connection, connections
 
+from harvest.export import EXPORT_CHUNK_SIZE, PARTITION_LOOKUPS, export_partition, init_export_worker, \
+    partition_keys, write_csv
 from harvest.models import Harvest
+from harvest.routers import replica_reads
 
 
 class Command(BaseCommand):
@@ -35,8 +41,27 @@ class Command(BaseCommand):
                             type=int,
                             help="Filter by year")
 
+        parser.add_argument('--chunk-size',
+                            type=int,
+                            default=EXPORT_CHUNK_SIZE,
+                            help="Number of rows fetched from database and written to file at once")
+
+        parser.add_argument('--partition-by',
+                            choices=sorted(PARTITION_LOOKUPS),
+                            help="Export to directory with one file per owner, year or fruit and a manifest")
+
+        parser.add_argument('--workers',
+                            type=int,
+                            default=1,
+                            help="Number of processes exporting partitions in parallel")
+
+        parser.add_argument('--gzip',
+                            action='store_true',
+                            help="Compress exported files with gzip")
+
+    @replica_reads()
     def handle(self, *args, **options):
-        harvests = Harvest.objects
+        filters = {}
 
         filename_comp = []
 
@@ -49,43 +74,90 @@ class Command(BaseCommand):
 
         try:
             if user_id:
-                try:
-                    user = User.objects.get(pk=user_id)
-                    harvests = harvests.filter(owner=user)
-                    filename_comp.append(str(user_id))
-
-                except User.DoesNotExist:
+                if not User.objects.filter(pk=user_id).exists():
                     raise CommandError(f"User with given id ({user_id}) does not exist")
+                filters["owner_id"] = user_id
+                filename_comp.append(str(user_id))
 
             fruit = options.get('fruit')
             if fruit:
                 filename_comp.append(fruit)
-                harvests = harvests.filter(fruit=fruit)
+                filters["fruit"] = fruit
             year = options.get('year')
 
             if year:
                 filename_comp.append(str(year))
-                harvests = harvests.filter(date__year=year)
-            harvests = harvests.all()
+                filters["date__year"] = year
+
+            chunk_size = options.get('chunk_size') or EXPORT_CHUNK_SIZE
+            if chunk_size < 1:
+                raise CommandError("Chunk size has to be positive")
 
             csv_dir_path = os.path.join(os.getcwd(), "csv_out")
 
             if not os.path.exists(csv_dir_path):
                 os.mkdir(csv_dir_path)
-            filename = f"{'_'.join(filename_comp)}_{datetime.date.today()}.csv"
-            with open(os.path.join(csv_dir_path,
-                      filename),
-                      mode="w+") as csv_file:
-                writer = csv.writer(csv_file)
-                header = [f.name for f in Harvest._meta.get_fields()]
-                writer.writerow(header)
-                for h in harvests:
-                    row = []
-                    for field in header:
-                        row.append(getattr(h, field))
-                    writer.writerow(row)
-
-                self.stdout.write(f"Exported harvests to file {os.path.join(csv_dir_path, filename)}")
+            name = f"{'_'.join(filename_comp)}_{datetime.date.today()}"
+
+            if options.get('partition_by'):
+                self.export_partitioned(filters, os.path.join(csv_dir_path, name), chunk_size, options)
+                return
+
+            filename = f"{name}.csv.gz" if options.get('gzip') else f"{name}.csv"
+            n_rows = write_csv(Harvest.objects.filter(**filters), os.path.join(csv_dir_path, filename),
+                               chunk_size, compress=options.get('gzip'))
+
+            self.stdout.write(f"Exported {n_rows} harvests to file {os.path.join(csv_dir_path, filename)}")
 
         except CommandError as e:
-            self.stdout.write(f"User with given id ({user_id}) does not exist")
+            self.stdout.write(str(e))
+
+    def export_partitioned(self, filters: dict, out_dir: str, chunk_size: int, options: dict) -> None:
+        """
+        Export disjoint partitions of harvests to separate files, in parallel worker processes.
+
+        Every worker opens its own database connection. Manifest with row count and sha256
+        checksum of every file is written to manifest.json in the output directory.
+        """
+        partition_by = options['partition_by']
+        compress = options.get('gzip')
+        workers = options.get('workers') or 1
+        if workers < 1:
+            raise CommandError("Number of workers has to be positive")
+
+        os.makedirs(out_dir, exist_ok=True)
+        extension = "csv.gz" if compress else "csv"
+        lookup = PARTITION_LOOKUPS[partition_by]
+        keys = partition_keys(Harvest.objects.filter(**filters), partition_by)
+        jobs = [({**filters, lookup: key}, os.path.join(out_dir, f"{partition_by}_{key}.{extension}"))
+                for key in keys]
+
+        # in-memory database (e.g. in tests) can't be shared with other processes
+        in_memory = getattr(connection, "is_in_memory_db", lambda: False)()
+        if workers == 1 or in_memory or len(jobs) < 2:
+            entries = [export_partition(job_filters, path, chunk_size, compress) for job_filters, path in jobs]
+        else:
+            # workers must not share connections opened by this process
+            connections.close_all()
+            start_methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("fork" if "fork" in start_methods else None)
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                     initializer=init_export_worker) as executor:
+                futures = [executor.submit(export_partition, job_filters, path, chunk_size, compress)
+                           for job_filters, path in jobs]
+                entries = [future.result() for future in futures]
+
+        for key, entry in zip(keys, entries):
+            entry["key"] = key
+
+        manifest = {
+            "partition_by": partition_by,
+            "filters": filters,
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "rows": sum(entry["rows"] for entry in entries),
+            "files": entries,
+        }
+        with open(os.path.join(out_dir, "manifest.json"), mode="w") as manifest_file:
+            json.dump(manifest, manifest_file, indent=2)
+
+        self.stdout.write(f"Exported {manifest['rows']} harvests to {len(entries)} files in directory {out_dir}")
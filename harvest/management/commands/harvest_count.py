@@ -1,12 +1,14 @@
 from django.core.management.base import BaseCommand, CommandError
 
 from harvest.models import Harvest
+from harvest.routers import replica_reads
 
 
 class Command(BaseCommand):
     """Command showing count of harvests currently in database"""
     help = "Command showing count of harvests currently in database"
 
+    @replica_reads()
     def handle(self, *args, **options):
         all_harvests_count = Harvest.objects.count()
         self.stdout.write(f"Harvests in db: {all_harvests_count}")
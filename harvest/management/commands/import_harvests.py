@@ -0,0 +1,207 @@
+import csv
+import json
+import os
+import time
+from itertools import islice
+from typing import Iterator, Optional
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+
+from harvest.models import EARLIEST_HARVEST_DATE, Harvest, HarvestSeasonRollup
+
+IMPORTED_FIELDS = ("date", "fruit", "amount", "price")
+
+
+def read_rows(path: str, file_format: str) -> Iterator[dict]:
+    """Lazily read rows of CSV file with header or newline delimited JSON file as dicts"""
+    with open(path, newline="") as f:
+        if file_format == "csv":
+            yield from csv.DictReader(f)
+            return
+        for line in f:
+            if line.strip():
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError as e:
+                    row = {"error": f"Invalid JSON: {e.msg}"}
+                yield row if isinstance(row, dict) else {"error": "Row is not a JSON object"}
+
+
+def clean_row(row: dict) -> dict:
+    """
+    Convert and validate imported values the same way as model fields do.
+
+    :return: dict with cleaned date, fruit, amount and price
+    :raises ValidationError: with messages of all invalid fields
+    """
+    cleaned, errors = {}, []
+    for name in IMPORTED_FIELDS:
+        try:
+            cleaned[name] = Harvest._meta.get_field(name).clean(row.get(name), None)
+        except ValidationError as e:
+            errors.append(f"{name}: {' '.join(e.messages)}")
+
+    if "date" in cleaned and cleaned["date"] < EARLIEST_HARVEST_DATE:
+        errors.append("date: Earliest accepted harvest year is 1997")
+    if errors:
+        raise ValidationError(errors)
+    return cleaned
+
+
+class Command(BaseCommand):
+    """Command importing harvests from CSV or NDJSON file in batches"""
+    help = """Command importing harvests from CSV or NDJSON file (format of gen_csv and export view),
+              rows failing validation or duplicating existing harvests are written to reject file"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', type=str)
+        parser.add_argument('--format',
+                            choices=["csv", "ndjson"],
+                            help="Format of imported file, guessed from extension when not given")
+        parser.add_argument('--user-id',
+                            nargs='?',
+                            type=int,
+                            help="Import all harvests for given user instead of owners named in file")
+        parser.add_argument('--update-existing',
+                            action='store_true',
+                            help="Overwrite amount and price of existing harvests instead of rejecting them")
+        parser.add_argument('--batch-size',
+                            type=int,
+                            default=500,
+                            help="Number of rows validated and inserted at once")
+        parser.add_argument('--rejects',
+                            type=str,
+                            help="Path of CSV file for rejected rows, <path>.rejects.csv by default")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f"File {path} does not exist")
+        if options['batch_size'] < 1:
+            raise CommandError("Batch size has to be positive")
+
+        file_format = options.get('format') or \
+            ("ndjson" if os.path.splitext(path)[1].lower() in (".ndjson", ".jsonl", ".json") else "csv")
+
+        owner_id = options.get('user_id')
+        if owner_id and not User.objects.filter(pk=owner_id).exists():
+            raise CommandError(f"User with given id ({owner_id}) does not exist")
+
+        self.update_existing = options.get('update_existing')
+        self.owner_ids_by_name = {}
+        self.rejects_path = options.get('rejects') or f"{path}.rejects.csv"
+        self.rejects_file = None
+        self.rejects_writer = None
+
+        started = time.perf_counter()
+        n_rows = n_created = n_updated = n_rejected = 0
+        affected_owners = set()
+        rows = read_rows(path, file_format)
+        try:
+            while True:
+                batch = list(islice(rows, options['batch_size']))
+                if not batch:
+                    break
+                n_rows += len(batch)
+                created, updated, rejected, owners = self.import_batch(batch, owner_id)
+                n_created += created
+                n_updated += updated
+                n_rejected += rejected
+                affected_owners |= owners
+        finally:
+            if self.rejects_file:
+                self.rejects_file.close()
+            # bulk_create skips signals, so rollups of affected users are recomputed once at the end
+            if affected_owners:
+                HarvestSeasonRollup.objects.rebuild(owner_ids=sorted(affected_owners))
+
+        elapsed = time.perf_counter() - started
+        rate = n_rows / elapsed if elapsed else 0
+        self.stdout.write(f"Processed {n_rows} rows in {elapsed:.2f}s ({rate:.0f} rows/s):"
+                          f" {n_created} created, {n_updated} updated, {n_rejected} rejected")
+        if n_rejected:
+            self.stdout.write(f"Rejected rows written to file {self.rejects_path}")
+
+    def import_batch(self, batch: list[dict], owner_id: Optional[int]) -> tuple[int, int, int, set]:
+        """
+        Validate batch of rows, find duplicates with one query and insert valid rows with one bulk_create.
+
+        :return: tuple (created, updated, rejected, ids of affected owners)
+        """
+        if owner_id is None:
+            self.resolve_owners(batch)
+
+        valid, keys, n_rejected = [], set(), 0
+        for row in batch:
+            try:
+                if row.get("error"):
+                    raise ValidationError(row["error"])
+                cleaned = clean_row(row)
+                cleaned["owner_id"] = owner_id or self.owner_ids_by_name.get(row.get("owner"))
+                if not cleaned["owner_id"]:
+                    raise ValidationError(f"owner: User {row.get('owner')} does not exist")
+            except ValidationError as e:
+                self.reject(row, "; ".join(e.messages))
+                n_rejected += 1
+                continue
+
+            key = (cleaned["owner_id"], cleaned["date"], cleaned["fruit"])
+            if key in keys:
+                self.reject(row, "Duplicate of earlier row in file")
+                n_rejected += 1
+                continue
+            keys.add(key)
+            valid.append((row, key, cleaned))
+
+        with transaction.atomic():
+            existing = Harvest.objects.existing_keys(list(keys))
+            while True:
+                new = [Harvest(**cleaned) for _, key, cleaned in valid if key not in existing]
+                try:
+                    # in a savepoint, so that rows inserted concurrently since the lookup can be looked up again,
+                    # every row of new is then really created
+                    with transaction.atomic():
+                        Harvest.objects.bulk_create(new)
+                    break
+                except IntegrityError:
+                    inserted_meanwhile = Harvest.objects.existing_keys(list(keys)) - existing
+                    if not inserted_meanwhile:
+                        raise
+                    existing |= inserted_meanwhile
+
+            to_update = []
+            for row, key, cleaned in valid:
+                if key not in existing:
+                    continue
+                if self.update_existing:
+                    to_update.append(Harvest(**cleaned))
+                else:
+                    self.reject(row, "Harvest with given fruit and date already exists")
+                    n_rejected += 1
+            if to_update:
+                # column names, as ON CONFLICT target is built from them verbatim
+                Harvest.objects.bulk_create(to_update, update_conflicts=True,
+                                            unique_fields=["date", "owner_id", "fruit"],
+                                            update_fields=["amount", "price"])
+
+        owners = {h.owner_id for h in new} | {h.owner_id for h in to_update}
+        return len(new), len(to_update), n_rejected, owners
+
+    def resolve_owners(self, batch: list[dict]) -> None:
+        """Look up ids of owners named in batch which weren't seen before, with one query"""
+        names = {row.get("owner") for row in batch} - set(self.owner_ids_by_name) - {None}
+        if names:
+            self.owner_ids_by_name.update(User.objects.filter(username__in=names).values_list("username", "id"))
+
+    def reject(self, row: dict, error: str) -> None:
+        """Append row with reason of rejection to reject file, created on first rejected row"""
+        if self.rejects_writer is None:
+            self.rejects_file = open(self.rejects_path, mode="w", newline="")
+            self.rejects_writer = csv.DictWriter(self.rejects_file,
+                                                 fieldnames=["id", *IMPORTED_FIELDS, "owner", "error"],
+                                                 extrasaction="ignore")
+            self.rejects_writer.writeheader()
+        self.rejects_writer.writerow({**row, "error": error})
@@ -1,7 +1,8 @@
 from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth.models import User
 
-from harvest.models import Harvest
+from harvest.models import Harvest, HarvestSeasonRollup
+from harvest.routers import replica_reads
 
 
 class Command(BaseCommand):
@@ -19,6 +20,7 @@ class Command(BaseCommand):
                             type=int,
                             help="Filter by year")
 
+    @replica_reads()
     def handle(self, *args, **options):
         try:
             user = User.objects.get(pk=options['user_id'][0])
@@ -32,8 +34,11 @@ class Command(BaseCommand):
                 harvests = harvests.filter(date__year=year)
             harvests = harvests.all()
 
-            if harvests:
-                self.stdout.write(f"User {harvests[0].owner.username} has {len(harvests)} Harvests"
+            # count comes from materialized rollups, so harvests are scanned only for listing
+            n_harvests = HarvestSeasonRollup.objects.count_harvests(owner=user, fruit=fruit, year=year)
+
+            if n_harvests:
+                self.stdout.write(f"User {user.username} has {n_harvests} Harvests"
                                   f" with specified parameters")
                 for harvest in harvests:
                     self.stdout.write(f"{harvest.pk}. {harvest.date} {harvest.fruit}, Amount harvested: {harvest.amount},"
@@ -1,20 +1,88 @@
+import json
+
 from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth.models import User
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
+
+from harvest.routers import replica_reads
 
-from harvest.models import Harvest
+ORDERINGS = {
+    "id": "id",
+    "username": "username",
+    "joined": "date_joined",
+    "harvests": "n_harvests",
+}
 
 
 class Command(BaseCommand):
     """Command showing list of users containing their id's and number of harvests"""
     help = "List all currently registered users with number of their harvests and date they registered"
 
+    def add_arguments(self, parser):
+        parser.add_argument('--limit',
+                            type=int,
+                            help="Show at most given number of users")
+        parser.add_argument('--offset',
+                            type=int,
+                            default=0,
+                            help="Skip given number of users")
+        parser.add_argument('--order-by',
+                            choices=sorted(ORDERINGS),
+                            default="id",
+                            help="Sort users by given key")
+        parser.add_argument('--desc',
+                            action='store_true',
+                            help="Sort in descending order")
+        parser.add_argument('--format',
+                            choices=["table", "json"],
+                            default="table",
+                            help="Output format")
+        parser.add_argument('--chunk-size',
+                            type=int,
+                            default=2000,
+                            help="Number of users fetched from database at once")
+
+    @replica_reads()
     def handle(self, *args, **options):
-        users = User.objects.all()
-        if users:
-            self.stdout.write(f"Registered users: {len(users)}")
-            for user in users:
-                n_user_harvests = Harvest.objects.filter(owner=user).count()
-                self.stdout.write(f"Id: {user.id}, Username: {user.username},"
-                                  f" Harvests: {n_user_harvests}, Date Joined: {user.date_joined.date()}\n")
+        offset, limit = options.get('offset') or 0, options.get('limit')
+        if offset < 0 or (limit is not None and limit < 0):
+            raise CommandError("Limit and offset can't be negative")
+
+        ordering = ORDERINGS[options['order_by']]
+        if options.get('desc'):
+            ordering = f"-{ordering}"
+
+        # harvest counts are summed from season rollups, all users are read with single query
+        users = User.objects\
+            .annotate(n_harvests=Coalesce(Sum("harvestseasonrollup__n_harvests"), 0))\
+            .order_by(ordering, "id")\
+            .values_list("id", "username", "n_harvests", "date_joined")
+        users = users[offset:offset + limit] if limit is not None else users[offset:]
+        rows = users.iterator(chunk_size=options.get('chunk_size') or 2000)
+
+        if options['format'] == "json":
+            self.write_json(rows)
         else:
+            self.write_table(rows)
+
+    def write_table(self, rows):
+        n_users = User.objects.count()
+        if not n_users:
             self.stdout.write(f"There are no registered users")
+            return
+
+        self.stdout.write(f"Registered users: {n_users}")
+        for user_id, username, n_harvests, date_joined in rows:
+            self.stdout.write(f"Id: {user_id}, Username: {username},"
+                              f" Harvests: {n_harvests}, Date Joined: {date_joined.date()}\n")
+
+    def write_json(self, rows):
+        self.stdout.write("[", ending="")
+        for i, (user_id, username, n_harvests, date_joined) in enumerate(rows):
+            user = {"id": user_id,
+                    "username": username,
+                    "harvests": n_harvests,
+                    "date_joined": date_joined.date().isoformat()}
+            self.stdout.write(("," if i else "") + json.dumps(user), ending="")
+        self.stdout.write("]")
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+
+from harvest.models import HarvestSeasonRollup
+
+
+class Command(BaseCommand):
+    """Command rebuilding materialized season rollups from harvests in database"""
+    help = "Command rebuilding materialized season rollups from harvests, for all users or specified one"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user-id',
+                            nargs='?',
+                            type=int,
+                            help="Rebuild rollups only for given user")
+
+    def handle(self, *args, **options):
+        user = None
+        user_id = options.get('user_id')
+        if user_id:
+            try:
+                user = User.objects.get(pk=user_id)
+            except User.DoesNotExist:
+                raise CommandError(f"User with given id ({user_id}) does not exist")
+
+        n_rollups = HarvestSeasonRollup.objects.rebuild(owner=user)
+        self.stdout.write(f"Rebuilt {n_rollups} season rollups")
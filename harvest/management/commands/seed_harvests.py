@@ -0,0 +1,124 @@
+import datetime
+import decimal
+import random
+import time
+from typing import Iterator
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from harvest.models import EARLIEST_HARVEST_DATE, Harvest, HarvestSeasonRollup
+
+FRUITS = [fruit for fruit, _ in Harvest.FRUITS]
+
+# harvests fall between May and September, unless users need more slots than seasons have
+SEASON_START = (5, 1)
+SEASON_END = (9, 30)
+
+
+def season_days(year: int, whole_year: bool) -> list[datetime.date]:
+    start = datetime.date(year, 1, 1) if whole_year else datetime.date(year, *SEASON_START)
+    end = datetime.date(year, 12, 31) if whole_year else datetime.date(year, *SEASON_END)
+    return [start + datetime.timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+def user_harvests(rnd: random.Random, owner_id: int, n_harvests: int, days: list[datetime.date]) -> Iterator[Harvest]:
+    """
+    Harvests on distinct (date, fruit) slots of given days, ordered by date.
+
+    Slots are sampled without replacement, so no duplicate check is needed.
+    """
+    for slot in sorted(rnd.sample(range(len(days) * len(FRUITS)), n_harvests)):
+        day, fruit = divmod(slot, len(FRUITS))
+        yield Harvest(owner_id=owner_id,
+                      date=days[day],
+                      fruit=FRUITS[fruit],
+                      amount=rnd.randint(10, 5000),
+                      price=decimal.Decimal(rnd.randint(10, 5000)) / 100)
+
+
+class Command(BaseCommand):
+    """Command filling database with synthetic harvests of new users"""
+    help = """Command creating users with synthetic, valid harvests spread over given seasons,
+              same seed always generates the same data"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--harvests',
+                            type=int,
+                            default=10000,
+                            help="Total number of harvests created")
+        parser.add_argument('--users',
+                            type=int,
+                            default=10,
+                            help="Number of users created, harvests are split evenly between them")
+        parser.add_argument('--first-year',
+                            type=int,
+                            default=2010,
+                            help="First season of generated harvests")
+        parser.add_argument('--last-year',
+                            type=int,
+                            default=datetime.date.today().year,
+                            help="Last season of generated harvests")
+        parser.add_argument('--seed',
+                            type=int,
+                            default=0,
+                            help="Seed of random generator")
+        parser.add_argument('--prefix',
+                            type=str,
+                            default="seed",
+                            help="Prefix of names of created users, followed by their number")
+        parser.add_argument('--password',
+                            type=str,
+                            help="Password of created users, they can't log in when not given")
+        parser.add_argument('--batch-size',
+                            type=int,
+                            default=5000,
+                            help="Number of harvests inserted at once")
+
+    def handle(self, *args, **options):
+        n_users, n_harvests = options['users'], options['harvests']
+        first_year, last_year = options['first_year'], options['last_year']
+        if n_users < 1 or n_harvests < 0:
+            raise CommandError("Number of users has to be positive and number of harvests can't be negative")
+        if options['batch_size'] < 1:
+            raise CommandError("Batch size has to be positive")
+        if first_year < EARLIEST_HARVEST_DATE.year or last_year < first_year:
+            raise CommandError(f"Seasons have to be a range of years since {EARLIEST_HARVEST_DATE.year}")
+
+        per_user = [n_harvests // n_users + (i < n_harvests % n_users) for i in range(n_users)]
+        years = range(first_year, last_year + 1)
+        days = [day for year in years for day in season_days(year, whole_year=False)]
+        if per_user[0] > len(days) * len(FRUITS):
+            days = [day for year in years for day in season_days(year, whole_year=True)]
+        if per_user[0] > len(days) * len(FRUITS):
+            raise CommandError(f"Seasons {first_year}-{last_year} have room for at most "
+                               f"{len(days) * len(FRUITS)} harvests per user, add users or seasons")
+
+        usernames = [f"{options['prefix']}{i}" for i in range(n_users)]
+        if User.objects.filter(username__in=usernames).exists():
+            raise CommandError(f"Users named {options['prefix']}<number> already exist, choose other prefix")
+
+        started = time.perf_counter()
+        rnd = random.Random(options['seed'])
+        # hashing is slow, all users share one hash
+        password = make_password(options['password'])
+        with transaction.atomic():
+            User.objects.bulk_create([User(username=name, password=password) for name in usernames])
+            owner_ids = list(User.objects.filter(username__in=usernames).order_by("pk").values_list("pk", flat=True))
+
+            batch = []
+            for owner_id, n_user_harvests in zip(owner_ids, per_user):
+                for harvest in user_harvests(rnd, owner_id, n_user_harvests, days):
+                    batch.append(harvest)
+                    if len(batch) >= options['batch_size']:
+                        Harvest.objects.bulk_create(batch)
+                        batch = []
+            Harvest.objects.bulk_create(batch)
+            # bulk_create skips signals, so rollups of created users are computed once at the end
+            HarvestSeasonRollup.objects.rebuild(owner_ids=owner_ids)
+
+        elapsed = time.perf_counter() - started
+        rate = n_harvests / elapsed if elapsed else 0
+        self.stdout.write(f"Created {n_users} users and {n_harvests} harvests in {elapsed:.2f}s ({rate:.0f} rows/s)")
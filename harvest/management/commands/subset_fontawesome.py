@@ -0,0 +1,114 @@
+import importlib.util
+import os
+import re
+import shutil
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+ICON_CLASS = re.compile(r"\bfa-[a-z0-9-]+")
+# rule of one icon in fontawesome.css, like .fa-download::before { content: "\f019"; }
+ICON_RULE = re.compile(r'^\.(fa-[a-z0-9-]+)::before \{\s*content: "\\([0-9a-f]+)"; \}$')
+COMMENT = re.compile(r"^/\*.*?\*/\s*", re.S)
+FONT = "fa-solid-900.woff2"
+# glyphs are taken from truetype font, which is read without brotli
+FONT_SOURCE = "fa-solid-900.ttf"
+OUTPUT_DIR = Path(__file__).resolve().parents[2] / "static" / "harvest" / "fontawesome"
+
+
+def template_dirs() -> list[Path]:
+    """Directories of project and app templates of all template engines"""
+    from django.apps import apps
+
+    dirs = [Path(d) for engine in settings.TEMPLATES for d in engine.get("DIRS", [])]
+    for app in apps.get_app_configs():
+        if app.name.startswith("harvest"):
+            dirs += [Path(app.path) / "templates", Path(app.path) / "jinja2"]
+    return [d for d in dirs if d.is_dir()]
+
+
+def used_icons(dirs: list[Path]) -> set[str]:
+    icons = set()
+    for directory in dirs:
+        for path in directory.rglob("*.html"):
+            icons.update(ICON_CLASS.findall(path.read_text()))
+    return icons
+
+
+def fontawesome_dir() -> Path:
+    """Static files of fontawesomefree package, which isn't an installed app so its 30000 files aren't collected"""
+    spec = importlib.util.find_spec("fontawesomefree")
+    if spec is None or not spec.submodule_search_locations:
+        raise CommandError("Font Awesome static files not found, install fontawesomefree: pip install -r requirements.txt")
+    return Path(spec.submodule_search_locations[0]) / "static" / "fontawesomefree"
+
+
+def subset_css(css: str, icons: set[str]) -> tuple[str, set[int]]:
+    """
+    Rules of fontawesome.css without ones of icons not in use.
+
+    :return: tuple (css, code points of kept icons)
+    """
+    kept, code_points = [], set()
+    for chunk in css.split("\n\n"):
+        match = ICON_RULE.match(COMMENT.sub("", chunk.strip()))
+        if match:
+            if match.group(1) not in icons:
+                continue
+            code_points.add(int(match.group(2), 16))
+        kept.append(chunk)
+    return "\n\n".join(kept), code_points
+
+
+def subset_font(source: str, target: Path, code_points: set[int]) -> bool:
+    """Write woff2 font with glyphs of given code points only, return False when fontTools or brotli isn't installed"""
+    try:
+        import brotli  # noqa: F401, needed to write woff2
+        from fontTools import subset
+    except ImportError:
+        return False
+    options = subset.Options()
+    options.flavor = "woff2"
+    options.layout_features = ["*"]
+    font = subset.load_font(source, options)
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(unicodes=code_points)
+    subsetter.subset(font)
+    subset.save_font(font, str(target), options)
+    return True
+
+
+class Command(BaseCommand):
+    """Command writing Font Awesome stylesheet and font with only icons used by templates"""
+    help = f"""Command writing Font Awesome CSS and solid font reduced to icons used by templates into
+               {OUTPUT_DIR.relative_to(settings.BASE_DIR)}, fonts are subset only with fontTools and brotli installed"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--icons',
+                            nargs='*',
+                            default=[],
+                            help="Icons kept besides ones found in templates, like fa-trash-can")
+
+    def handle(self, *args, **options):
+        sources = {name: fontawesome_dir() / name
+                   for name in ("css/fontawesome.css", "css/solid.css", f"webfonts/{FONT}", f"webfonts/{FONT_SOURCE}")}
+
+        icons = used_icons(template_dirs()) | set(options['icons'])
+        with open(sources["css/fontawesome.css"]) as f:
+            css, code_points = subset_css(f.read(), icons)
+        with open(sources["css/solid.css"]) as f:
+            # only woff2 font is offered, all browsers supporting CSS variables used by Font Awesome read it
+            solid = re.sub(r'src: url\("\.\./webfonts/fa-solid-900\.woff2"\)[^;]*;',
+                           f'src: url("webfonts/{FONT}") format("woff2");', f.read())
+
+        os.makedirs(OUTPUT_DIR / "webfonts", exist_ok=True)
+        with open(OUTPUT_DIR / "fontawesome.css", mode="w") as f:
+            f.write(css.rstrip() + "\n\n" + solid)
+        font = OUTPUT_DIR / "webfonts" / FONT
+        if not subset_font(sources[f"webfonts/{FONT_SOURCE}"], font, code_points):
+            shutil.copyfile(sources[f"webfonts/{FONT}"], font)
+            self.stderr.write("fontTools or brotli is not installed, font is copied whole: pip install fonttools brotli")
+
+        self.stdout.write(f"Kept {len(code_points)} icons, CSS {len(css) // 1024} KiB, "
+                          f"font {font.stat().st_size} bytes, written to {OUTPUT_DIR}")
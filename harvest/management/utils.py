@@ -0,0 +1,12 @@
+from django.core.management.base import CommandError
+
+
+def read_ids(path: str) -> list[int]:
+    """Read ids from file with one id per line, blank lines and lines starting with # are skipped"""
+    try:
+        with open(path) as ids_file:
+            return [int(line) for line in map(str.strip, ids_file) if line and not line.startswith("#")]
+    except OSError as e:
+        raise CommandError(f"Can't read ids from file {path}: {e.strerror}")
+    except ValueError as e:
+        raise CommandError(f"File {path} contains invalid id: {e}")
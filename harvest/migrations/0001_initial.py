@@ -0,0 +1,38 @@
+# Generated by Django 4.1.3 on 2026-10-18 05:37
+
+from decimal import Decimal
+from django.conf import settings
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Harvest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(default=django.utils.timezone.now, verbose_name='Date of harvest')),
+                ('fruit', models.CharField(choices=[('raspberry', 'Raspberry'), ('strawberry', 'Strawberry'), ('apple', 'Apple'), ('cherry', 'Cherry')], default='"raspberry', max_length=15, verbose_name='Fruit harvested')),
+                ('amount', models.IntegerField(validators=[django.core.validators.MinValueValidator(10), django.core.validators.MaxValueValidator(5000)], verbose_name='Amount harvested')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=4, validators=[django.core.validators.MinValueValidator(Decimal('0.1')), django.core.validators.MaxValueValidator(Decimal('50.0'))], verbose_name='Price per kg')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['date'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='harvest',
+            constraint=models.UniqueConstraint(fields=('date', 'owner', 'fruit'), name='unique_date_and_fruit_for_owner'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.1.3 on 2026-10-18 05:40
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, F, Sum
+from django.db.models.functions import ExtractYear
+
+
+def build_rollups(apps, schema_editor):
+    Harvest = apps.get_model("harvest", "Harvest")
+    HarvestSeasonRollup = apps.get_model("harvest", "HarvestSeasonRollup")
+    db_alias = schema_editor.connection.alias
+
+    rows = Harvest.objects.using(db_alias).order_by()\
+        .annotate(year=ExtractYear("date"))\
+        .values("owner_id", "year", "fruit")\
+        .annotate(n_harvests=Count("id"),
+                  total_amount=Sum("amount"),
+                  total_value=Sum(F("price") * F("amount"),
+                                  output_field=models.DecimalField(max_digits=14, decimal_places=2)))
+    HarvestSeasonRollup.objects.using(db_alias).bulk_create(
+        [HarvestSeasonRollup(**row) for row in rows.iterator()], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('harvest', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HarvestSeasonRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField(verbose_name='Season')),
+                ('fruit', models.CharField(choices=[('raspberry', 'Raspberry'), ('strawberry', 'Strawberry'), ('apple', 'Apple'), ('cherry', 'Cherry')], max_length=15, verbose_name='Fruit harvested')),
+                ('n_harvests', models.PositiveIntegerField(default=0, verbose_name='Number of harvests')),
+                ('total_amount', models.BigIntegerField(default=0, verbose_name='Total amount harvested')),
+                ('total_value', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Total value')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['year', 'fruit'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='harvestseasonrollup',
+            constraint=models.UniqueConstraint(fields=('owner', 'year', 'fruit'), name='unique_rollup_for_owner_season_fruit'),
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.1.3 on 2026-10-18 05:42
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('harvest', '0002_harvestseasonrollup'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='harvest',
+            name='owner',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='harvestseasonrollup',
+            name='owner',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='harvest',
+            index=models.Index(fields=['owner', 'date', 'fruit', 'amount', 'price'], name='harvest_owner_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='harvest',
+            index=models.Index(fields=['owner', 'fruit', 'date'], name='harvest_owner_fruit_date_idx'),
+        ),
+    ]
@@ -1,13 +1,128 @@
+import datetime
 import decimal
+from typing import Optional
 
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models
+from django.db import IntegrityError, models, router, transaction
+from django.db.models import Count, DecimalField, F, Sum
+from django.db.models.functions import ExtractYear
 from django.urls import reverse
 from django.utils import timezone
 
+from .cache import invalidate
+
+
+def summarize_by_fruit(rows) -> dict:
+    """
+    Build season summary used by dashboard from rows grouped by fruit.
+
+    :param rows: iterable of dicts with fruit, n_harvests, total_amount and total_value keys
+    :return: dict like {"n_harvests": int, "fruit_summary": {fruit: [total_amount, total_value]}}
+    """
+    n_harvests = 0
+    fruit_summary = {}
+    for row in rows:
+        n_harvests += row["n_harvests"]
+        fruit_summary[row["fruit"]] = [row["total_amount"], row["total_value"]]
+
+    return {
+        "n_harvests": n_harvests,
+        "fruit_summary": fruit_summary,
+    }
+
+
+# earliest date of harvest accepted from users
+EARLIEST_HARVEST_DATE = datetime.date(year=1997, month=1, day=1)
+
+# largest id of harvest, ids over it don't fit in 64-bit integer columns and fail queries
+MAX_HARVEST_ID = 2 ** 63 - 1
+
 
 # Create your models here.
+class HarvestQuerySet(models.QuerySet):
+    """QuerySet with aggregations computed on the database side"""
+
+    def season_summary(self, owner: User, year: int) -> dict:
+        """
+        Summarize harvests of given owner in a single season with one grouped query.
+
+        :param owner: User owning the harvests
+        :param year: season (calendar year) to summarize
+        :return: dict like {"n_harvests": int, "fruit_summary": {fruit: [total_amount, total_value]}}
+        """
+        rows = self.filter(owner=owner, date__year=year)\
+            .order_by("fruit")\
+            .values("fruit")\
+            .totals()
+
+        return summarize_by_fruit(rows)
+
+    def bulk_delete(self, batch_size: int = 1000, update_rollups: bool = True) -> int:
+        """
+        Delete harvests with set-based queries, without loading instances or sending delete signals.
+
+        QuerySet.delete() can't do that, as receivers of delete signals make it collect and signal
+        harvests one by one. What those receivers do is done here for whole batch instead: totals are
+        subtracted from rollups and cached pages of owners are invalidated. Nothing references harvests,
+        so there is nothing to cascade to and batches are deleted by primary keys, the way collector
+        deletes models without signal receivers.
+
+        Harvests are selected and deleted on the database routed for writes, never on a read replica.
+
+        :param batch_size: number of harvests deleted with single query
+        :param update_rollups: subtract deleted harvests from season rollups, computed with
+            one grouped query per batch; pass False when rollups are deleted anyway
+        :return: number of deleted harvests
+        """
+        using = router.db_for_write(self.model)
+        harvests = self.using(using)
+        n_deleted = 0
+        with transaction.atomic(using=using):
+            while True:
+                rows = list(harvests.order_by().values_list("id", "owner_id")[:batch_size])
+                if not rows:
+                    return n_deleted
+
+                ids, owner_ids = zip(*rows)
+                batch = self.model.objects.using(using).filter(pk__in=ids)
+                totals = []
+                if update_rollups:
+                    totals = list(batch.order_by()
+                                  .annotate(year=ExtractYear("date"))
+                                  .values("owner_id", "year", "fruit")
+                                  .totals())
+
+                n_deleted += batch._raw_delete(using)
+                invalidate(owner_ids, using=using, seasons=((row["owner_id"], row["year"]) for row in totals))
+
+                rollups = HarvestSeasonRollup.objects.using(using)
+                for row in totals:
+                    rollups.apply_delta(row["owner_id"], row["year"], row["fruit"],
+                                        -row["n_harvests"], -row["total_amount"], -row["total_value"])
+
+    def existing_keys(self, keys: list[tuple[int, datetime.date, str]]) -> set[tuple[int, datetime.date, str]]:
+        """
+        Find which of given (owner_id, date, fruit) keys are already taken, with one query.
+
+        Lookup is a superset filter on each column of the unique constraint, narrowed down in Python.
+        """
+        if not keys:
+            return set()
+        owner_ids, dates, fruits = (set(column) for column in zip(*keys))
+        found = self.filter(owner_id__in=owner_ids, date__in=dates, fruit__in=fruits)\
+            .order_by()\
+            .values_list("owner_id", "date", "fruit")
+        return set(found) & set(keys)
+
+    def totals(self) -> "HarvestQuerySet":
+        """Annotate (grouped) harvests with their count, total amount and total value"""
+        return self.annotate(n_harvests=Count("id"),
+                             total_amount=Sum("amount"),
+                             total_value=Sum(F("price") * F("amount"),
+                                             output_field=DecimalField(max_digits=14, decimal_places=2)))
+
+
 class Harvest(models.Model):
     date = models.DateField(verbose_name="Date of harvest",
                             null=False,
@@ -35,13 +150,22 @@ class Harvest(models.Model):
                                 validators=[MinValueValidator(decimal.Decimal("0.1")),
                                             MaxValueValidator(decimal.Decimal("50.0"))])
 
-    owner = models.ForeignKey(User, on_delete=models.CASCADE, null=False)
+    # lookups by owner are served by composite indexes below, which all lead with owner
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, null=False, db_index=False)
+
+    objects = HarvestQuerySet.as_manager()
 
     class Meta:
         ordering = ["date"]
         constraints = [
             models.UniqueConstraint(fields=["date", "owner", "fruit"], name="unique_date_and_fruit_for_owner")
         ]
+        indexes = [
+            # harvests of owner by date (list, recent harvests, year filters), covering season summary columns
+            models.Index(fields=["owner", "date", "fruit", "amount", "price"], name="harvest_owner_date_idx"),
+            # harvests of owner filtered by fruit, ordered by date
+            models.Index(fields=["owner", "fruit", "date"], name="harvest_owner_fruit_date_idx"),
+        ]
 
     @property
     def value(self):
@@ -50,9 +174,215 @@ class Harvest(models.Model):
     def __str__(self):
         return f"{self.fruit.capitalize()} {self.date}"
 
+    ROLLUP_FIELDS = ("owner_id", "date", "fruit", "amount", "price")
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # values as stored in db, used to adjust rollups by difference on next write
+        instance._stored_values = dict(zip(field_names, values))
+        return instance
+
+    def remember_stored_values(self) -> None:
+        """Mark current field values as the ones stored in database"""
+        self._stored_values = {f: getattr(self, f) for f in self.ROLLUP_FIELDS}
+
+    def rollup_state(self, stored: bool = False) -> Optional[tuple]:
+        """
+        Key and totals this harvest contributes to HarvestSeasonRollup.
+
+        :param stored: use values last loaded from / saved to database instead of current ones
+        :return: tuple (owner_id, year, fruit, amount, value) or None if some of the values are not known
+        """
+        if stored:
+            values = getattr(self, "_stored_values", {})
+        else:
+            deferred = self.get_deferred_fields()
+            values = {f: getattr(self, f) for f in self.ROLLUP_FIELDS if f not in deferred}
+        if any(f not in values for f in self.ROLLUP_FIELDS):
+            return None
+
+        h_date = self._meta.get_field("date").to_python(values["date"])
+        amount = int(values["amount"])
+        price = decimal.Decimal(str(values["price"])).quantize(decimal.Decimal("0.01"))
+        return values["owner_id"], h_date.year, values["fruit"], amount, price * amount
+
     def get_absolute_url(self):
         return reverse('harvests:edit', kwargs={"pk": self.pk})
 
     @property
     def profits(self):
         return self.price * self.amount
+
+
+class HarvestSeasonRollupQuerySet(models.QuerySet):
+    """QuerySet maintaining and reading materialized season totals"""
+
+    def season_summary(self, owner: User, year: int) -> dict:
+        """
+        Summarize harvests of given owner in a single season from materialized totals.
+
+        :param owner: User owning the harvests
+        :param year: season (calendar year) to summarize
+        :return: same dict as HarvestQuerySet.season_summary
+        """
+        rows = self.filter(owner=owner, year=year)\
+            .order_by("fruit")\
+            .values("fruit", "n_harvests", "total_amount", "total_value")
+
+        return summarize_by_fruit(rows)
+
+    async def aseason_summary(self, owner: User, year: int) -> dict:
+        """Async version of season_summary"""
+        rows = self.filter(owner=owner, year=year)\
+            .order_by("fruit")\
+            .values("fruit", "n_harvests", "total_amount", "total_value")
+
+        return summarize_by_fruit([row async for row in rows])
+
+    def count_harvests(self, owner: User, fruit: Optional[str] = None, year: Optional[int] = None) -> int:
+        """Number of harvests of given owner, optionally only of given fruit and / or season"""
+        rollups = self.filter(owner=owner)
+        if fruit:
+            rollups = rollups.filter(fruit=fruit)
+        if year:
+            rollups = rollups.filter(year=year)
+        return rollups.aggregate(n=Sum("n_harvests"))["n"] or 0
+
+    def seasons(self, owner: User) -> list[int]:
+        """List of seasons in which given owner has any harvests"""
+        return list(self.filter(owner=owner).order_by("year").values_list("year", flat=True).distinct())
+
+    async def aseasons(self, owner: User) -> list[int]:
+        """Async version of seasons"""
+        years = self.filter(owner=owner).order_by("year").values_list("year", flat=True).distinct()
+        return [year async for year in years]
+
+    def apply_delta(self, owner_id: int, year: int, fruit: str,
+                    n_harvests: int, amount: int, value: decimal.Decimal) -> None:
+        """
+        Add given difference to totals of single (owner, year, fruit) rollup.
+
+        Row is created when first harvest is added and removed when last one is gone.
+        """
+        key = {"owner_id": owner_id, "year": year, "fruit": fruit}
+        with transaction.atomic(using=self.db):
+            updated = self.filter(**key).update(n_harvests=F("n_harvests") + n_harvests,
+                                                total_amount=F("total_amount") + amount,
+                                                total_value=F("total_value") + value)
+            if not updated and n_harvests > 0:
+                try:
+                    with transaction.atomic(using=self.db):
+                        self.create(**key, n_harvests=n_harvests, total_amount=amount, total_value=value)
+                except IntegrityError:
+                    # row created concurrently, add to it instead
+                    self.filter(**key).update(n_harvests=F("n_harvests") + n_harvests,
+                                              total_amount=F("total_amount") + amount,
+                                              total_value=F("total_value") + value)
+            elif n_harvests < 0:
+                self.filter(**key, n_harvests__lte=0).delete()
+
+    def add_harvests(self, harvests: list["Harvest"]) -> None:
+        """Add totals of harvests created without signals (e.g. with bulk_create), one update per rollup"""
+        deltas = {}
+        for harvest in harvests:
+            owner_id, year, fruit, amount, value = harvest.rollup_state()
+            n, total_amount, total_value = deltas.get((owner_id, year, fruit), (0, 0, 0))
+            deltas[(owner_id, year, fruit)] = (n + 1, total_amount + amount, total_value + value)
+
+        for (owner_id, year, fruit), (n, amount, value) in deltas.items():
+            self.apply_delta(owner_id, year, fruit, n, amount, value)
+        invalidate({h.owner_id for h in harvests}, using=self.db, seasons=(key[:2] for key in deltas))
+
+    def move_harvests(self, harvests: list["Harvest"]) -> None:
+        """
+        Move totals of harvests changed without signals (e.g. with bulk_update) from rollups of their
+        stored values to rollups of current ones, one update per affected rollup.
+        """
+        deltas = {}
+        for harvest in harvests:
+            previous, current = harvest.rollup_state(stored=True), harvest.rollup_state()
+            for sign, (owner_id, year, fruit, amount, value) in ((-1, previous), (1, current)):
+                n, total_amount, total_value = deltas.get((owner_id, year, fruit), (0, 0, 0))
+                deltas[(owner_id, year, fruit)] = (n + sign, total_amount + sign * amount, total_value + sign * value)
+            harvest.remember_stored_values()
+
+        for (owner_id, year, fruit), (n, amount, value) in deltas.items():
+            if (n, amount, value) != (0, 0, 0):
+                self.apply_delta(owner_id, year, fruit, n, amount, value)
+        # harvests moved within a season leave its totals as they were, but not its weekly series
+        invalidate({h.owner_id for h in harvests}, using=self.db, seasons=(key[:2] for key in deltas))
+
+    def rebuild(self, owner: Optional[User] = None, owner_ids: Optional[list[int]] = None) -> int:
+        """
+        Recompute rollups from scratch with one grouped query over harvests.
+
+        :param owner: rebuild only rollups of given user
+        :param owner_ids: rebuild only rollups of users with given ids, all rollups when neither is set
+        :return: number of rollup rows created
+        """
+        harvests = Harvest.objects.using(self.db).order_by()
+        rollups = self
+        if owner is not None:
+            harvests = harvests.filter(owner=owner)
+            rollups = rollups.filter(owner=owner)
+        if owner_ids is not None:
+            harvests = harvests.filter(owner_id__in=owner_ids)
+            rollups = rollups.filter(owner_id__in=owner_ids)
+
+        rows = harvests.annotate(year=ExtractYear("date"))\
+            .values("owner_id", "year", "fruit")\
+            .totals()
+
+        # rebuild of everyone's rollups bumps global version, which covers all seasons too
+        for_some_owners = owner is not None or owner_ids is not None
+        with transaction.atomic(using=self.db):
+            # seasons which had rollups before or have them now may have changed
+            seasons = set(rollups.values_list("owner_id", "year")) if for_some_owners else set()
+            rollups.delete()
+            created = self.bulk_create((self.model(owner_id=row["owner_id"],
+                                                   year=row["year"],
+                                                   fruit=row["fruit"],
+                                                   n_harvests=row["n_harvests"],
+                                                   total_amount=row["total_amount"],
+                                                   total_value=row["total_value"])
+                                        for row in rows.iterator()),
+                                       batch_size=1000)
+            if for_some_owners:
+                seasons.update((rollup.owner_id, rollup.year) for rollup in created)
+            if owner is not None:
+                invalidate([owner.pk], using=self.db, seasons=seasons)
+            else:
+                invalidate(owner_ids, using=self.db, seasons=seasons)
+        return len(created)
+
+
+class HarvestSeasonRollup(models.Model):
+    """Harvest totals per owner, season and fruit, kept current by harvest signals"""
+    # lookups by owner are served by unique constraint, which leads with owner
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, null=False, db_index=False)
+
+    year = models.PositiveSmallIntegerField(verbose_name="Season")
+
+    fruit = models.CharField(verbose_name="Fruit harvested",
+                             max_length=15, choices=Harvest.FRUITS)
+
+    n_harvests = models.PositiveIntegerField(verbose_name="Number of harvests", default=0)
+
+    total_amount = models.BigIntegerField(verbose_name="Total amount harvested", default=0)
+
+    total_value = models.DecimalField(verbose_name="Total value",
+                                      max_digits=14,
+                                      decimal_places=2,
+                                      default=0)
+
+    objects = HarvestSeasonRollupQuerySet.as_manager()
+
+    class Meta:
+        ordering = ["year", "fruit"]
+        constraints = [
+            models.UniqueConstraint(fields=["owner", "year", "fruit"], name="unique_rollup_for_owner_season_fruit")
+        ]
+
+    def __str__(self):
+        return f"{self.fruit.capitalize()} {self.year}"
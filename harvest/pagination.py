@@ -0,0 +1,119 @@
+import base64
+import binascii
+import datetime
+from typing import Optional, Union
+
+from django.db.models import Q, QuerySet
+
+from .models import MAX_HARVEST_ID, Harvest
+
+NEXT = "n"
+PREVIOUS = "p"
+
+
+def encode_position(direction: str, h_date: datetime.date, h_id: int) -> str:
+    """Opaque token pointing before or after harvest with given date and id, in (date, id) order"""
+    raw = f"{direction}{h_date.isoformat()}:{h_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def encode_cursor(direction: str, harvest: Union[Harvest, dict]) -> str:
+    """Opaque token pointing before or after given harvest in (date, id) order, harvest can be a row from values()"""
+    if isinstance(harvest, dict):
+        return encode_position(direction, harvest["date"], harvest["id"])
+    return encode_position(direction, harvest.date, harvest.pk)
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[tuple[str, datetime.date, int]]:
+    """
+    Decode token created by encode_cursor.
+
+    :return: tuple (direction, date, id) or None if cursor is empty, malformed or points at id out of range
+    """
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        direction, raw = raw[0], raw[1:]
+        h_date, h_id = raw.split(":")
+        if direction not in (NEXT, PREVIOUS) or not 0 < int(h_id) <= MAX_HARVEST_ID:
+            return None
+        return direction, datetime.date.fromisoformat(h_date), int(h_id)
+    except (binascii.Error, UnicodeDecodeError, IndexError, ValueError):
+        return None
+
+
+class KeysetPage:
+    """Page of harvests found by seeking on (date, id) instead of counting and skipping rows with OFFSET"""
+
+    def __init__(self, object_list: list[Harvest], has_next: bool, has_previous: bool):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def next_cursor(self) -> Optional[str]:
+        if self.has_next and self.object_list:
+            return encode_cursor(NEXT, self.object_list[-1])
+        return None
+
+    @property
+    def previous_cursor(self) -> Optional[str]:
+        if self.has_previous and self.object_list:
+            return encode_cursor(PREVIOUS, self.object_list[0])
+        return None
+
+
+def _seek(harvests: QuerySet, decoded: Optional[tuple[str, datetime.date, int]], limit: int) -> QuerySet:
+    """Query of limit + 1 harvests after or before position decoded from cursor, from start when it is None"""
+    if decoded is None:
+        return harvests.order_by("date", "id")[:limit + 1]
+
+    direction, h_date, h_id = decoded
+    if direction == NEXT:
+        harvests = harvests.filter(date__gte=h_date).filter(Q(date__gt=h_date) | Q(id__gt=h_id))\
+            .order_by("date", "id")
+    else:
+        harvests = harvests.filter(date__lte=h_date).filter(Q(date__lt=h_date) | Q(id__lt=h_id))\
+            .order_by("-date", "-id")
+    return harvests[:limit + 1]
+
+
+def _page(rows: list[Harvest], decoded: Optional[tuple[str, datetime.date, int]], limit: int) -> KeysetPage:
+    """Build page from rows fetched by _seek query"""
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    if decoded is None:
+        return KeysetPage(rows, has_next=has_more, has_previous=False)
+    if decoded[0] == NEXT:
+        return KeysetPage(rows, has_next=has_more, has_previous=True)
+    rows.reverse()
+    return KeysetPage(rows, has_next=True, has_previous=has_more)
+
+
+def keyset_paginate(harvests: QuerySet, cursor: Optional[str], limit: int) -> KeysetPage:
+    """
+    Get page of harvests located by cursor with a single query of limit + 1 rows.
+
+    Cost of the query doesn't depend on how deep the page is, as rows are found
+    by index seek on (date, id) instead of skipping with OFFSET.
+
+    :param harvests: filtered harvests queryset, rows from values() have to include date and id
+    :param cursor: token from KeysetPage.next_cursor / previous_cursor, first page when empty or invalid
+    :param limit: number of harvests on page
+    """
+    decoded = decode_cursor(cursor)
+    return _page(list(_seek(harvests, decoded, limit)), decoded, limit)
+
+
+async def akeyset_paginate(harvests: QuerySet, cursor: Optional[str], limit: int) -> KeysetPage:
+    """Async version of keyset_paginate"""
+    decoded = decode_cursor(cursor)
+    return _page([h async for h in _seek(harvests, decoded, limit)], decoded, limit)
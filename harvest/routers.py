@@ -0,0 +1,138 @@
+"""
+Routing of read-only queries to read replicas (HARVEST_DB_REPLICAS setting, see Harvest/database.py).
+
+Queries go to a replica only inside replica_reads() scope, used by dashboard and list pages
+and by reporting commands. Everything else, all writes included, uses the primary.
+
+Client which has just written is told to read from primary by a cookie set by read_your_writes_middleware,
+so that the pin holds whichever process serves its next request.
+"""
+import asyncio
+import math
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.http import HttpRequest, HttpResponse
+from django.utils.decorators import sync_and_async_middleware
+
+# replica chosen for reads of current request or command, None reads from primary
+_replica: ContextVar[Optional[str]] = ContextVar("harvest_replica", default=None)
+
+# replicas which failed to connect, by alias, with time they are tried again at
+_down_until: dict[str, float] = {}
+
+# seconds a replica which failed to connect is skipped for
+REPLICA_RETRY_AFTER = 30
+
+# cookie with time of client's last write
+WROTE_COOKIE = "harvest_wrote"
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS", "TRACE")
+
+
+def _available(alias: str) -> bool:
+    if time.monotonic() < _down_until.get(alias, 0):
+        return False
+    try:
+        connections[alias].ensure_connection()
+    except DatabaseError:
+        _down_until[alias] = time.monotonic() + REPLICA_RETRY_AFTER
+        return False
+    return True
+
+
+def choose_replica() -> Optional[str]:
+    """Random replica which can be connected to, None when there is none and primary has to be used"""
+    aliases = [alias for alias in getattr(settings, "HARVEST_DB_REPLICAS", []) if alias in connections.settings]
+    random.shuffle(aliases)
+    return next((alias for alias in aliases if _available(alias)), None)
+
+
+def current_replica() -> Optional[str]:
+    """Replica reads of harvests and users go to now, None when they go to primary"""
+    return _replica.get()
+
+
+@contextmanager
+def reads_from(alias: Optional[str]) -> Iterator[Optional[str]]:
+    """Send reads of harvests and users made inside to given replica, to primary when alias is None"""
+    token = _replica.set(alias)
+    try:
+        yield alias
+    finally:
+        _replica.reset(token)
+
+
+@contextmanager
+def replica_reads(pinned: bool = False) -> Iterator[Optional[str]]:
+    """
+    Send reads of harvests and users made inside to an available replica, can be used as decorator too.
+
+    :param pinned: keep reads on primary, e.g. when user has just changed data a lagging replica may not have yet
+    :return: alias of replica used, None when reads go to primary
+    """
+    with reads_from(None if pinned else choose_replica()) as alias:
+        yield alias
+
+
+class ReplicaRouter:
+    """Reads of harvest and auth models in replica_reads() scope go to its replica, other queries to primary"""
+    route_app_labels = {"harvest", "auth"}
+
+    def db_for_read(self, model, **hints) -> Optional[str]:
+        alias = _replica.get()
+        if alias and model._meta.app_label in self.route_app_labels:
+            return alias
+        return None
+
+    def db_for_write(self, model, **hints) -> Optional[str]:
+        # objects read from a replica are saved to primary
+        return DEFAULT_DB_ALIAS if model._meta.app_label in self.route_app_labels else None
+
+    def allow_relation(self, obj1, obj2, **hints) -> Optional[bool]:
+        databases = {DEFAULT_DB_ALIAS, *getattr(settings, "HARVEST_DB_REPLICAS", [])}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+def _pin_seconds() -> float:
+    return getattr(settings, "HARVEST_DB_REPLICA_PIN", 5)
+
+
+def wrote_recently(request: HttpRequest) -> bool:
+    """Whether client wrote so recently, that a replica may not have the change yet"""
+    try:
+        wrote_at = float(request.COOKIES.get(WROTE_COOKIE, ""))
+    except ValueError:
+        return False
+    return time.time() - wrote_at < _pin_seconds()
+
+
+def _pin_after_write(request: HttpRequest, response: HttpResponse) -> None:
+    if request.method in SAFE_METHODS or response.status_code >= 400 or _pin_seconds() <= 0 \
+            or not getattr(settings, "HARVEST_DB_REPLICAS", []):
+        return
+    response.set_cookie(WROTE_COOKIE, f"{time.time():.3f}", max_age=math.ceil(_pin_seconds()),
+                        httponly=True, samesite="Lax")
+
+
+@sync_and_async_middleware
+def read_your_writes_middleware(get_response):
+    """Set cookie pinning reads of client to primary after its successful unsafe request (add, edit, delete, API)"""
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request: HttpRequest):
+            response = await get_response(request)
+            _pin_after_write(request, response)
+            return response
+    else:
+        def middleware(request: HttpRequest):
+            response = get_response(request)
+            _pin_after_write(request, response)
+            return response
+    return middleware
@@ -0,0 +1,76 @@
+from typing import Optional
+
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .cache import invalidate
+from .models import Harvest, HarvestSeasonRollup
+
+
+def _stored_rollup_state(instance: Harvest, using: str) -> Optional[tuple]:
+    """Rollup state of harvest as stored in database, queried only when instance doesn't know it"""
+    state = instance.rollup_state(stored=True)
+    if state is None and instance.pk is not None:
+        stored = Harvest.objects.using(using).filter(pk=instance.pk).first()
+        state = stored.rollup_state() if stored else None
+    return state
+
+
+def _apply(using: str, state: tuple, sign: int) -> None:
+    owner_id, year, fruit, amount, value = state
+    HarvestSeasonRollup.objects.using(using).apply_delta(owner_id, year, fruit,
+                                                         sign, sign * amount, sign * value)
+
+
+@receiver(pre_save, sender=Harvest)
+def load_rollup_state(sender, instance: Harvest, raw: bool, using: str, **kwargs):
+    """Remember totals harvest contributed before this save"""
+    if raw:
+        return
+    instance._previous_rollup_state = _stored_rollup_state(instance, using)
+
+
+@receiver(post_save, sender=Harvest)
+def update_rollup_on_save(sender, instance: Harvest, created: bool, raw: bool, using: str, **kwargs):
+    """Move harvest totals from its previous rollup to the current one"""
+    if raw:
+        return
+    previous = instance.__dict__.pop("_previous_rollup_state", None)
+    current = instance.rollup_state()
+    if current is None:
+        # saved with deferred fields, fall back to what is in database now
+        instance._stored_values = {}
+        current = _stored_rollup_state(instance, using)
+    else:
+        instance.remember_stored_values()
+    # harvest may have been moved from another owner or season
+    seasons = {state[:2] for state in (previous, current) if state}
+    invalidate({instance.owner_id, *(owner_id for owner_id, _ in seasons)}, using=using, seasons=seasons)
+
+    if previous == current:
+        return
+    if previous and current and previous[:3] == current[:3]:
+        # same season and fruit, adjust totals of single rollup in place
+        owner_id, year, fruit = current[:3]
+        HarvestSeasonRollup.objects.using(using).apply_delta(owner_id, year, fruit, 0,
+                                                             current[3] - previous[3], current[4] - previous[4])
+        return
+    if previous:
+        _apply(using, previous, -1)
+    if current:
+        _apply(using, current, 1)
+
+
+@receiver(pre_delete, sender=Harvest)
+def load_rollup_state_before_delete(sender, instance: Harvest, using: str, **kwargs):
+    """Remember totals of harvest while its row still exists"""
+    instance._previous_rollup_state = _stored_rollup_state(instance, using)
+
+
+@receiver(post_delete, sender=Harvest)
+def update_rollup_on_delete(sender, instance: Harvest, using: str, **kwargs):
+    """Subtract deleted harvest from its rollup"""
+    previous = instance.__dict__.pop("_previous_rollup_state", None)
+    invalidate([instance.owner_id], using=using, seasons=[previous[:2]] if previous else ())
+    if previous:
+        _apply(using, previous, -1)
@@ -0,0 +1,134 @@
+"""
+In-process server of collected static files, for deployments without a web server in front of Django.
+
+Enabled with HARVEST_SERVE_STATIC=1, which adds StaticFilesMiddleware. Files of STATIC_ROOT are
+indexed once at startup, so the process has to be restarted after collectstatic:
+
+    HARVEST_STATIC_PIPELINE=1 python manage.py collectstatic --noinput
+    HARVEST_STATIC_PIPELINE=1 HARVEST_SERVE_STATIC=1 HARVEST_DEBUG=0 python manage.py runserver
+
+Files with content hash in their name (listed in manifest of harvest.storage) are served with
+Cache-Control immutable for a year, others have to be revalidated after STATIC_MAX_AGE seconds.
+Brotli or gzip copy written by collectstatic is sent instead of the file when client accepts it.
+"""
+import json
+import logging
+import mimetypes
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.http import FileResponse, HttpRequest, HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+
+from harvest.storage import ENCODINGS
+
+logger = logging.getLogger(__name__)
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+STATIC_MAX_AGE = 60
+MANIFEST = "staticfiles.json"
+
+
+@dataclass
+class StaticFile:
+    path: str
+    content_type: str
+    size: int
+    etag: str
+    immutable: bool
+    # paths and sizes of compressed copies by content encoding
+    variants: dict[str, tuple[str, int]] = field(default_factory=dict)
+
+    def select(self, accept_encoding: str) -> tuple[str, int, str, str]:
+        """Path, size, encoding (empty for the file itself) and ETag of the variant to send"""
+        accepted = accepted_encodings(accept_encoding)
+        for encoding, _ in ENCODINGS:
+            if encoding in accepted and encoding in self.variants:
+                path, size = self.variants[encoding]
+                return path, size, encoding, f'{self.etag[:-1]}-{encoding}"'
+        return self.path, self.size, "", self.etag
+
+
+def accepted_encodings(header: str) -> set[str]:
+    """Content codings of Accept-Encoding header, except ones refused with q=0"""
+    encodings = set()
+    for item in header.split(","):
+        coding, _, params = item.strip().partition(";")
+        quality = params.strip().removeprefix("q=")
+        if coding and quality not in ("0", "0.0", "0.00", "0.000"):
+            encodings.add(coding.strip().lower())
+    return encodings
+
+
+def hashed_names(static_root: Path) -> set[str]:
+    """Names of files with content hash, from manifest written by collectstatic"""
+    try:
+        with open(static_root / MANIFEST) as f:
+            return set(json.load(f)["paths"].values())
+    except (OSError, ValueError, KeyError):
+        return set()
+
+
+def index_files(static_root: Path, static_url: str) -> dict[str, StaticFile]:
+    """Static files by URL path, with their compressed copies"""
+    hashed = hashed_names(static_root)
+    suffixes = {suffix: encoding for encoding, suffix in ENCODINGS}
+    files = {}
+    for directory, _, filenames in os.walk(static_root):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            name = Path(path).relative_to(static_root).as_posix()
+            if os.path.splitext(name)[1] in (".gz", ".br") or name == MANIFEST:
+                continue
+            stat = os.stat(path)
+            content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+            if content_type.startswith("text/") or content_type in ("application/json", "image/svg+xml"):
+                content_type += "; charset=utf-8"
+            static_file = StaticFile(path, content_type, stat.st_size,
+                                     f'"{stat.st_size:x}-{int(stat.st_mtime):x}"', name in hashed)
+            for suffix, encoding in suffixes.items():
+                if os.path.isfile(path + suffix):
+                    static_file.variants[encoding] = (path + suffix, os.path.getsize(path + suffix))
+            files[static_url + name] = static_file
+    return files
+
+
+class StaticFilesMiddleware:
+    """Serves files of STATIC_ROOT under STATIC_URL, other requests are passed on"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        static_root = Path(settings.STATIC_ROOT)
+        self.static_url = urlparse(settings.STATIC_URL).path
+        self.files = index_files(static_root, self.static_url) if static_root.is_dir() else {}
+        if not self.files:
+            logger.warning("No static files in %s to serve, run collectstatic first", static_root)
+
+    def __call__(self, request: HttpRequest):
+        if request.method in ("GET", "HEAD") and request.path_info.startswith(self.static_url):
+            static_file = self.files.get(request.path_info)
+            if static_file is not None:
+                return self.serve(request, static_file)
+        return self.get_response(request)
+
+    def serve(self, request: HttpRequest, static_file: StaticFile) -> HttpResponse:
+        path, size, encoding, etag = static_file.select(request.headers.get("Accept-Encoding", ""))
+        if etag in (tag.strip() for tag in request.headers.get("If-None-Match", "").split(",")):
+            response = HttpResponseNotModified()
+        elif request.method == "HEAD":
+            response = HttpResponse(content_type=static_file.content_type)
+            response["Content-Length"] = size
+        else:
+            response = FileResponse(open(path, "rb"), content_type=static_file.content_type)
+            # FileResponse names the file it sends, which is the compressed copy
+            del response["Content-Disposition"]
+        response["ETag"] = etag
+        response["Cache-Control"] = IMMUTABLE if static_file.immutable else f"public, max-age={STATIC_MAX_AGE}"
+        if encoding:
+            response["Content-Encoding"] = encoding
+        if static_file.variants:
+            patch_vary_headers(response, ("Accept-Encoding",))
+        return response
@@ -0,0 +1,57 @@
+"""
+Static files storage writing gzip and brotli compressed copies of collected files.
+
+Used by collectstatic when HARVEST_STATIC_PIPELINE=1. Files get content hash in their names
+(harvest.css -> harvest.3f2a1b9c0d4e.css) from ManifestStaticFilesStorage, so they can be cached
+by browsers forever, and text ones are compressed once here instead of on every response:
+
+    staticfiles/harvest/fontawesome/fontawesome.5d41402abc4b.css
+    staticfiles/harvest/fontawesome/fontawesome.5d41402abc4b.css.gz
+    staticfiles/harvest/fontawesome/fontawesome.5d41402abc4b.css.br
+
+Brotli copies are written only with brotli installed. Both are served by harvest.static_server.
+"""
+import gzip
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# already compressed formats, like images and woff2 fonts, don't get smaller
+COMPRESSED_EXTENSIONS = (".css", ".js", ".mjs", ".map", ".svg", ".txt", ".json", ".xml", ".html", ".ttf", ".eot")
+
+# content encodings and file suffixes of compressed copies, in order of preference
+ENCODINGS = (("br", ".br"), ("gzip", ".gz")) if brotli else (("gzip", ".gz"),)
+
+
+def compress(content: bytes) -> dict[str, bytes]:
+    """Compressed variants of content by suffix, only ones smaller than the content itself"""
+    variants = {".gz": gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli:
+        variants[".br"] = brotli.compress(content, quality=11)
+    return {suffix: data for suffix, data in variants.items() if len(data) < len(content)}
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Manifest storage also writing .gz and .br files next to hashed files of compressible formats"""
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in self.hashed_files.values():
+            if name.endswith(COMPRESSED_EXTENSIONS):
+                self._write_compressed(name)
+
+    def _write_compressed(self, name: str):
+        with self.open(name) as f:
+            content = f.read()
+        for suffix, data in compress(content).items():
+            path = self.path(name + suffix)
+            with open(path, "wb") as f:
+                f.write(data)
+            os.utime(path, (os.stat(self.path(name)).st_mtime,) * 2)
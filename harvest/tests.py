@@ -1,21 +1,52 @@
+import base64
+import contextlib
+import csv
 import datetime
 import decimal
+import gzip
+import hashlib
+import importlib
+import importlib.util
+import json
 import os
+import shutil
+import sqlite3
+import tempfile
+import time
 import random
+from concurrent.futures import ThreadPoolExecutor
 from io import StringIO
-from typing import Union
+from pathlib import Path
+from typing import Optional, Union
+from unittest import mock, skipUnless
 
+from django.core.cache.utils import make_template_fragment_key
 from django.core.management import call_command
-from django.db import IntegrityError
-from django.test import TestCase, Client
+from django.core.signals import request_finished, request_started
+from django.core.management.base import CommandError
+from django.db import IntegrityError, close_old_connections, connection, connections, transaction
+from django.db.models import Count
+from asgiref.sync import sync_to_async
+from django.test import TestCase, TransactionTestCase, Client, override_settings
 from django.contrib.auth.models import User
-from django.test.utils import setup_test_environment
-from django.urls import reverse, resolve
+from django.test.utils import setup_test_environment, CaptureQueriesContext
+from django.urls import clear_url_caches, reverse, resolve
+from django.utils.http import http_date
 from django.conf import settings
+from django.template import engines
+from django.template.loaders import cached
 
-from . import views
-from .models import Harvest
+from Harvest.database import database_config, sqlite_pragmas
+from Harvest.handlers import StreamingASGIHandler
+
+from . import analytics, api, async_views, routers, urls as harvest_urls, views
+from .cache import cache_stats, data_state, get_cache, reset_cache_stats
+from .models import Harvest, HarvestSeasonRollup
+from .pagination import NEXT, encode_position
+from .routers import replica_reads
 from .forms import HarvestForm
+from .instrumentation import QueryBudgetExceeded, profile
+from .management.commands.subset_fontawesome import ICON_CLASS, OUTPUT_DIR, subset_css, template_dirs, used_icons
 
 
 def create_dummy_harvests(harvests_data: Union[dict, list[dict]]) -> None:
@@ -56,8 +87,10 @@ class UrlsTests(TestCase):
         self.assertEqual(resolve(reverse("harvest:home")).func, views.index)
         self.assertEqual(resolve(reverse("harvest:harvest-list")).func, views.harvest_list)
         self.assertEqual(resolve(reverse("harvest:harvest-add")).func, views.harvest_add)
+        self.assertEqual(resolve(reverse("harvest:harvest-add-batch")).func, views.harvest_add_batch)
         self.assertEqual(resolve(reverse("harvest:harvest-edit", args=[1])).func, views.harvest_edit)
         self.assertEqual(resolve(reverse("harvest:harvest-delete", args=[1])).func, views.harvest_delete)
+        self.assertEqual(resolve(reverse("harvest:harvest-export")).func, views.harvest_export)
 
 
 class HarvestTests(TestCase):
@@ -255,13 +288,168 @@ class IndexViewTests(TestCase):
 
     def test_authenticated_shown_details(self):
         self.client.login(username="testeruser", password="testeruserpass")
-        response = self.client.get(reverse("harvest:home"))
+        response = self.client.get(reverse("harvest:home"), data={"season": 2022})
         self.assertTemplateUsed(response, "harvest/index.html")
         self.assertEquals(response.status_code, 200)
         self.assertContains(response, "Hello")
         self.assertContains(response, "Summary")
         self.assertEquals(response.context[0]['season_summary']['n_harvests'], 15)
 
+    def test_season_summary_bounded_to_single_year(self):
+        create_dummy_harvests({"owner": self.user,
+                               "number_of_harvests": 4,
+                               "fruit": "apple",
+                               "year": 2023})
+        self.client.login(username="testeruser", password="testeruserpass")
+        response = self.client.get(reverse("harvest:home"), data={"season": 2022})
+        self.assertEquals(response.context[0]['season_summary']['n_harvests'], 15)
+        self.assertNotIn("apple", response.context[0]['season_summary']['fruit_summary'])
+        self.assertEquals(response.context[0]['seasons'], [2022, 2023])
+
+    def test_invalid_season_falls_back_to_current_year(self):
+        self.client.login(username="testeruser", password="testeruserpass")
+        for season in ("kasztan", "0", "100000000000000000000"):
+            response = self.client.get(reverse("harvest:home"), data={"season": season})
+            self.assertEquals(response.status_code, 200)
+            self.assertEquals(response.context[0]['chosen_season'], datetime.date.today().year)
+
+
+class HarvestQuerySetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testeruser", password="testeruserpass")
+        self.user2 = User.objects.create_user(username="testeruser2", password="testeruserpass2")
+
+    def test_season_summary_totals(self):
+        Harvest.objects.create(owner=self.user, fruit="cherry", date=datetime.date(2022, 6, 1),
+                               amount=100, price=decimal.Decimal("2.50"))
+        Harvest.objects.create(owner=self.user, fruit="cherry", date=datetime.date(2022, 6, 2),
+                               amount=200, price=decimal.Decimal("1.25"))
+        Harvest.objects.create(owner=self.user, fruit="apple", date=datetime.date(2022, 9, 1),
+                               amount=50, price=decimal.Decimal("0.99"))
+        Harvest.objects.create(owner=self.user, fruit="apple", date=datetime.date(2021, 9, 1),
+                               amount=50, price=decimal.Decimal("0.99"))
+        Harvest.objects.create(owner=self.user2, fruit="cherry", date=datetime.date(2022, 6, 1),
+                               amount=100, price=decimal.Decimal("2.50"))
+
+        summary = Harvest.objects.season_summary(owner=self.user, year=2022)
+        self.assertEquals(summary["n_harvests"], 3)
+        self.assertEquals(summary["fruit_summary"], {
+            "apple": [50, decimal.Decimal("49.50")],
+            "cherry": [300, decimal.Decimal("500.00")],
+        })
+
+    def test_season_summary_empty_season(self):
+        summary = Harvest.objects.season_summary(owner=self.user, year=2022)
+        self.assertEquals(summary, {"n_harvests": 0, "fruit_summary": {}})
+
+    def test_season_summary_constant_number_of_queries(self):
+        create_dummy_harvests({"owner": self.user, "number_of_harvests": 5,
+                               "fruit": "raspberry", "year": 2022})
+        with self.assertNumQueries(1):
+            Harvest.objects.season_summary(owner=self.user, year=2022)
+
+        create_dummy_harvests([{"owner": self.user, "number_of_harvests": 40,
+                                "fruit": "cherry", "year": 2022},
+                               {"owner": self.user, "number_of_harvests": 40,
+                                "fruit": "apple", "year": 2022}])
+        with self.assertNumQueries(1):
+            summary = Harvest.objects.season_summary(owner=self.user, year=2022)
+        self.assertEquals(summary["n_harvests"], 85)
+
+
+class HarvestIndexesTests(TestCase):
+    """Query plans of owner-first lookups use composite indexes"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testeruser", password="testeruserpass")
+
+    def test_owner_lookup_ordered_by_date_uses_index(self):
+        plan = Harvest.objects.filter(owner=self.user)[:5].explain()
+        self.assertIn("harvest_owner_date_idx", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_owner_fruit_and_year_lookup_uses_index(self):
+        plan = Harvest.objects.filter(owner=self.user, fruit="cherry", date__year=2022).explain()
+        self.assertIn("SEARCH harvest_harvest USING", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+
+class HarvestSeasonRollupTests(TestCase):
+    """Tests for materialized season rollups kept current on writes"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testeruser", password="testeruserpass")
+        self.harvest = Harvest.objects.create(owner=self.user, fruit="cherry", date=datetime.date(2022, 6, 1),
+                                              amount=100, price=decimal.Decimal("2.50"))
+        Harvest.objects.create(owner=self.user, fruit="cherry", date=datetime.date(2022, 6, 2),
+                               amount=200, price=decimal.Decimal("1.25"))
+
+    def assertRollupsMatchHarvests(self, year=2022):
+        self.assertEquals(HarvestSeasonRollup.objects.season_summary(owner=self.user, year=year),
+                          Harvest.objects.season_summary(owner=self.user, year=year))
+
+    def test_rollup_created_on_save(self):
+        rollup = HarvestSeasonRollup.objects.get(owner=self.user, year=2022, fruit="cherry")
+        self.assertEquals(rollup.n_harvests, 2)
+        self.assertEquals(rollup.total_amount, 300)
+        self.assertEquals(rollup.total_value, decimal.Decimal("500.00"))
+
+    def test_rollup_moved_on_edit(self):
+        harvest = Harvest.objects.get(pk=self.harvest.pk)
+        harvest.fruit = "apple"
+        harvest.date = datetime.date(2021, 6, 1)
+        harvest.amount = 50
+        harvest.save()
+        self.assertRollupsMatchHarvests(2022)
+        self.assertRollupsMatchHarvests(2021)
+        self.assertEquals(HarvestSeasonRollup.objects.seasons(owner=self.user), [2021, 2022])
+
+    def test_rollup_removed_with_last_harvest(self):
+        Harvest.objects.filter(owner=self.user).delete()
+        self.assertFalse(HarvestSeasonRollup.objects.exists())
+
+    def test_rollup_edit_through_view(self):
+        self.client.login(username="testeruser", password="testeruserpass")
+        self.client.post(path=f"/harvest/edit/{self.harvest.pk}",
+                         data={"date": self.harvest.date, "price": 3, "fruit": "strawberry", "amount": 327})
+        self.assertRollupsMatchHarvests()
+
+    def test_rollup_add_and_delete_through_views(self):
+        self.client.login(username="testeruser", password="testeruserpass")
+        self.client.post(reverse("harvest:harvest-add"),
+                         data={"date": datetime.date(2022, 7, 1), "fruit": "apple", "amount": 100, "price": 10})
+        self.assertRollupsMatchHarvests()
+        self.client.post(path=f"/harvest/delete/{self.harvest.pk}")
+        self.assertRollupsMatchHarvests()
+
+    def test_rollup_bulk_delete(self):
+        # rows are deleted without collector, which is safe only while no model references harvests
+        self.assertEquals(Harvest._meta.related_objects, ())
+        create_dummy_harvests({"owner": self.user, "number_of_harvests": 5, "fruit": "apple", "year": 2022})
+        deleted = Harvest.objects.filter(owner=self.user).exclude(pk=self.harvest.pk).bulk_delete(batch_size=2)
+        self.assertEquals(deleted, 6)
+        self.assertEquals(list(Harvest.objects.values_list("pk", flat=True)), [self.harvest.pk])
+        self.assertRollupsMatchHarvests()
+
+    def test_rollup_delete_harvest_command(self):
+        call_command("delete_harvest", self.harvest.pk, stdout=StringIO())
+        self.assertRollupsMatchHarvests()
+
+    def test_rollup_delete_user_command(self):
+        call_command("delete_user", self.user.pk, stdout=StringIO())
+        self.assertFalse(HarvestSeasonRollup.objects.exists())
+
+    def test_rebuild_rollups_command(self):
+        HarvestSeasonRollup.objects.all().delete()
+        out = StringIO()
+        call_command("rebuild_rollups", stdout=out)
+        self.assertIn("Rebuilt 1 season rollups", out.getvalue())
+        self.assertRollupsMatchHarvests()
+
+    def test_rebuild_rollups_command_user_not_existing(self):
+        with self.assertRaises(CommandError):
+            call_command("rebuild_rollups", user_id=777, stdout=StringIO())
+
 
 class HarvestAddViewTests(TestCase):
     def setUp(self):
@@ -332,6 +520,110 @@ class HarvestAddViewTests(TestCase):
         self.assertTemplateUsed("harvest/add")
 
 
+class HarvestAddBatchViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testeruser", password="testeruserpass")
+        Harvest.objects.create(date=datetime.date(2022, 6, 1),
+                               fruit="cherry",
+                               owner=self.user,
+                               price=10,
+                               amount=100)
+
+    @staticmethod
+    def batch_data(rows: list, total_forms: int = 7) -> dict:
+        data = {"form-TOTAL_FORMS": total_forms, "form-INITIAL_FORMS": 0}
+        for i in range(total_forms):
+            # browser submits prefilled date of untouched rows
+            row = rows[i] if i < len(rows) else {"date": datetime.date.today(), "fruit": "raspberry"}
+            data.update({f"form-{i}-{k}": v for k, v in row.items()})
+        return data
+
+    @staticmethod
+    def rows(n: int) -> list:
+        return [{"date": datetime.date(2022, 7, 1) + datetime.timedelta(days=i),
+                 "fruit": "strawberry", "amount": 10 + i, "price": 5} for i in range(n)]
+
+    def test_unauthenticated_has_no_access(self):
+        response = self.client.get(reverse("harvest:harvest-add-batch"))
+
+        self.assertTrue("login" in response.url)
+        self.assertEquals(response.status_code, 302)
+
+    def test_authenticated_user_has_access(self):
+        self.client.login(username="testeruser", password="testeruserpass")
+        response = self.client.get(reverse("harvest:harvest-add-batch"))
+
+        self.assertEquals(response.status_code, 200)
+        self.assertContains(response, "form-TOTAL_FORMS")
+
+    def test_authenticated_user_creates_harvests(self):
+        self.client.login(username="testeruser", password="testeruserpass")
+        response = self.client.post(reverse("harvest:harvest-add-batch"), data=self.batch_data(self.rows(3)))
+
+        self.assertEquals(response.status_code, 301)
+        self.assertTrue("harvest/list" in response.url)
+        self.assertEquals(Harvest.objects.filter(owner=self.user, fruit="strawberry").count(), 3)
+        self.assertEqual(HarvestSeasonRollup.objects.season_summary(self.user, 2022),
+                         Harvest.objects.season_summary(self.user, 2022))
+
+    def test_duplicate_within_batch_rejected(self):
+        self.client.login(username="testeruser", password="testeruserpass")
+        rows = self.rows(2)
+        rows[1]["date"] = rows[0]["date"]
+        response = self.client.post(reverse("harvest:harvest-add-batch"), data=self.batch_data(rows))
+
+        self.assertEquals(response.status_code, 200)
+        self.assertContains(response, "repeated in this batch")
+        self.assertEquals(Harvest.objects.count(), 1)
+
+    def test_duplicate_of_existing_harvest_rejected(self):
+        self.client.login(username="testeruser", password="testeruserpass")
+        rows = self.rows(2) + [{"date": datetime.date(2022, 6, 1), "fruit": "cherry", "amount": 100, "price": 10}]
+        response = self.client.post(reverse("harvest:harvest-add-batch"), data=self.batch_data(rows))
+
+        self.assertEquals(response.status_code, 200)
+        self.assertContains(response, "already exists")
+        self.assertEquals(Harvest.objects.count(), 1)
+
+    def test_duplicate_created_meanwhile_rejected(self):
+        self.client.login(username="testeruser", password="testeruserpass")
+        rows = self.rows(2) + [{"date": datetime.date(2022, 6, 1), "fruit": "cherry", "amount": 100, "price": 10}]
+        real_existing_keys = Harvest.objects.existing_keys
+        lookups = []
+
+        def existing_keys(keys):
+            # validation misses harvest of 2022-06-01, like one added by another request right after it
+            lookups.append(keys)
+            return set() if len(lookups) == 1 else real_existing_keys(keys)
+
+        with mock.patch.object(type(Harvest.objects), "existing_keys", side_effect=existing_keys):
+            response = self.client.post(reverse("harvest:harvest-add-batch"), data=self.batch_data(rows))
+
+        self.assertEquals(len(lookups), 2)
+        self.assertEquals(response.status_code, 200)
+        self.assertContains(response, "already exists")
+        self.assertEquals(Harvest.objects.count(), 1)
+        self.assertEquals(HarvestSeasonRollup.objects.count_harvests(owner=self.user), 1)
+
+    def test_empty_batch_rejected(self):
+        self.client.login(username="testeruser", password="testeruserpass")
+        response = self.client.post(reverse("harvest:harvest-add-batch"), data=self.batch_data([]))
+
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(Harvest.objects.count(), 1)
+
+    def test_query_count_does_not_depend_on_batch_size(self):
+        self.client.login(username="testeruser", password="testeruserpass")
+        with CaptureQueriesContext(connection) as small:
+            self.client.post(reverse("harvest:harvest-add-batch"), data=self.batch_data(self.rows(2)))
+        Harvest.objects.filter(fruit="strawberry").delete()
+        with CaptureQueriesContext(connection) as large:
+            self.client.post(reverse("harvest:harvest-add-batch"), data=self.batch_data(self.rows(20), 20))
+
+        self.assertEquals(Harvest.objects.filter(fruit="strawberry").count(), 20)
+        self.assertEquals(len(small), len(large))
+
+
 class HarvestEditViewTests(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(username="testeruser", password="testeruserpass")
@@ -484,6 +776,71 @@ class HarvestDeleteViewTests(TestCase):
         self.assertEquals(response.status_code, 404)
 
 
+class HarvestWriteViewsQueryCountTests(TestCase):
+    """Pins number of queries of write views: session, user, harvest lookup, one duplicate check, write, rollup"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testeruser", password="testeruserpass")
+        self.harvest = Harvest.objects.create(fruit="cherry", date=datetime.date(2022, 6, 1),
+                                              amount=222, price=10, owner=self.user)
+        self.client.login(username="testeruser", password="testeruserpass")
+
+    def post(self, path: str, data: Optional[dict] = None) -> list[dict]:
+        """Post to path and return its queries, without transaction control statements"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(path, data=data or {})
+        self.assertEquals(response.status_code, 301)
+        return [q for q in queries if not q["sql"].startswith(("BEGIN", "SAVEPOINT", "RELEASE SAVEPOINT"))]
+
+    @staticmethod
+    def existence_checks(queries: list[dict]) -> list[dict]:
+        return [q for q in queries if q["sql"].startswith('SELECT 1 AS "a" FROM "harvest_harvest"')]
+
+    def test_add_view_queries(self):
+        queries = self.post(reverse("harvest:harvest-add"),
+                            {"date": datetime.date(2022, 6, 2), "fruit": "cherry", "amount": 100, "price": 10})
+
+        self.assertEquals(len(self.existence_checks(queries)), 1)
+        self.assertEquals(len(queries), 5)
+
+    def test_edit_view_updates_only_changed_fields(self):
+        queries = self.post(reverse("harvest:harvest-edit", args=[self.harvest.pk]),
+                            {"date": "2022-06-01", "fruit": "cherry", "amount": 300, "price": 10})
+
+        updates = [q["sql"] for q in queries if q["sql"].startswith('UPDATE "harvest_harvest"')]
+        self.assertEquals(len(updates), 1)
+        self.assertIn('"amount"', updates[0])
+        self.assertNotIn('"price"', updates[0])
+        self.assertNotIn('"date"', updates[0])
+        # key of harvest is unchanged, so no duplicate check is needed
+        self.assertFalse(self.existence_checks(queries))
+        self.assertEquals(len(queries), 5)
+        self.assertEqual(HarvestSeasonRollup.objects.season_summary(self.user, 2022),
+                         Harvest.objects.season_summary(self.user, 2022))
+
+    def test_edit_view_changing_date_checks_duplicate_once(self):
+        queries = self.post(reverse("harvest:harvest-edit", args=[self.harvest.pk]),
+                            {"date": "2021-06-01", "fruit": "cherry", "amount": 222, "price": 10})
+
+        self.assertEquals(len(self.existence_checks(queries)), 1)
+        self.assertEqual(HarvestSeasonRollup.objects.season_summary(self.user, 2021),
+                         Harvest.objects.season_summary(self.user, 2021))
+        self.assertEqual(HarvestSeasonRollup.objects.season_summary(self.user, 2022),
+                         Harvest.objects.season_summary(self.user, 2022))
+
+    def test_edit_view_without_changes_writes_nothing(self):
+        queries = self.post(reverse("harvest:harvest-edit", args=[self.harvest.pk]),
+                            {"date": "2022-06-01", "fruit": "cherry", "amount": 222, "price": 10})
+
+        self.assertEquals(len(queries), 3)
+
+    def test_delete_view_queries(self):
+        queries = self.post(reverse("harvest:harvest-delete", args=[self.harvest.pk]))
+
+        self.assertEquals(Harvest.objects.count(), 0)
+        self.assertEquals(len(queries), 6)
+
+
 class HarvestListViewTests(TestCase):
 
     def setUp(self):
@@ -523,6 +880,14 @@ class HarvestListViewTests(TestCase):
         response = self.client.get(path=f"/harvest/list/?harvests-per-page=1")
         self.assertEquals(len(response.context[0]['harvests']), 1)
 
+    def test_harvests_per_page_clamped_to_offered_sizes(self):
+        self.client.login(username="testeruser", password="testeruserpass", )
+        for per_page, limit in (("99999999999999999999", 10), ("11", 10), ("-3", 1), ("0", 1)):
+            for page in ({}, {"page": 1}):
+                response = self.client.get("/harvest/list/", {"harvests-per-page": per_page, **page})
+                self.assertEquals(response.status_code, 200)
+                self.assertEquals(response.context[0]['limit'], limit)
+
     def test_fruit_query_parameter(self):
         self.client.login(username="testeruser", password="testeruserpass", )
         response = self.client.get(path=f"/harvest/list/?harvests-per-page=3&fruit=cherry")
@@ -535,6 +900,1192 @@ class HarvestListViewTests(TestCase):
         self.assertEquals(len(response.context[0]['harvests']), 0)
 
 
+@override_settings(HARVEST_PAGE_CACHE=True)
+class HarvestPageCacheTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.user = User.objects.create_user(username="testeruser", password="testeruserpass")
+        self.harvest = Harvest.objects.create(fruit="cherry", date=datetime.date(2022, 6, 1),
+                                              amount=222, price=10, owner=self.user)
+        Harvest.objects.create(fruit="apple", date=datetime.date(2022, 7, 1),
+                               amount=100, price=2, owner=self.user)
+        self.client.login(username="testeruser", password="testeruserpass")
+
+    def get(self, path: str, params: dict):
+        """Get page and return response with queries made to harvest tables"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path, params)
+        return response, [q for q in queries if "harvest_" in q["sql"]]
+
+    def test_cached_dashboard_served_without_harvest_queries(self):
+        first, first_queries = self.get(reverse("harvest:home"), {"season": 2022})
+        second, second_queries = self.get(reverse("harvest:home"), {"season": 2022})
+
+        self.assertTrue(first_queries)
+        self.assertFalse(second_queries)
+        self.assertEqual(first.context["season_summary"], second.context["season_summary"])
+        self.assertEqual(cache_stats()["hits"], 1)
+        self.assertEqual(cache_stats()["misses"], 1)
+
+    def test_seasons_cached_separately(self):
+        self.get(reverse("harvest:home"), {"season": 2022})
+        response, queries = self.get(reverse("harvest:home"), {"season": 2021})
+
+        self.assertTrue(queries)
+        self.assertEqual(response.context["season_summary"]["n_harvests"], 0)
+
+    def test_edit_from_view_invalidates_dashboard(self):
+        self.get(reverse("harvest:home"), {"season": 2022})
+        self.client.post(reverse("harvest:harvest-edit", args=[self.harvest.pk]),
+                         {"date": "2022-06-01", "fruit": "cherry", "amount": 300, "price": 10})
+        response, queries = self.get(reverse("harvest:home"), {"season": 2022})
+
+        self.assertTrue(queries)
+        self.assertEqual(response.context["season_summary"]["fruit_summary"]["cherry"][0], 300)
+
+    def test_bulk_delete_from_command_invalidates_list(self):
+        self.get(reverse("harvest:harvest-list"), {})
+        call_command("delete_harvest", "--fruit", "apple", stdout=StringIO())
+        response, queries = self.get(reverse("harvest:harvest-list"), {})
+
+        self.assertTrue(queries)
+        self.assertEqual([h.fruit for h in response.context["harvests"]], ["cherry"])
+
+    def test_off_without_shared_cache(self):
+        # local memory cache of another location stands for the one of process running the command
+        other_process = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                                     "LOCATION": "other-process"}}
+        with override_settings(HARVEST_PAGE_CACHE=False):
+            self.get(reverse("harvest:harvest-list"), {})
+            with override_settings(CACHES=other_process):
+                call_command("delete_harvest", "--fruit", "apple", stdout=StringIO())
+            response, queries = self.get(reverse("harvest:harvest-list"), {})
+
+        self.assertTrue(queries)
+        self.assertEqual([h.fruit for h in response.context["harvests"]], ["cherry"])
+        self.assertEqual(cache_stats()["misses"], 0)
+
+    def test_rebuild_invalidates_all_users(self):
+        self.get(reverse("harvest:home"), {"season": 2022})
+        HarvestSeasonRollup.objects.rebuild()
+        _, queries = self.get(reverse("harvest:home"), {"season": 2022})
+
+        self.assertTrue(queries)
+
+    def test_list_pages_cached_per_fruit_page_and_limit(self):
+        for params in ({}, {"fruit": "apple"}, {"harvests-per-page": 1}, {"page": 1}, {"page": 2, "harvests-per-page": 1}):
+            _, queries = self.get(reverse("harvest:harvest-list"), params)
+            self.assertTrue(queries, params)
+            response, queries = self.get(reverse("harvest:harvest-list"), params)
+            self.assertFalse(queries, params)
+
+        self.assertEqual([h.fruit for h in response.context["harvests"]], ["apple"])
+        self.assertFalse(response.context["page_obj"].has_next())
+        self.assertTrue(response.context["page_obj"].has_previous())
+
+    def test_cache_stats_command(self):
+        self.get(reverse("harvest:home"), {"season": 2022})
+        self.get(reverse("harvest:home"), {"season": 2022})
+        out = StringIO()
+        call_command("cache_stats", "--reset", stdout=out)
+
+        self.assertIn("Cache hits: 1, misses: 1, hit ratio: 50.0%", out.getvalue())
+        self.assertEqual(cache_stats()["hits"], 0)
+
+
+@override_settings(HARVEST_PAGE_CACHE=True)
+class HarvestTemplateFragmentCacheTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.user = User.objects.create_user(username="testeruser", password="testeruserpass")
+        self.harvest = Harvest.objects.create(fruit="cherry", date=datetime.date(2022, 6, 1),
+                                              amount=222, price=10, owner=self.user)
+        self.client.login(username="testeruser", password="testeruserpass")
+
+    def test_templates_are_loaded_by_cached_loader(self):
+        loader = engines["django"].engine.template_loaders[0]
+
+        self.assertIsInstance(loader, cached.Loader)
+        self.assertIs(loader.get_template("harvest/harvest_list.html"),
+                      loader.get_template("harvest/harvest_list.html"))
+
+    def test_list_rows_cached_under_data_version_and_page(self):
+        response = self.client.get(reverse("harvest:harvest-list"), {"harvests-per-page": 3})
+        version, _ = data_state(self.user)
+
+        key = make_template_fragment_key("harvest-list-rows", [version, "all", 3, "cursor None"])
+        self.assertIn("222", get_cache().get(key))
+        self.assertIsNone(get_cache().get(make_template_fragment_key("harvest-list-rows",
+                                                                     [version, "all", 4, "cursor None"])))
+        self.assertContains(response, '<option value="3"  selected >3</option>', html=False)
+
+    def test_changed_harvests_are_rendered_again(self):
+        self.client.get(reverse("harvest:harvest-list"))
+        self.client.get(reverse("harvest:home"), {"season": 2022})
+        self.client.post(reverse("harvest:harvest-edit", args=[self.harvest.pk]),
+                         {"date": "2022-06-01", "fruit": "cherry", "amount": 333, "price": 10})
+
+        self.assertContains(self.client.get(reverse("harvest:harvest-list")), "333")
+        self.assertContains(self.client.get(reverse("harvest:home"), {"season": 2022}), "333")
+
+    def test_dashboard_cached_per_season(self):
+        self.client.get(reverse("harvest:home"), {"season": 2022})
+        version, _ = data_state(self.user)
+
+        self.assertIsNotNone(get_cache().get(make_template_fragment_key("dashboard", [version, 2022])))
+        self.assertIsNone(get_cache().get(make_template_fragment_key("dashboard", [version, 2021])))
+
+
+@skipUnless(importlib.util.find_spec("jinja2"), "Jinja2 is not installed")
+@override_settings(HARVEST_PAGE_CACHE=True)
+class HarvestJinja2TemplatesTests(TestCase):
+    engines = {"index": "jinja2", "harvest_list": "jinja2"}
+
+    def setUp(self):
+        get_cache().clear()
+        self.user = User.objects.create_user(username="testeruser", password="testeruserpass")
+        Harvest.objects.create(fruit="cherry", date=datetime.date(2022, 6, 1), amount=222, price=10, owner=self.user)
+        Harvest.objects.create(fruit="apple", date=datetime.date(2022, 7, 1), amount=100, price=2.5, owner=self.user)
+        self.client.login(username="testeruser", password="testeruserpass")
+
+    def assertSamePage(self, path: str, params: dict):
+        django_page = self.client.get(path, params)
+        with override_settings(HARVEST_TEMPLATE_ENGINES=self.engines):
+            jinja2_page = self.client.get(path, params)
+
+        self.assertFalse(jinja2_page.templates)
+        self.assertHTMLEqual(jinja2_page.content.decode(), django_page.content.decode())
+
+    def test_dashboard_same_as_django_template(self):
+        self.assertSamePage(reverse("harvest:home"), {"season": 2022})
+
+    def test_list_pages_same_as_django_template(self):
+        self.assertSamePage(reverse("harvest:harvest-list"), {"harvests-per-page": 1})
+        self.assertSamePage(reverse("harvest:harvest-list"), {"harvests-per-page": 1, "page": 2})
+        first_page = self.client.get(reverse("harvest:harvest-list"), {"harvests-per-page": 1})
+        cursor = first_page.context["page_obj"].next_cursor
+        self.assertSamePage(reverse("harvest:harvest-list"), {"harvests-per-page": 1, "cursor": cursor})
+
+    @override_settings(HARVEST_TEMPLATE_ENGINES=engines)
+    def test_list_rows_cached_as_fragment(self):
+        self.client.get(reverse("harvest:harvest-list"))
+        version, _ = data_state(self.user)
+
+        key = make_template_fragment_key("jinja2:harvest-list-rows", [version, "all", 5, "cursor None"])
+        self.assertIn("222", get_cache().get(key))
+
+
+@override_settings(HARVEST_CONDITIONAL_GET=True)
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.user = User.objects.create_user(username="testeruser", password="testeruserpass")
+        self.harvest = Harvest.objects.create(fruit="cherry", date=datetime.date(2022, 6, 1),
+                                              amount=222, price=10, owner=self.user)
+        self.client.login(username="testeruser", password="testeruserpass")
+
+    def revalidate(self, path: str, response, **params):
+        """Repeat request the way browser does with ETag and Last-Modified of previous response"""
+        headers = {"HTTP_IF_NONE_MATCH": response["ETag"]}
+        if response.has_header("Last-Modified"):
+            headers["HTTP_IF_MODIFIED_SINCE"] = response["Last-Modified"]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path, params, **headers)
+        return response, [q for q in queries if "harvest_" in q["sql"]]
+
+    def test_unchanged_pages_not_modified_without_harvest_queries(self):
+        for path, params in ((reverse("harvest:home"), {"season": 2022}),
+                             (reverse("harvest:harvest-list"), {"fruit": "cherry"}),
+                             (reverse("harvest:harvest-export"), {"format": "ndjson"})):
+            first = self.client.get(path, params)
+            self.assertTrue(first.has_header("ETag"), path)
+            self.assertIn("no-cache", first["Cache-Control"])
+
+            response, queries = self.revalidate(path, first, **params)
+            self.assertEquals(response.status_code, 304, path)
+            self.assertFalse(queries, path)
+
+    def test_etag_differs_by_query(self):
+        first = self.client.get(reverse("harvest:home"), {"season": 2022})
+        response, _ = self.revalidate(reverse("harvest:home"), first, season=2021)
+
+        self.assertEquals(response.status_code, 200)
+
+    def test_page_modified_after_edit(self):
+        first = self.client.get(reverse("harvest:harvest-list"))
+        self.client.post(reverse("harvest:harvest-edit", args=[self.harvest.pk]),
+                         {"date": "2022-06-01", "fruit": "cherry", "amount": 300, "price": 10})
+        response, _ = self.revalidate(reverse("harvest:harvest-list"), first)
+
+        self.assertEquals(response.status_code, 200)
+        self.assertNotEquals(response["ETag"], first["ETag"])
+        self.assertTrue(response.has_header("Last-Modified"))
+        self.assertContains(response, "300")
+
+    def test_page_modified_after_bulk_delete(self):
+        first = self.client.get(reverse("harvest:home"), {"season": 2022})
+        call_command("delete_harvest", "--fruit", "cherry", stdout=StringIO())
+        response, _ = self.revalidate(reverse("harvest:home"), first, season=2022)
+
+        self.assertEquals(response.status_code, 200)
+
+    def test_anonymous_index_has_no_etag(self):
+        self.client.logout()
+        response = self.client.get(reverse("harvest:home"))
+
+        self.assertEquals(response.status_code, 200)
+        self.assertFalse(response.has_header("ETag"))
+
+    def test_off_without_shared_cache(self):
+        # versions in local memory of one process aren't bumped by writes handled by other ones
+        with override_settings(HARVEST_CONDITIONAL_GET=False):
+            first = self.client.get(reverse("harvest:harvest-list"))
+            self.assertFalse(first.has_header("ETag"))
+            self.assertFalse(first.has_header("Last-Modified"))
+            response = self.client.get(reverse("harvest:harvest-list"), HTTP_IF_MODIFIED_SINCE=http_date())
+            self.assertEquals(response.status_code, 200)
+            self.assertIn("no-cache", response["Cache-Control"])
+
+
+@override_settings(HARVEST_CONDITIONAL_GET=True, HARVEST_PAGE_CACHE=True)
+class AsyncViewsTests(TestCase):
+    """Read-only views served under ASGI, routed with HARVEST_ASYNC_VIEWS setting"""
+
+    @staticmethod
+    def reload_urls():
+        # root urlconf holds resolver of included app urls, so it is reloaded too
+        importlib.reload(harvest_urls)
+        importlib.reload(importlib.import_module(settings.ROOT_URLCONF))
+        clear_url_caches()
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with override_settings(HARVEST_ASYNC_VIEWS=True):
+            cls.reload_urls()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.reload_urls()
+        super().tearDownClass()
+
+    def setUp(self):
+        get_cache().clear()
+        self.user = User.objects.create_user(username="testeruser", password="testeruserpass")
+        for day, fruit in enumerate(["cherry", "apple", "cherry"]):
+            Harvest.objects.create(fruit=fruit, date=datetime.date(2022, 6, 1 + day),
+                                   amount=100 + day, price=10, owner=self.user)
+        self.async_client.force_login(self.user)
+
+    def test_urls_resolve_to_async_views(self):
+        self.assertEqual(resolve(reverse("harvest:home")).func, async_views.index)
+        self.assertEqual(resolve(reverse("harvest:harvest-list")).func, async_views.harvest_list)
+        self.assertEqual(resolve(reverse("harvest:harvest-export")).func, views.harvest_export)
+        self.assertEqual(resolve(reverse("harvest:harvest-add")).func, views.harvest_add)
+
+    async def test_index(self):
+        response = await self.async_client.get(reverse("harvest:home"), {"season": 10 ** 20})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["chosen_season"], datetime.date.today().year)
+
+        response = await self.async_client.get(reverse("harvest:home"), {"season": 2022})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["seasons"], [2022])
+        self.assertEqual(response.context["season_summary"]["n_harvests"], 3)
+        self.assertEqual(len(response.context["recent_harvests"]), 3)
+        self.assertTrue(response.has_header("ETag"))
+
+    async def test_dashboard_data_matches_sync_version(self):
+        expected = await sync_to_async(views.dashboard_data)(self.user, 2022)
+        data = await async_views.dashboard_data(self.user, 2022)
+
+        self.assertEqual(data, expected)
+
+    async def test_unauthenticated_list_redirects_to_login(self):
+        await sync_to_async(self.async_client.logout)()
+        response = await self.async_client.get(reverse("harvest:harvest-list"))
+
+        self.assertEqual(response.status_code, 302)
+        self.assertIn("login", response.url)
+
+    async def test_list_cursor_and_page_modes(self):
+        response = await self.async_client.get(reverse("harvest:harvest-list"), {"harvests-per-page": 2})
+        self.assertEqual([h.amount for h in response.context["harvests"]], [100, 101])
+        self.assertTrue(response.context["page_obj"].has_next)
+
+        response = await self.async_client.get(reverse("harvest:harvest-list"),
+                                               {"harvests-per-page": 2,
+                                                "cursor": response.context["page_obj"].next_cursor})
+        self.assertEqual([h.amount for h in response.context["harvests"]], [102])
+
+        response = await self.async_client.get(reverse("harvest:harvest-list"),
+                                               {"cursor": encode_position(NEXT, datetime.date(2022, 6, 1), 10 ** 20)})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.context["page_obj"].has_previous)
+
+        response = await self.async_client.get(reverse("harvest:harvest-list"),
+                                               {"harvests-per-page": 1, "page": 2, "fruit": "cherry"})
+        self.assertEqual(response.context["harvests_n"], 2)
+        self.assertEqual([h.amount for h in response.context["harvests"]], [102])
+        self.assertFalse(response.context["page_obj"].has_next())
+
+    async def test_export(self):
+        response = await self.async_client.get(reverse("harvest:harvest-export"), {"fruit": "cherry"})
+
+        self.assertTrue(response.streaming)
+        content = await sync_to_async(lambda: b"".join(response.streaming_content))()
+        rows = list(csv.reader(StringIO(content.decode())))
+        self.assertEqual(rows[0], ["id", "date", "fruit", "amount", "price", "owner"])
+        self.assertEqual([row[3] for row in rows[1:]], ["100", "102"])
+        self.assertIn("harvests_cherry_", response["Content-Disposition"])
+
+        response = await self.async_client.get(reverse("harvest:harvest-export"), {"year": "x"})
+        self.assertEqual(response.status_code, 400)
+
+    async def test_fragments_in_database_cache(self):
+        db_cache = {"default": {"BACKEND": "django.core.cache.backends.db.DatabaseCache",
+                                "LOCATION": "harvest_test_cache"}}
+        engines = [None, "jinja2"] if importlib.util.find_spec("jinja2") else [None]
+        with override_settings(CACHES=db_cache):
+            await sync_to_async(call_command)("createcachetable", verbosity=0)
+            for engine in engines:
+                template_engines = {"index": engine, "harvest_list": engine} if engine else {}
+                with self.subTest(engine=engine), override_settings(HARVEST_TEMPLATE_ENGINES=template_engines):
+                    for url in (reverse("harvest:home"), reverse("harvest:harvest-list")):
+                        # second request renders fragments from cache
+                        for _ in range(2):
+                            response = await self.async_client.get(url)
+                            self.assertEqual(response.status_code, 200)
+                            self.assertContains(response, "cherry")
+
+    async def test_asgi_handler_streams_export_off_event_loop(self):
+        await sync_to_async(self.client.force_login)(self.user)
+        session = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+        scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "scheme": "http",
+                 "method": "GET", "path": reverse("harvest:harvest-export"), "query_string": b"fruit=cherry",
+                 "headers": [(b"host", b"testserver"), (b"cookie", f"{settings.SESSION_COOKIE_NAME}={session}".encode())],
+                 "server": ("testserver", 80)}
+        messages = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            messages.append(message)
+
+        # like test client, keep connection of test transaction open
+        request_started.disconnect(close_old_connections)
+        request_finished.disconnect(close_old_connections)
+        try:
+            await StreamingASGIHandler()(scope, receive, send)
+        finally:
+            request_started.connect(close_old_connections)
+            request_finished.connect(close_old_connections)
+
+        self.assertEqual(messages[0]["status"], 200)
+        self.assertIn((b"Content-Type", b"text/csv"), messages[0]["headers"])
+        body = b"".join(m.get("body", b"") for m in messages[1:])
+        rows = list(csv.reader(StringIO(body.decode())))
+        self.assertEqual([row[3] for row in rows[1:]], ["100", "102"])
+        self.assertFalse(messages[-1].get("more_body", False))
+
+    async def test_unchanged_page_not_modified(self):
+        first = await self.async_client.get(reverse("harvest:harvest-list"))
+        # async client takes plain header names
+        response = await self.async_client.get(reverse("harvest:harvest-list"), **{"if-none-match": first["ETag"]})
+
+        self.assertEqual(response.status_code, 304)
+        self.assertIn("no-cache", response["Cache-Control"])
+
+
+class HarvestListKeysetPaginationTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testeruser", password="testeruserpass")
+        # several harvests share a date, so pages have to be split on id as well
+        for day in range(1, 6):
+            for fruit in ("apple", "cherry", "strawberry"):
+                Harvest.objects.create(owner=self.user, fruit=fruit, date=datetime.date(2022, 6, day),
+                                       amount=100, price=10)
+        self.client.login(username="testeruser", password="testeruserpass")
+
+    def _walk(self, cursor_key, start_response, limit):
+        seen = []
+        response = start_response
+        while True:
+            page = response.context[0]['page_obj']
+            seen.extend(h.pk for h in page)
+            cursor = getattr(page, cursor_key)
+            if not cursor:
+                return seen
+            response = self.client.get(reverse("harvest:harvest-list"),
+                                       data={"harvests-per-page": limit, "cursor": cursor})
+
+    def test_cursor_pages_cover_all_harvests_in_order(self):
+        response = self.client.get(reverse("harvest:harvest-list"), data={"harvests-per-page": 4})
+        self.assertTrue(response.context[0]['cursor_mode'])
+        seen = self._walk("next_cursor", response, 4)
+        expected = list(Harvest.objects.filter(owner=self.user).order_by("date", "id").values_list("pk", flat=True))
+        self.assertEquals(seen, expected)
+
+    def test_cursor_previous_pages(self):
+        response = self.client.get(reverse("harvest:harvest-list"), data={"harvests-per-page": 4})
+        while response.context[0]['page_obj'].next_cursor:
+            response = self.client.get(reverse("harvest:harvest-list"),
+                                       data={"harvests-per-page": 4,
+                                             "cursor": response.context[0]['page_obj'].next_cursor})
+        last_page = [h.pk for h in response.context[0]['page_obj']]
+        response = self.client.get(reverse("harvest:harvest-list"),
+                                   data={"harvests-per-page": 4,
+                                         "cursor": response.context[0]['page_obj'].previous_cursor})
+        self.assertEquals(len(response.context[0]['harvests']), 4)
+        self.assertTrue(response.context[0]['page_obj'].has_next)
+        seen = self._walk("previous_cursor", response, 4)
+        self.assertEquals(len(seen) + len(last_page), 15)
+
+    def test_cursor_with_fruit_filter(self):
+        response = self.client.get(reverse("harvest:harvest-list"), data={"harvests-per-page": 2, "fruit": "cherry"})
+        page = response.context[0]['page_obj']
+        response = self.client.get(reverse("harvest:harvest-list"),
+                                   data={"harvests-per-page": 2, "fruit": "cherry", "cursor": page.next_cursor})
+        self.assertEquals([h.date.day for h in response.context[0]['harvests']], [3, 4])
+        self.assertTrue(all(h.fruit == "cherry" for h in response.context[0]['harvests']))
+
+    def test_invalid_cursor_shows_first_page(self):
+        for cursor in ("kasztan", encode_position(NEXT, datetime.date(2022, 6, 1), 10 ** 20)):
+            response = self.client.get(reverse("harvest:harvest-list"), data={"harvests-per-page": 3, "cursor": cursor})
+            self.assertEquals(response.status_code, 200)
+            self.assertFalse(response.context[0]['page_obj'].has_previous)
+            self.assertEquals(len(response.context[0]['harvests']), 3)
+
+    def test_page_number_mode_still_supported(self):
+        response = self.client.get(reverse("harvest:harvest-list"), data={"harvests-per-page": 4, "page": 4})
+        self.assertFalse(response.context[0]['cursor_mode'])
+        self.assertEquals(len(response.context[0]['harvests']), 3)
+        self.assertEquals(response.context[0]['harvests_n'], 15)
+
+    def test_deep_page_costs_same_number_of_queries(self):
+        url = reverse("harvest:harvest-list")
+        with CaptureQueriesContext(connection) as first_page:
+            response = self.client.get(url, data={"harvests-per-page": 2})
+        for _ in range(5):
+            response = self.client.get(url, data={"harvests-per-page": 2,
+                                                  "cursor": response.context[0]['page_obj'].next_cursor})
+        with CaptureQueriesContext(connection) as deep_page:
+            self.client.get(url, data={"harvests-per-page": 2,
+                                       "cursor": response.context[0]['page_obj'].next_cursor})
+        self.assertEquals(len(first_page), len(deep_page))
+        self.assertFalse(any("OFFSET" in q["sql"] or "COUNT" in q["sql"] for q in deep_page))
+
+
+class HarvestExportViewTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testeruser", password="testeruserpass")
+        self.user2 = User.objects.create_user(username="testeruser2", password="testeruserpass2")
+        create_dummy_harvests([{"owner": self.user, "year": 2022, "fruit": "raspberry", "number_of_harvests": 6},
+                               {"owner": self.user, "year": 2021, "fruit": "cherry", "number_of_harvests": 3},
+                               {"owner": self.user2, "year": 2022, "fruit": "raspberry", "number_of_harvests": 4}])
+
+    def _content(self, response) -> str:
+        return b"".join(response.streaming_content).decode()
+
+    def test_unauthenticated_has_no_access(self):
+        response = self.client.get(reverse("harvest:harvest-export"))
+        self.assertEquals(response.status_code, 302)
+        self.assertTrue("login" in response.url)
+
+    def test_csv_export_contains_only_own_harvests(self):
+        self.client.login(username="testeruser", password="testeruserpass")
+        response = self.client.get(reverse("harvest:harvest-export"))
+        self.assertEquals(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEquals(response["Content-Type"], "text/csv")
+        self.assertIn("attachment", response["Content-Disposition"])
+        lines = self._content(response).splitlines()
+        self.assertEquals(lines[0], "id,date,fruit,amount,price,owner")
+        self.assertEquals(len(lines), 10)
+        self.assertTrue(all(line.endswith(",testeruser") for line in lines[1:]))
+
+    def test_ndjson_export_with_filters(self):
+        self.client.login(username="testeruser", password="testeruserpass")
+        response = self.client.get(reverse("harvest:harvest-export"),
+                                   data={"format": "ndjson", "fruit": "raspberry", "year": 2022})
+        self.assertEquals(response["Content-Type"], "application/x-ndjson")
+        self.assertIn("harvests_raspberry_2022_", response["Content-Disposition"])
+        rows = [json.loads(line) for line in self._content(response).splitlines()]
+        self.assertEquals(len(rows), 6)
+        self.assertEquals({r["fruit"] for r in rows}, {"raspberry"})
+        self.assertEquals(set(rows[0]), {"id", "date", "fruit", "amount", "price", "owner"})
+
+    def test_export_query_count_does_not_grow_with_rows(self):
+        self.client.login(username="testeruser", password="testeruserpass")
+        with CaptureQueriesContext(connection) as queries:
+            self._content(self.client.get(reverse("harvest:harvest-export")))
+        create_dummy_harvests({"owner": self.user, "year": 2020, "fruit": "apple", "number_of_harvests": 20})
+        with self.assertNumQueries(len(queries)):
+            self._content(self.client.get(reverse("harvest:harvest-export")))
+
+    def test_bad_parameters_rejected(self):
+        self.client.login(username="testeruser", password="testeruserpass")
+        response = self.client.get(reverse("harvest:harvest-export"), data={"format": "xml"})
+        self.assertEquals(response.status_code, 400)
+        response = self.client.get(reverse("harvest:harvest-export"), data={"year": "kasztan"})
+        self.assertEquals(response.status_code, 400)
+        response = self.client.get(reverse("harvest:harvest-export"), data={"year": "10000"})
+        self.assertEquals(response.status_code, 400)
+        self.assertFalse(response.streaming)
+        for fruit in ("a\nb", 'cherry"', "banana"):
+            response = self.client.get(reverse("harvest:harvest-export"), data={"fruit": fruit})
+            self.assertEquals(response.status_code, 400)
+
+    def test_filename_from_parsed_year(self):
+        self.client.login(username="testeruser", password="testeruserpass")
+        response = self.client.get(reverse("harvest:harvest-export"), data={"year": " 02022"})
+        self.assertEquals(response.status_code, 200)
+        self.assertIn('filename="harvests_2022_', response["Content-Disposition"])
+
+
+class HarvestInstrumentationTests(TestCase):
+    middleware = ["harvest.instrumentation.ProfilingMiddleware", *settings.MIDDLEWARE]
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testeruser", password="testeruserpass")
+        Harvest.objects.create(fruit="cherry", date=datetime.date(2022, 6, 1), amount=222, price=10, owner=self.user)
+        self.client.login(username="testeruser", password="testeruserpass")
+
+    def test_profile_counts_queries_without_transaction_control(self):
+        with profile() as measured:
+            with transaction.atomic():
+                list(Harvest.objects.all())
+                Harvest.objects.count()
+
+        self.assertEqual(measured.queries, 2)
+        self.assertGreater(measured.db_time, 0)
+        self.assertGreaterEqual(measured.total_time, measured.db_time)
+
+    def test_profile_asserts_query_budget(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            with profile(budget=1):
+                list(Harvest.objects.all())
+                Harvest.objects.count()
+
+    def test_list_view_within_query_budget(self):
+        with profile(budget=settings.HARVEST_QUERY_BUDGETS["default"]) as measured:
+            response = self.client.get(reverse("harvest:harvest-list"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(measured.render_time, 0)
+
+    @skipUnless(importlib.util.find_spec("jinja2"), "Jinja2 is not installed")
+    def test_jinja2_render_time_measured(self):
+        with override_settings(HARVEST_TEMPLATE_ENGINES={"harvest_list": "jinja2"}), profile() as measured:
+            response = self.client.get(reverse("harvest:harvest-list"))
+
+        self.assertFalse(response.templates)
+        self.assertGreater(measured.render_time, 0)
+        self.assertLessEqual(measured.render_time + measured.db_time, measured.total_time)
+
+    def test_middleware_sets_server_timing_and_logs(self):
+        with override_settings(MIDDLEWARE=self.middleware), \
+                self.assertLogs("harvest.instrumentation", "INFO") as logs:
+            response = self.client.get(reverse("harvest:harvest-list"))
+
+        self.assertRegex(response.headers["Server-Timing"],
+                         r'^db;dur=[\d.]+;desc="\d+ queries", render;dur=[\d.]+;desc="Templates", '
+                         r'python;dur=[\d.]+;desc="Python", total;dur=[\d.]+;desc="Total"$')
+        self.assertEqual(logs.records[0].levelname, "INFO")
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record["view"], "harvest:harvest-list")
+        self.assertEqual(record["status"], 200)
+        self.assertFalse(record["over_budget"])
+
+    def test_middleware_flags_view_over_budget(self):
+        budgets = {"default": 10, "harvest:harvest-list": 0}
+        with override_settings(MIDDLEWARE=self.middleware, HARVEST_QUERY_BUDGETS=budgets), \
+                self.assertLogs("harvest.instrumentation", "INFO") as logs:
+            self.client.get(reverse("harvest:harvest-list"))
+
+        self.assertEqual(logs.records[0].levelname, "WARNING")
+        self.assertTrue(json.loads(logs.records[0].getMessage())["over_budget"])
+
+
+class HarvestStaticFilesTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.static_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.static_root)
+        middleware = ["harvest.static_server.StaticFilesMiddleware", *settings.MIDDLEWARE]
+        override = override_settings(STATIC_ROOT=cls.static_root, MIDDLEWARE=middleware,
+                                     STATICFILES_STORAGE="harvest.storage.CompressedManifestStaticFilesStorage")
+        override.enable()
+        cls.addClassCleanup(override.disable)
+        # collected once, compressing files with brotli at its highest quality takes a while
+        call_command("collectstatic", interactive=False, verbosity=0)
+        cls.css = Path(cls.static_root) / "harvest" / "fontawesome"
+        cls.hashed_css = next(cls.css.glob("fontawesome.*.css")).name
+
+    def test_collectstatic_writes_hashed_and_compressed_copies(self):
+        original = (self.css / self.hashed_css).read_bytes()
+        self.assertEquals(gzip.decompress((self.css / f"{self.hashed_css}.gz").read_bytes()), original)
+        if importlib.util.find_spec("brotli"):
+            import brotli
+            self.assertEquals(brotli.decompress((self.css / f"{self.hashed_css}.br").read_bytes()), original)
+        # woff2 fonts are compressed already
+        self.assertFalse(list(self.css.glob("webfonts/*.gz")))
+
+    def test_pages_link_hashed_stylesheet(self):
+        User.objects.create_user(username="testeruser", password="testeruserpass")
+        self.client.login(username="testeruser", password="testeruserpass")
+        self.assertContains(self.client.get(reverse("harvest:home")), f"/static/harvest/fontawesome/{self.hashed_css}")
+
+    def test_hashed_file_served_immutable_in_accepted_encoding(self):
+        url = f"/static/harvest/fontawesome/{self.hashed_css}"
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response["Cache-Control"], "public, max-age=31536000, immutable")
+        self.assertEquals(response["Content-Encoding"], "gzip")
+        self.assertEquals(response["Content-Type"], "text/css; charset=utf-8")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertEquals(gzip.decompress(b"".join(response.streaming_content)),
+                          (self.css / self.hashed_css).read_bytes())
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip;q=0, identity")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEquals(int(response["Content-Length"]), (self.css / self.hashed_css).stat().st_size)
+
+    def test_not_modified_and_unhashed_files(self):
+        url = f"/static/harvest/fontawesome/{self.hashed_css}"
+        etag = self.client.get(url)["ETag"]
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, 304)
+
+        response = self.client.get("/static/harvest/fontawesome/fontawesome.css")
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response["Cache-Control"], "public, max-age=60")
+        self.assertEquals(self.client.get("/static/harvest/missing.css").status_code, 404)
+
+    def test_subset_has_icons_of_templates(self):
+        icons = used_icons(template_dirs())
+        self.assertIn("fa-trash-can", icons)
+        css = (OUTPUT_DIR / "fontawesome.css").read_text()
+        rules = set(ICON_CLASS.findall(css))
+        self.assertLessEqual(icons, rules)
+        self.assertNotIn(".fa-0::before", css)
+
+    def test_subset_css_drops_unused_icon_rules(self):
+        css = (".fa-solid { font-weight: 900; }\n\n"
+               "/* icons */\n.fa-0::before { content: \"\\30\"; }\n\n"
+               ".fa-trash-can::before { content: \"\\f2ed\"; }")
+        subset, code_points = subset_css(css, {"fa-trash-can"})
+        self.assertEquals(code_points, {0xf2ed})
+        self.assertIn(".fa-solid", subset)
+        self.assertIn(".fa-trash-can", subset)
+        self.assertNotIn(".fa-0", subset)
+
+
+class HarvestApiTests(TestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        self.user = User.objects.create_user(username="testeruser", password="testeruserpass")
+        self.other = User.objects.create_user(username="otheruser", password="otheruserpass")
+        self.harvests = [Harvest.objects.create(owner=self.user, fruit=fruit, date=datetime.date(2022, 6, day),
+                                                amount=100 + day, price=decimal.Decimal("2.50"))
+                         for day in range(1, 11) for fruit in ("cherry", "apple")]
+        Harvest.objects.create(owner=self.other, fruit="cherry", date=datetime.date(2022, 6, 1),
+                               amount=100, price=decimal.Decimal("2.50"))
+        self.client.login(username="testeruser", password="testeruserpass")
+        self.url = reverse("harvest:api-harvests")
+        self.bulk_url = reverse("harvest:api-harvests-bulk")
+
+    def send(self, method: str, url: str, data=None, **extra):
+        return getattr(self.client, method)(url, json.dumps(data), content_type="application/json", **extra)
+
+    def assertRollupsMatchHarvests(self, year=2022):
+        self.assertEqual(HarvestSeasonRollup.objects.season_summary(owner=self.user, year=year),
+                         Harvest.objects.season_summary(owner=self.user, year=year))
+
+    def test_authentication_required(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_basic_authentication(self):
+        self.client.logout()
+        credentials = base64.b64encode(b"testeruser:testeruserpass").decode()
+        response = self.client.get(self.url, HTTP_AUTHORIZATION=f"Basic {credentials}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["results"]), 20)
+
+        credentials = base64.b64encode(b"testeruser:wrong").decode()
+        response = self.client.get(self.url, HTTP_AUTHORIZATION=f"Basic {credentials}")
+        self.assertEqual(response.status_code, 401)
+        self.assertIn("WWW-Authenticate", response.headers)
+
+    @override_settings(HARVEST_API_AUTH_RATE_LIMIT=(2, 60))
+    def test_failed_basic_authentication_rate_limited_per_address(self):
+        self.client.logout()
+        wrong = base64.b64encode(b"testeruser:wrong").decode()
+        for _ in range(2):
+            self.assertEqual(self.client.get(self.url, HTTP_AUTHORIZATION=f"Basic {wrong}").status_code, 401)
+        correct = base64.b64encode(b"testeruser:testeruserpass").decode()
+        with mock.patch("harvest.api.authenticate") as authenticate:
+            response = self.client.get(self.url, HTTP_AUTHORIZATION=f"Basic {correct}")
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response.headers)
+        authenticate.assert_not_called()
+
+        response = self.client.get(self.url, HTTP_AUTHORIZATION=f"Basic {correct}", REMOTE_ADDR="10.0.0.2")
+        self.assertEqual(response.status_code, 200)
+
+    def test_list_filters_and_sparse_fields(self):
+        response = self.client.get(self.url, {"fruit": "apple", "date_from": "2022-06-03",
+                                              "date_to": "2022-06-05", "fields": "date,amount"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"], [{"date": f"2022-06-0{day}", "amount": 100 + day}
+                                                      for day in (3, 4, 5)])
+
+        self.assertEqual(self.client.get(self.url, {"fields": "date,owner"}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"fruit": "banana"}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"date_from": "yesterday"}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"year": "10000"}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"year": "x"}).status_code, 400)
+
+    def test_list_cursor_pagination(self):
+        seen, url, params = [], self.url, {"limit": 6, "fields": "id"}
+        while url:
+            page = self.client.get(url, params).json()
+            seen.extend(row["id"] for row in page["results"])
+            url, params = page["next"], None
+        self.assertEqual(seen, [h.pk for h in sorted(self.harvests, key=lambda h: (h.date, h.pk))])
+
+    def test_list_cursor_out_of_range_shows_first_page(self):
+        page = self.client.get(self.url, {"cursor": encode_position(NEXT, datetime.date(2022, 6, 1), 10 ** 20),
+                                          "fields": "id"}).json()
+        self.assertIsNone(page["previous"])
+        self.assertEqual(page["results"][0]["id"], self.harvests[0].pk)
+
+    def test_list_serialized_without_model_instances(self):
+        with mock.patch.object(Harvest, "from_db", side_effect=AssertionError("model instance created")):
+            response = self.client.get(self.url, {"limit": 3})
+        self.assertEqual(response.json()["results"][0], {"id": self.harvests[0].pk, "date": "2022-06-01",
+                                                         "fruit": "cherry", "amount": 101, "price": "2.50"})
+
+    def test_create(self):
+        data = {"date": "2022-07-01", "fruit": "strawberry", "amount": 300, "price": "1.20"}
+        response = self.send("post", self.url, data)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["fruit"], "strawberry")
+        self.assertTrue(Harvest.objects.filter(owner=self.user, pk=response.json()["id"]).exists())
+        self.assertRollupsMatchHarvests()
+
+        response = self.send("post", self.url, data)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("__all__", response.json()["errors"])
+
+    def test_detail_update_and_delete(self):
+        harvest = self.harvests[0]
+        url = reverse("harvest:api-harvest-detail", args=[harvest.pk])
+        response = self.send("patch", url, {"amount": 999})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["amount"], 999)
+        harvest.refresh_from_db()
+        self.assertEqual(harvest.amount, 999)
+        self.assertRollupsMatchHarvests()
+
+        self.assertEqual(self.send("patch", url, {"amount": 1}).status_code, 400)
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertFalse(Harvest.objects.filter(pk=harvest.pk).exists())
+        self.assertRollupsMatchHarvests()
+
+    def test_other_users_harvest_not_found(self):
+        harvest = Harvest.objects.get(owner=self.other)
+        url = reverse("harvest:api-harvest-detail", args=[harvest.pk])
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.delete(url).status_code, 404)
+        self.assertTrue(Harvest.objects.filter(pk=harvest.pk).exists())
+
+    def test_bulk_create(self):
+        data = [{"date": f"2022-08-{day:02}", "fruit": "strawberry", "amount": 200, "price": "1.00"} for day in range(1, 6)]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.send("post", self.bulk_url, data)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()["results"]), 5)
+        self.assertEqual(len([q for q in queries if q["sql"].startswith("INSERT INTO \"harvest_harvest\"")]), 1)
+        self.assertRollupsMatchHarvests()
+
+    def test_bulk_create_is_all_or_nothing(self):
+        data = [{"date": "2022-08-01", "fruit": "strawberry", "amount": 200, "price": "1.00"},
+                {"date": "2022-08-02", "fruit": "strawberry", "amount": 1, "price": "1.00"},
+                {"date": "2022-06-01", "fruit": "cherry", "amount": 200, "price": "1.00"}]
+        response = self.send("post", self.bulk_url, data)
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()["errors"]
+        self.assertEqual(errors[0], {})
+        self.assertIn("amount", errors[1])
+        self.assertFalse(Harvest.objects.filter(fruit="strawberry").exists())
+
+    def test_bulk_create_reports_every_item(self):
+        # equal to initial values of batch form, which skips such rows as not filled in
+        untouched = {"date": datetime.date.today().isoformat(), "fruit": Harvest.FRUITS[0][0]}
+        data = [{"date": "2022-08-01", "fruit": "strawberry", "amount": 200, "price": "1.00"}, untouched]
+        response = self.send("post", self.bulk_url, data)
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()["errors"]
+        self.assertEqual(len(errors), 2)
+        self.assertEqual(errors[0], {})
+        self.assertTrue(errors[1])
+        self.assertFalse(Harvest.objects.filter(fruit="strawberry").exists())
+
+        untouched.update(amount=100, price="1.00")
+        response = self.send("post", self.bulk_url, data)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([row["fruit"] for row in response.json()["results"]], ["strawberry", Harvest.FRUITS[0][0]])
+        self.assertRollupsMatchHarvests(datetime.date.today().year)
+
+    def test_bulk_update(self):
+        first, second = self.harvests[:2]
+        response = self.send("patch", self.bulk_url, [{"id": first.pk, "fruit": "strawberry", "amount": 500},
+                                                      {"id": second.pk, "date": "2023-01-05"}])
+        self.assertEqual(response.status_code, 200)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.fruit, first.amount), ("strawberry", 500))
+        self.assertEqual(second.date, datetime.date(2023, 1, 5))
+        self.assertRollupsMatchHarvests(2022)
+        self.assertRollupsMatchHarvests(2023)
+
+    def test_bulk_update_rejects_duplicates(self):
+        first, second = self.harvests[:2]
+        response = self.send("patch", self.bulk_url, [{"id": first.pk, "fruit": "apple"}])
+        self.assertEqual(response.status_code, 400)
+        other = Harvest.objects.get(owner=self.other)
+        response = self.send("patch", self.bulk_url, [{"id": first.pk, "amount": 300}, {"id": other.pk}])
+        self.assertEqual(response.status_code, 404)
+        first.refresh_from_db()
+        self.assertEqual(first.amount, 101)
+
+    def test_bulk_delete(self):
+        ids = [h.pk for h in self.harvests[:4]] + [Harvest.objects.get(owner=self.other).pk]
+        response = self.send("delete", self.bulk_url, {"ids": ids})
+        self.assertEqual(response.json(), {"deleted": 4})
+        self.assertEqual(Harvest.objects.filter(owner=self.user).count(), 16)
+        self.assertTrue(Harvest.objects.filter(owner=self.other).exists())
+        self.assertRollupsMatchHarvests()
+
+    def test_bulk_delete_rejects_invalid_ids(self):
+        for ids in ([10 ** 30], [True], [0], ["1"], list(range(1, api.MAX_BULK + 2))):
+            response = self.send("delete", self.bulk_url, {"ids": ids})
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(Harvest.objects.filter(owner=self.user).count(), 20)
+
+    @override_settings(HARVEST_API_RATE_LIMIT=(2, 60))
+    def test_rate_limit_per_user(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertEqual(self.client.get(self.url)["X-RateLimit-Remaining"], "0")
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response.headers)
+
+        self.client.login(username="otheruser", password="otheruserpass")
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_session_requests_need_csrf_token(self):
+        client = Client(enforce_csrf_checks=True)
+        client.login(username="testeruser", password="testeruserpass")
+        data = {"date": "2022-07-01", "fruit": "strawberry", "amount": 300, "price": "1.20"}
+        response = client.post(self.url, json.dumps(data), content_type="application/json")
+        self.assertEqual(response.status_code, 403)
+
+
+@override_settings(HARVEST_PAGE_CACHE=True)
+class HarvestAnalyticsTests(TestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        self.user = User.objects.create_user(username="testeruser", password="testeruserpass")
+        for year, amount in ((2021, 100), (2022, 150)):
+            for month, day in ((6, 1), (6, 20), (7, 3)):
+                Harvest.objects.create(owner=self.user, fruit="cherry", date=datetime.date(year, month, day),
+                                       amount=amount, price=decimal.Decimal("2.00") * month // 6)
+        Harvest.objects.create(owner=self.user, fruit="apple", date=datetime.date(2022, 6, 2),
+                               amount=400, price=decimal.Decimal("1.00"))
+        self.client.login(username="testeruser", password="testeruserpass")
+
+    def test_monthly_series(self):
+        series = analytics.season_series(self.user, [2022], "month")[2022]
+        self.assertEqual([(row["period"], row["fruit"], row["n_harvests"], row["total_amount"]) for row in series],
+                         [(datetime.date(2022, 6, 1), "apple", 1, 400),
+                          (datetime.date(2022, 6, 1), "cherry", 2, 300),
+                          (datetime.date(2022, 7, 1), "cherry", 1, 150)])
+        self.assertEqual(series[1]["total_value"], decimal.Decimal("600.00"))
+        self.assertEqual(series[1]["avg_price"], decimal.Decimal("2.00"))
+
+    def test_weekly_series_for_fruit(self):
+        series = analytics.season_series(self.user, [2021, 2022], "week", fruit="cherry")
+        self.assertEqual([row["period"] for row in series[2021]],
+                         [datetime.date(2021, 5, 31), datetime.date(2021, 6, 14), datetime.date(2021, 6, 28)])
+        self.assertEqual(len(series[2022]), 3)
+
+    def test_year_over_year(self):
+        result = analytics.analytics(self.user, [2022], "month", fruit="cherry", compare=True)
+        june, july = result["year_over_year"]
+        self.assertEqual((june["total_amount"], june["previous_total_amount"], june["total_amount_change"]), (300, 200, 0.5))
+        self.assertEqual(july["avg_price_change"], 0.0)
+        self.assertEqual([row["year"] for row in result["series"]], [2022, 2022])
+
+    def test_seasons_cached_separately(self):
+        analytics.analytics(self.user, [2021, 2022])
+        with CaptureQueriesContext(connection) as queries:
+            analytics.analytics(self.user, [2021, 2022])
+        self.assertFalse([q for q in queries if "harvest_harvest" in q["sql"]])
+
+        # moved within season, its totals stay the same but its series don't
+        harvest = Harvest.objects.get(date=datetime.date(2022, 7, 3))
+        harvest.date = datetime.date(2022, 8, 3)
+        harvest.save()
+        reset_cache_stats()
+        result = analytics.analytics(self.user, [2021, 2022])
+        self.assertEqual(cache_stats()["hits"], 1)
+        self.assertEqual(cache_stats()["misses"], 1)
+        self.assertEqual(result["series"][-1]["period"], datetime.date(2022, 8, 1))
+
+    def test_past_seasons_cached_without_timeout(self):
+        with mock.patch.object(get_cache(), "set_many", wraps=get_cache().set_many) as set_many:
+            analytics.analytics(self.user, [2021, datetime.date.today().year])
+        timeouts = [call.kwargs["timeout"] for call in set_many.call_args_list if call.args[0]]
+        self.assertEqual(timeouts, [None, settings.HARVEST_CACHE_TIMEOUT])
+
+    def test_view(self):
+        response = self.client.get(reverse("harvest:api-analytics"), {"years": "2022", "compare": "1"})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["years"], [2022])
+        self.assertEqual(data["series"][0], {"year": 2022, "period": "2022-06-01", "fruit": "apple", "n_harvests": 1,
+                                             "total_amount": 400, "total_value": "400.00",
+                                             "avg_price": "1.00"})
+        self.assertIsNone(data["year_over_year"][0]["previous_total_amount"])
+
+        response = self.client.get(reverse("harvest:api-analytics"))
+        self.assertEqual(response.json()["years"], [2021, 2022])
+        self.assertEqual(self.client.get(reverse("harvest:api-analytics"), {"bucket": "day"}).status_code, 400)
+
+    def test_view_rejects_years_out_of_range(self):
+        for years in ("10000", "2022,0", "9999", "-5"):
+            response = self.client.get(reverse("harvest:api-analytics"), {"years": years})
+            self.assertEqual(response.status_code, 400, years)
+            self.assertIn("between", response.json()["errors"])
+        response = self.client.get(reverse("harvest:api-analytics"), {"years": "1,9998", "compare": "1"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["series"], [])
+
+
+class DatabaseConfigTests(TestCase):
+
+    def test_sqlite_profile_is_default(self):
+        config = database_config({}, Path("/srv/harvest"))
+        self.assertEqual(config["ENGINE"], "harvest.backends.sqlite3")
+        self.assertEqual(config["NAME"], Path("/srv/harvest/db.sqlite3"))
+        self.assertEqual(config["OPTIONS"], {"timeout": 5})
+
+    def test_sqlite_profile_from_environment(self):
+        environ = {"HARVEST_DB_NAME": "/tmp/h.sqlite3", "HARVEST_DB_BUSY_TIMEOUT": "2500",
+                   "HARVEST_DB_IMMEDIATE": "0", "HARVEST_DB_CONN_MAX_AGE": "30", "HARVEST_DB_SYNCHRONOUS": "FULL"}
+        config = database_config(environ, Path("/srv/harvest"))
+        self.assertEqual(config["ENGINE"], "django.db.backends.sqlite3")
+        self.assertEqual(config["NAME"], "/tmp/h.sqlite3")
+        self.assertEqual(config["CONN_MAX_AGE"], 30)
+        self.assertEqual(config["OPTIONS"], {"timeout": 2.5})
+        pragmas = sqlite_pragmas(environ)
+        self.assertEqual(pragmas["busy_timeout"], "2500")
+        self.assertEqual(pragmas["synchronous"], "FULL")
+        self.assertEqual(pragmas["journal_mode"], "WAL")
+
+    def test_postgresql_profile(self):
+        environ = {"HARVEST_DB_ENGINE": "postgresql", "HARVEST_DB_HOST": "db", "HARVEST_DB_USER": "harvest"}
+        config = database_config(environ, Path("/srv/harvest"))
+        self.assertEqual(config["ENGINE"], "django.db.backends.postgresql")
+        self.assertEqual(config["HOST"], "db")
+        self.assertEqual(config["CONN_MAX_AGE"], 60)
+        self.assertTrue(config["CONN_HEALTH_CHECKS"])
+        self.assertNotIn("DISABLE_SERVER_SIDE_CURSORS", config)
+
+    def test_postgresql_profile_behind_pgbouncer(self):
+        environ = {"HARVEST_DB_ENGINE": "postgresql", "HARVEST_DB_POOLER": "pgbouncer", "HARVEST_DB_SSLMODE": "require"}
+        config = database_config(environ, Path("/srv/harvest"))
+        self.assertEqual(config["CONN_MAX_AGE"], 0)
+        self.assertTrue(config["DISABLE_SERVER_SIDE_CURSORS"])
+        self.assertEqual(config["OPTIONS"], {"sslmode": "require"})
+
+    def test_unsupported_engine(self):
+        with self.assertRaises(ValueError):
+            database_config({"HARVEST_DB_ENGINE": "oracle"}, Path("/srv/harvest"))
+
+    def test_pragmas_applied_to_connection(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], int(settings.SQLITE_PRAGMAS["busy_timeout"]))
+            cursor.execute("PRAGMA synchronous")
+            # NORMAL
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+
+class SqliteConcurrentWritersTests(TestCase):
+
+    def setUp(self) -> None:
+        db_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, db_dir)
+        # separate file database, as test database is in memory and each thread gets its own connection
+        patcher = mock.patch.dict(connections.settings, {"writers": {
+            **connection.settings_dict, "NAME": os.path.join(db_dir, "writers.sqlite3")}})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        with connections["writers"].cursor() as cursor:
+            cursor.execute("CREATE TABLE counter (n integer)")
+            cursor.execute("INSERT INTO counter VALUES (0)")
+        self.addCleanup(connections["writers"].close)
+
+    @staticmethod
+    def _increment(times: int) -> None:
+        try:
+            for _ in range(times):
+                # read then write, deferred transaction would fail with "database is locked" when another one wrote
+                with transaction.atomic(using="writers"), connections["writers"].cursor() as cursor:
+                    cursor.execute("SELECT n FROM counter")
+                    n = cursor.fetchone()[0]
+                    cursor.execute("UPDATE counter SET n = %s", [n + 1])
+        finally:
+            connections["writers"].close()
+
+    def test_parallel_writers_wait_for_lock(self):
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            for future in [pool.submit(self._increment, 25) for _ in range(8)]:
+                future.result()
+
+        with connections["writers"].cursor() as cursor:
+            cursor.execute("SELECT n FROM counter")
+            self.assertEqual(cursor.fetchone()[0], 200)
+            cursor.execute("PRAGMA journal_mode")
+            self.assertEqual(cursor.fetchone()[0], "wal")
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    Primary is the test database, replica is a snapshot of it in a file, like a replica lagging behind.
+
+    Snapshot can't be taken inside a transaction, hence TransactionTestCase.
+    """
+
+    def setUp(self):
+        get_cache().clear()
+        routers._down_until.clear()
+        self.user = User.objects.create_user(username="testeruser", password="testeruserpass")
+        Harvest.objects.create(fruit="cherry", date=datetime.date(2022, 6, 1), amount=222, price=10, owner=self.user)
+
+        db_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, db_dir)
+        self.replica_path = os.path.join(db_dir, "replica.sqlite3")
+        connection.ensure_connection()
+        with contextlib.closing(sqlite3.connect(self.replica_path)) as replica:
+            connection.connection.backup(replica)
+
+        self.use_replica(self.replica_path)
+        # written after snapshot, so present only on primary
+        self.new_harvest = Harvest.objects.create(fruit="apple", date=datetime.date(2022, 7, 1),
+                                                  amount=100, price=2, owner=self.user)
+        self.client.login(username="testeruser", password="testeruserpass")
+
+    def use_replica(self, path: str) -> None:
+        replica = {**connection.settings_dict, "ENGINE": "django.db.backends.sqlite3", "NAME": f"file:{path}?mode=ro"}
+        patcher = mock.patch.dict(connections.settings, {"replica1": replica})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.drop_replica_connection)
+        override = override_settings(HARVEST_DB_REPLICAS=["replica1"])
+        override.enable()
+        self.addCleanup(override.disable)
+
+    @staticmethod
+    def drop_replica_connection() -> None:
+        # connection is kept per alias, next one has to be opened with new settings
+        connections["replica1"].close()
+        del connections["replica1"]
+
+    def listed_ids(self) -> set[int]:
+        response = self.client.get(reverse("harvest:harvest-list"), {"page": 1})
+        self.assertEqual(response.status_code, 200)
+        return {harvest.pk for harvest in response.context["harvests"]}
+
+    def test_only_reads_in_replica_scope_go_to_replica(self):
+        self.assertEqual(Harvest.objects.count(), 2)
+        with replica_reads() as alias:
+            self.assertEqual(alias, "replica1")
+            self.assertEqual(Harvest.objects.count(), 1)
+            harvest = Harvest.objects.get()
+            harvest.amount = 333
+            harvest.save()
+        self.assertEqual(Harvest.objects.get(pk=harvest.pk).amount, 333)
+        with replica_reads(pinned=True) as alias:
+            self.assertIsNone(alias)
+            self.assertEqual(Harvest.objects.count(), 2)
+
+    def test_bulk_delete_in_replica_scope_goes_to_primary(self):
+        with replica_reads() as alias:
+            self.assertEqual(alias, "replica1")
+            deleted = Harvest.objects.filter(owner=self.user).bulk_delete()
+        self.assertEqual(deleted, 2)
+        self.assertFalse(Harvest.objects.exists())
+        self.assertFalse(HarvestSeasonRollup.objects.exists())
+
+    @override_settings(HARVEST_DB_REPLICA_PIN=0)
+    def test_list_reads_from_replica(self):
+        self.assertNotIn(self.new_harvest.pk, self.listed_ids())
+
+    @override_settings(HARVEST_DB_REPLICA_PIN=60)
+    def test_list_reads_own_writes_from_primary(self):
+        # written by another client, replica is read
+        self.assertNotIn(self.new_harvest.pk, self.listed_ids())
+        response = self.client.post(reverse("harvest:harvest-add"),
+                                    {"date": "2022-08-01", "fruit": "cherry", "amount": 300, "price": 10})
+        self.assertIn(routers.WROTE_COOKIE, response.cookies)
+        listed = self.listed_ids()
+        self.assertIn(self.new_harvest.pk, listed)
+        self.assertIn(Harvest.objects.get(date=datetime.date(2022, 8, 1)).pk, listed)
+
+    @override_settings(HARVEST_DB_REPLICA_PIN=60)
+    @override_settings(HARVEST_PAGE_CACHE=True)
+    def test_pin_kept_by_client_not_process(self):
+        # pinned by the cookie only, e.g. when next request is served by another process
+        self.client.cookies[routers.WROTE_COOKIE] = str(time.time() - 120)
+        self.assertNotIn(self.new_harvest.pk, self.listed_ids())
+        self.assertNotContains(self.client.get(reverse("harvest:harvest-list")), "<td>apple</td>")
+        # page and fragments read from replica aren't served from cache to pinned client
+        self.client.cookies[routers.WROTE_COOKIE] = str(time.time())
+        self.assertIn(self.new_harvest.pk, self.listed_ids())
+        self.assertContains(self.client.get(reverse("harvest:harvest-list")), "<td>apple</td>")
+        self.client.cookies[routers.WROTE_COOKIE] = str(time.time() - 120)
+        self.assertNotIn(self.new_harvest.pk, self.listed_ids())
+
+    @override_settings(HARVEST_DB_REPLICA_PIN=0)
+    def test_missing_replica_falls_back_to_primary(self):
+        self.drop_replica_connection()
+        self.use_replica(self.replica_path + ".missing")
+        self.assertIn(self.new_harvest.pk, self.listed_ids())
+        self.assertIn("replica1", routers._down_until)
+
+    def test_commands_read_from_replica(self):
+        out = StringIO()
+        call_command("harvest_count", stdout=out)
+        self.assertEqual(out.getvalue().strip(), "Harvests in db: 1")
+
+        with override_settings(HARVEST_DB_REPLICAS=[]):
+            out = StringIO()
+            call_command("harvest_count", stdout=out)
+        self.assertEqual(out.getvalue().strip(), "Harvests in db: 2")
+
+
 class CustomCommandDeleteHarvestTests(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(username="testeruser", password="testeruserpass")
@@ -559,6 +2110,63 @@ class CustomCommandDeleteHarvestTests(TestCase):
         self.assertEquals(harvests_count-1, Harvest.objects.count())
 
 
+class CustomCommandBulkDeleteHarvestTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testeruser", password="testeruserpass")
+        create_dummy_harvests([{"owner": self.user, "year": 2021, "fruit": "cherry", "number_of_harvests": 5},
+                               {"owner": self.user, "year": 2022, "fruit": "cherry", "number_of_harvests": 4},
+                               {"owner": self.user, "year": 2022, "fruit": "apple", "number_of_harvests": 6}])
+
+    def assertRollupsMatchHarvests(self):
+        for year in (2021, 2022):
+            self.assertEquals(HarvestSeasonRollup.objects.season_summary(owner=self.user, year=year),
+                              Harvest.objects.season_summary(owner=self.user, year=year))
+
+    def test_delete_older_than(self):
+        out = StringIO()
+        call_command("delete_harvest", older_than=datetime.date(2022, 1, 1), stdout=out)
+        self.assertIn("Deleted 5 harvests", out.getvalue())
+        self.assertEquals(Harvest.objects.count(), 10)
+        self.assertRollupsMatchHarvests()
+
+    def test_delete_fruit_in_batches(self):
+        out = StringIO()
+        call_command("delete_harvest", fruit="cherry", batch_size=4, stdout=out)
+        self.assertIn("Deleted 9 harvests", out.getvalue())
+        self.assertFalse(Harvest.objects.filter(fruit="cherry").exists())
+        self.assertRollupsMatchHarvests()
+
+    def test_delete_is_set_based(self):
+        with CaptureQueriesContext(connection) as queries:
+            call_command("delete_harvest", fruit="cherry", stdout=StringIO())
+        queries = [q["sql"] for q in queries if "SAVEPOINT" not in q["sql"]]
+        # select ids, grouped totals, delete, update and cleanup of 2 season rollups, final empty select
+        self.assertEquals(len(queries), 8)
+
+    def test_delete_ids_from_file(self):
+        ids = list(Harvest.objects.filter(fruit="apple").values_list("id", flat=True))[:3]
+        with tempfile.NamedTemporaryFile(mode="w", suffix=".txt", delete=False) as ids_file:
+            ids_file.write("# harvests to delete\n" + "\n".join(map(str, ids)) + "\n\n")
+        try:
+            out = StringIO()
+            call_command("delete_harvest", ids_from_file=ids_file.name, batch_size=2, stdout=out)
+        finally:
+            os.remove(ids_file.name)
+        self.assertIn("Deleted 3 harvests", out.getvalue())
+        self.assertFalse(Harvest.objects.filter(pk__in=ids).exists())
+        self.assertRollupsMatchHarvests()
+
+    def test_dry_run_deletes_nothing(self):
+        out = StringIO()
+        call_command("delete_harvest", fruit="apple", dry_run=True, stdout=out)
+        self.assertIn("Would delete 6 harvests", out.getvalue())
+        self.assertEquals(Harvest.objects.count(), 15)
+
+    def test_no_selection_rejected(self):
+        with self.assertRaises(CommandError):
+            call_command("delete_harvest", stdout=StringIO())
+
+
 class CustomCommandDeleteUserTests(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(username="testeruser", password="testeruserpass")
@@ -582,6 +2190,57 @@ class CustomCommandDeleteUserTests(TestCase):
         self.assertEquals(harvests_count, 0)
 
 
+class CustomCommandBulkDeleteUserTests(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(username=f"testeruser{i}", password="testeruserpass")
+                      for i in range(4)]
+        for user in self.users:
+            create_dummy_harvests({"owner": user, "year": 2022, "fruit": "raspberry", "number_of_harvests": 3})
+        User.objects.filter(pk=self.users[3].pk).update(date_joined=datetime.datetime(2000, 1, 1,
+                                                                                        tzinfo=datetime.timezone.utc))
+
+    def test_delete_older_than(self):
+        out = StringIO()
+        call_command("delete_user", older_than=datetime.date(2001, 1, 1), stdout=out)
+        self.assertIn("Deleted 1 users and 3 harvests", out.getvalue())
+        self.assertFalse(User.objects.filter(pk=self.users[3].pk).exists())
+        self.assertEquals(Harvest.objects.count(), 9)
+        self.assertFalse(HarvestSeasonRollup.objects.filter(owner_id=self.users[3].pk).exists())
+
+    def test_delete_ids_from_file_in_batches(self):
+        with tempfile.NamedTemporaryFile(mode="w", suffix=".txt", delete=False) as ids_file:
+            ids_file.write("\n".join(str(u.pk) for u in self.users[:3]) + "\n777\n")
+        try:
+            out = StringIO()
+            call_command("delete_user", ids_from_file=ids_file.name, batch_size=2, stdout=out)
+        finally:
+            os.remove(ids_file.name)
+        self.assertIn("Deleted 3 users and 9 harvests", out.getvalue())
+        self.assertEquals(list(User.objects.values_list("pk", flat=True)), [self.users[3].pk])
+        self.assertEquals(HarvestSeasonRollup.objects.count(), 1)
+
+    def test_staff_kept_unless_included(self):
+        User.objects.filter(pk=self.users[3].pk).update(is_superuser=True)
+        admin = User.objects.create_user(username="staffuser", password="staffuserpass", is_staff=True)
+        User.objects.filter(pk=admin.pk).update(date_joined=datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc))
+
+        out = StringIO()
+        call_command("delete_user", older_than=datetime.date(2001, 1, 1), stdout=out)
+        self.assertIn("Deleted 0 users and 0 harvests", out.getvalue())
+        self.assertEquals(User.objects.count(), 5)
+
+        out = StringIO()
+        call_command("delete_user", older_than=datetime.date(2001, 1, 1), include_staff=True, stdout=out)
+        self.assertIn("Deleted 2 users and 3 harvests", out.getvalue())
+        self.assertEquals(User.objects.count(), 3)
+
+    def test_dry_run_deletes_nothing(self):
+        out = StringIO()
+        call_command("delete_user", older_than=datetime.date(2001, 1, 1), dry_run=True, stdout=out)
+        self.assertIn("Would delete 1 users and 3 harvests", out.getvalue())
+        self.assertEquals(User.objects.count(), 4)
+
+
 class CustomCommandGenCsvTests(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(username="testeruser", password="testeruserpass")
@@ -623,6 +2282,57 @@ class CustomCommandGenCsvTests(TestCase):
         if os.path.exists(filepath):
             os.remove(filepath)
 
+    def test_streamed_in_chunks_with_single_query(self):
+        create_dummy_harvests({"owner": self.user,
+                               "year": 2021,
+                               "fruit": "cherry",
+                               "number_of_harvests": 20})
+        out = StringIO()
+
+        opts = {"test": 1, "chunk_size": 4}
+
+        filename = f"test_harvests_{datetime.date.today()}.csv"
+        filepath = settings.BASE_DIR / "csv_out" / filename
+
+        with self.assertNumQueries(1):
+            call_command("gen_csv", stdout=out, **opts)
+        self.assertIn("Exported 26 harvests", out.getvalue())
+
+        with open(filepath) as csv_file:
+            lines = csv_file.read().splitlines()
+        os.remove(filepath)
+
+        self.assertEquals(lines[0], "id,date,fruit,amount,price,owner")
+        self.assertEquals(len(lines), 27)
+        self.assertTrue(lines[1].endswith(",testeruser"))
+
+    def test_partitioned_export_with_manifest(self):
+        create_dummy_harvests({"owner": self.user,
+                               "year": 2021,
+                               "fruit": "cherry",
+                               "number_of_harvests": 4})
+        out = StringIO()
+
+        opts = {"test": 1, "partition_by": "year", "gzip": True, "workers": 2}
+
+        dirpath = settings.BASE_DIR / "csv_out" / f"test_harvests_{datetime.date.today()}"
+        try:
+            call_command("gen_csv", stdout=out, **opts)
+            self.assertIn("Exported 10 harvests to 2 files", out.getvalue())
+
+            with open(dirpath / "manifest.json") as manifest_file:
+                manifest = json.load(manifest_file)
+            self.assertEquals(manifest["rows"], 10)
+            self.assertEquals([(f["key"], f["rows"]) for f in manifest["files"]], [(2021, 4), (2022, 6)])
+
+            for entry in manifest["files"]:
+                with gzip.open(dirpath / entry["file"], mode="rt") as csv_file:
+                    self.assertEquals(len(csv_file.read().splitlines()), entry["rows"] + 1)
+                with open(dirpath / entry["file"], mode="rb") as csv_file:
+                    self.assertEquals(hashlib.sha256(csv_file.read()).hexdigest(), entry["sha256"])
+        finally:
+            shutil.rmtree(dirpath, ignore_errors=True)
+
     def test_user_not_existing(self):
         out = StringIO()
 
@@ -633,6 +2343,158 @@ class CustomCommandGenCsvTests(TestCase):
         self.assertIn(f"User with given id ({777}) does not exist", out.getvalue())
 
 
+class CustomCommandImportHarvestsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testeruser", password="testeruserpass")
+        self.user2 = User.objects.create_user(username="testeruser2", password="testeruserpass2")
+        Harvest.objects.create(owner=self.user, fruit="cherry", date=datetime.date(2022, 6, 1),
+                               amount=100, price=10)
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def _write(self, name: str, content: str) -> str:
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, mode="w") as f:
+            f.write(content)
+        return path
+
+    def test_import_csv_with_rejects(self):
+        path = self._write("harvests.csv", "id,date,fruit,amount,price,owner\n"
+                                           "1,2022-06-01,cherry,200,12,testeruser\n"
+                                           "2,2022-06-02,cherry,200,12,testeruser\n"
+                                           "3,2022-06-02,cherry,300,12,testeruser\n"
+                                           "4,2022-06-03,apple,200,12.50,testeruser2\n"
+                                           "5,1990-06-03,apple,200,12,testeruser\n"
+                                           "6,2022-06-04,kasztan,5,100,testeruser\n"
+                                           "7,2022-06-04,apple,200,12,nobody\n")
+        out = StringIO()
+        call_command("import_harvests", path, batch_size=3, stdout=out)
+        self.assertIn("Processed 7 rows", out.getvalue())
+        self.assertIn("2 created, 0 updated, 5 rejected", out.getvalue())
+
+        self.assertEquals(Harvest.objects.filter(owner=self.user).count(), 2)
+        self.assertEquals(Harvest.objects.filter(owner=self.user2).count(), 1)
+        self.assertEquals(Harvest.objects.get(owner=self.user, date=datetime.date(2022, 6, 1)).amount, 100)
+        self.assertEquals(HarvestSeasonRollup.objects.count_harvests(owner=self.user), 2)
+        self.assertEquals(HarvestSeasonRollup.objects.count_harvests(owner=self.user2), 1)
+
+        with open(f"{path}.rejects.csv") as rejects_file:
+            rejects = sorted(csv.DictReader(rejects_file), key=lambda r: r["id"])
+        self.assertEquals([r["id"] for r in rejects], ["1", "3", "5", "6", "7"])
+        self.assertIn("already exists", rejects[0]["error"])
+        self.assertIn("earlier row", rejects[1]["error"])
+        self.assertIn("1997", rejects[2]["error"])
+        self.assertIn("fruit", rejects[3]["error"])
+        self.assertIn("amount", rejects[3]["error"])
+        self.assertIn("price", rejects[3]["error"])
+        self.assertIn("does not exist", rejects[4]["error"])
+
+    def test_import_ndjson_update_existing_for_user(self):
+        path = self._write("harvests.ndjson",
+                           '{"date": "2022-06-01", "fruit": "cherry", "amount": 700, "price": "3.50"}\n'
+                           '{"date": "2022-06-05", "fruit": "cherry", "amount": 300, "price": "2"}\n'
+                           'not json\n')
+        out = StringIO()
+        call_command("import_harvests", path, user_id=self.user2.pk, stdout=out)
+        self.assertIn("2 created, 0 updated, 1 rejected", out.getvalue())
+
+        call_command("import_harvests", path, user_id=self.user.pk, update_existing=True, stdout=out)
+        self.assertIn("1 created, 1 updated, 1 rejected", out.getvalue())
+        harvest = Harvest.objects.get(owner=self.user, date=datetime.date(2022, 6, 1))
+        self.assertEquals((harvest.amount, harvest.price), (700, decimal.Decimal("3.50")))
+        self.assertEquals(HarvestSeasonRollup.objects.season_summary(owner=self.user, year=2022),
+                          Harvest.objects.season_summary(owner=self.user, year=2022))
+
+    def test_one_duplicate_lookup_per_batch(self):
+        lines = "".join(f"2021-06-{day:02d},apple,100,2,testeruser\n" for day in range(1, 21))
+        path = self._write("harvests.csv", "date,fruit,amount,price,owner\n" + lines)
+        with CaptureQueriesContext(connection) as queries:
+            call_command("import_harvests", path, batch_size=10, stdout=StringIO())
+        lookups = [q for q in queries if q["sql"].startswith('SELECT "harvest_harvest"."owner_id", "harvest_harvest"."date"')]
+        self.assertEquals(len(lookups), 2)
+        self.assertEquals(Harvest.objects.filter(fruit="apple").count(), 20)
+
+    def test_rows_inserted_meanwhile_not_counted_as_created(self):
+        path = self._write("harvests.csv", "date,fruit,amount,price,owner\n"
+                                           "2022-06-01,cherry,200,12,testeruser\n"
+                                           "2022-06-02,cherry,200,12,testeruser\n")
+        real_existing_keys = Harvest.objects.existing_keys
+        lookups = []
+
+        def existing_keys(keys):
+            # first lookup misses harvest of 2022-06-01, like one inserted by another process right after it
+            lookups.append(keys)
+            return set() if len(lookups) == 1 else real_existing_keys(keys)
+
+        out = StringIO()
+        with mock.patch.object(type(Harvest.objects), "existing_keys", side_effect=existing_keys):
+            call_command("import_harvests", path, stdout=out)
+        self.assertEquals(len(lookups), 2)
+        self.assertIn("1 created, 0 updated, 1 rejected", out.getvalue())
+        self.assertEquals(Harvest.objects.get(owner=self.user, date=datetime.date(2022, 6, 1)).amount, 100)
+        self.assertEquals(HarvestSeasonRollup.objects.count_harvests(owner=self.user), 2)
+
+    def test_file_not_existing(self):
+        with self.assertRaises(CommandError):
+            call_command("import_harvests", os.path.join(self.tmp_dir, "missing.csv"), stdout=StringIO())
+
+
+class CustomCommandSeedHarvestsTests(TestCase):
+    def seed(self, **options) -> str:
+        out = StringIO()
+        call_command("seed_harvests", stdout=out, **{"first_year": 2020, "last_year": 2021, **options})
+        return out.getvalue()
+
+    def test_seed_creates_valid_harvests_split_between_users(self):
+        out = self.seed(harvests=1001, users=3, password="seedpass")
+
+        self.assertIn("Created 3 users and 1001 harvests", out)
+        counts = dict(Harvest.objects.values_list("owner__username").annotate(n=Count("id")))
+        self.assertEqual(counts, {"seed0": 334, "seed1": 334, "seed2": 333})
+        for harvest in Harvest.objects.all()[:50]:
+            harvest.full_clean()
+            self.assertIn(harvest.date.month, range(5, 10))
+        self.assertTrue(self.client.login(username="seed1", password="seedpass"))
+        user = User.objects.get(username="seed2")
+        self.assertEqual(HarvestSeasonRollup.objects.season_summary(user, 2021),
+                         Harvest.objects.season_summary(user, 2021))
+
+    def test_seed_is_deterministic(self):
+        def generated():
+            return list(Harvest.objects.order_by("owner__username", "date", "fruit")
+                        .values_list("owner__username", "date", "fruit", "amount", "price"))
+
+        self.seed(harvests=200, users=2, seed=5)
+        first = generated()
+        Harvest.objects.all().delete()
+        User.objects.all().delete()
+        self.seed(harvests=200, users=2, seed=5)
+
+        self.assertEqual(generated(), first)
+        Harvest.objects.all().delete()
+        User.objects.all().delete()
+        self.seed(harvests=200, users=2, seed=6)
+        self.assertNotEqual(generated(), first)
+
+    def test_seed_uses_whole_years_when_seasons_are_full(self):
+        self.seed(harvests=2000, users=1)
+
+        self.assertEqual(Harvest.objects.count(), 2000)
+        self.assertTrue(Harvest.objects.filter(date__month__in=[1, 2, 3, 4, 10, 11, 12]).exists())
+
+    def test_seed_errors(self):
+        with self.assertRaises(CommandError):
+            self.seed(harvests=3000, users=1)
+        with self.assertRaises(CommandError):
+            self.seed(first_year=1990)
+        User.objects.create_user(username="seed0")
+        with self.assertRaises(CommandError):
+            self.seed(harvests=10, users=1)
+        self.assertFalse(Harvest.objects.exists())
+
+
 class CustomCommandHarvestCountTests(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(username="testeruser", password="testeruserpass")
@@ -755,3 +2617,27 @@ class CustomCommandListUsersTests(TestCase):
         self.assertIn("3", out.getvalue())
         self.assertIn("7", out.getvalue())
 
+    def test_list_users_constant_number_of_queries(self):
+        for i in range(3):
+            user = User.objects.create_user(username=f"testeruser{i}", password="testeruserpass")
+            create_dummy_harvests({"owner": user, "year": 2022, "fruit": "cherry", "number_of_harvests": i + 1})
+        with self.assertNumQueries(2):
+            call_command("list_users", stdout=StringIO())
+
+        for i in range(3, 10):
+            User.objects.create_user(username=f"testeruser{i}", password="testeruserpass")
+        with self.assertNumQueries(2):
+            call_command("list_users", stdout=StringIO())
+
+    def test_list_users_json_sorted_with_limit_and_offset(self):
+        for i, n in enumerate([2, 5, 1, 4]):
+            user = User.objects.create_user(username=f"testeruser{i}", password="testeruserpass")
+            create_dummy_harvests({"owner": user, "year": 2022, "fruit": "cherry", "number_of_harvests": n})
+        out = StringIO()
+        with self.assertNumQueries(1):
+            call_command("list_users", format="json", order_by="harvests", desc=True,
+                         offset=1, limit=2, stdout=out)
+        users = json.loads(out.getvalue())
+        self.assertEquals([(u["username"], u["harvests"]) for u in users],
+                          [("testeruser3", 4), ("testeruser0", 2)])
+
@@ -1,13 +1,23 @@
+from django.conf import settings
 from django.urls import path
 
-from . import views
+from . import api, async_views, views
 
 app_name = "harvest"
 
+read_views = async_views if settings.HARVEST_ASYNC_VIEWS else views
+
 urlpatterns = [
-    path('', views.index, name="home"),
-    path('list/', views.harvest_list, name="harvest-list"),
+    path('', read_views.index, name="home"),
+    path('list/', read_views.harvest_list, name="harvest-list"),
     path('add/', views.harvest_add, name="harvest-add"),
+    path('add/batch/', views.harvest_add_batch, name="harvest-add-batch"),
     path('edit/<int:pk>', views.harvest_edit, name="harvest-edit"),
     path('delete/<int:pk>', views.harvest_delete, name="harvest-delete"),
+    # streamed by sync view under ASGI too, see Harvest/handlers.py
+    path('export/', views.harvest_export, name="harvest-export"),
+    path('api/harvests/', api.harvests, name="api-harvests"),
+    path('api/harvests/bulk/', api.harvests_bulk, name="api-harvests-bulk"),
+    path('api/harvests/<int:pk>/', api.harvest_detail, name="api-harvest-detail"),
+    path('api/analytics/', api.harvest_analytics, name="api-analytics"),
 ]
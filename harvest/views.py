@@ -1,57 +1,136 @@
 import datetime
+import hashlib
 import traceback
-
-from django.core.paginator import Paginator
-from django.db.models.functions import ExtractYear
-from django.http import HttpRequest, HttpResponse, Http404
-from django.shortcuts import render, redirect, get_object_or_404
+from functools import partial, wraps
+from typing import Optional
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.paginator import Page, Paginator
+from django.db import IntegrityError, transaction
+from django.db.models import QuerySet
+from django.http import HttpRequest, HttpResponse, HttpResponseBadRequest, Http404, StreamingHttpResponse
+from django.shortcuts import redirect, get_object_or_404
 from django.urls import reverse
+from django.utils import timezone
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from django.contrib.auth.decorators import login_required
 
-from .forms import CustomSignupForm, HarvestForm
-from .models import Harvest
+from .cache import cached_for_user, caching_pages, data_state, read_version
+from .export import stream_csv, stream_ndjson
+from .forms import CustomSignupForm, HarvestForm, HarvestFormSet
+from .instrumentation import render
+from .models import Harvest, HarvestSeasonRollup
+from .pagination import keyset_paginate
+from .routers import replica_reads, wrote_recently
 
 
-def index(request: HttpRequest):
-    """Homepage view displaying seasonal summary and 5 last harvests"""
-    # 5 recent harvests
-    context = {"date": datetime.date.today()}
+def _data_state(request: HttpRequest) -> Optional[tuple[str, Optional[datetime.datetime]]]:
+    """Version and last change of user's harvests, looked up once per request"""
+    if not request.user.is_authenticated:
+        return None
+    if not hasattr(request, "_harvest_data_state"):
+        request._harvest_data_state = data_state(request.user)
+    return request._harvest_data_state
+
+
+def _conditional_get() -> bool:
+    """Whether pages are validated with data state, which is only right with cache shared by all processes"""
+    return getattr(settings, "HARVEST_CONDITIONAL_GET", False)
+
+
+def harvests_etag(request: HttpRequest, *args, **kwargs) -> Optional[str]:
+    """ETag of page depending only on user's harvests, url with query and current date"""
+    state = _data_state(request) if _conditional_get() else None
+    if state is None:
+        return None
+    raw = f"{state[0]}|{request.get_full_path()}|{datetime.date.today()}"
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def harvests_last_modified(request: HttpRequest, *args, **kwargs) -> Optional[datetime.datetime]:
+    """Time of last change of user's harvests, but not earlier than start of the day shown on page"""
+    state = _data_state(request) if _conditional_get() else None
+    if state is None or state[1] is None:
+        return None
+    today = timezone.make_aware(datetime.datetime.combine(datetime.date.today(), datetime.time()))
+    return max(state[1], today)
+
+
+def conditional_harvests_page(view):
+    """Make browser revalidate page on each use, answered with 304 without running view while harvests don't change"""
+    view = condition(etag_func=harvests_etag, last_modified_func=harvests_last_modified)(view)
+    return cache_control(private=True, no_cache=True)(view)
+
+
+def fragment_context(request: HttpRequest) -> dict:
+    """
+    Context of {% cache %} fragments showing user's harvests, keyed on their data version.
+
+    Versions change when harvests do, so fragments are never invalidated, just no longer looked up.
+    Without page caching, timeout is 0, with which fragments are rendered every time and not stored.
+    """
+    return {"data_version": read_version(_data_state(request)[0]),
+            "fragment_cache": getattr(settings, "HARVEST_CACHE_ALIAS", "default"),
+            "fragment_timeout": getattr(settings, "HARVEST_CACHE_TIMEOUT", 3600) if caching_pages() else 0}
 
-    if request.user.is_authenticated:
-        season = request.GET.get(key="season", default=datetime.date.today().year)
 
-        seasons = Harvest.objects.filter(owner=request.user)\
-            .annotate(year=ExtractYear('date')).values('year')
+def template_engine(view_name: str) -> Optional[str]:
+    """Template engine configured for view in HARVEST_TEMPLATE_ENGINES, None for the first one having the template"""
+    return getattr(settings, "HARVEST_TEMPLATE_ENGINES", {}).get(view_name)
 
-        seasons = set([s['year'] for s in seasons])
 
-        recent_harvests = Harvest.objects.filter(owner=request.user).order_by("date").all()[:5]
+def reads_from_replica(view):
+    """Make view read from a replica, unless user has just changed their harvests (read-your-writes)"""
+    @wraps(view)
+    def wrapper(request: HttpRequest, *args, **kwargs):
+        with replica_reads(pinned=wrote_recently(request)):
+            return view(request, *args, **kwargs)
+    return wrapper
 
-        # dict with season summary:
-        all_harvests = Harvest.objects.filter(date__gte=datetime.date(year=season, month=1, day=1),
-                                              owner=request.user).all()
 
-        harvested_by_fruit = {}
-        for h in all_harvests:
-            if not harvested_by_fruit.get(h.fruit):
-                harvested_by_fruit[h.fruit] = [h.amount, h.profits]
-            else:
-                harvested_by_fruit[h.fruit][0] += h.amount
-                harvested_by_fruit[h.fruit][1] += h.profits
+def chosen_season(request: HttpRequest) -> int:
+    """Season picked with ?season=, current one when missing, invalid or out of range of dates"""
+    try:
+        season = int(request.GET.get(key="season", default=datetime.date.today().year))
+    except ValueError:
+        return datetime.date.today().year
+    return season if datetime.MINYEAR <= season <= datetime.MAXYEAR else datetime.date.today().year
 
-        season_summary = {
-            "n_harvests": len(all_harvests),
-            "fruit_summary": harvested_by_fruit,
-        }
 
+def dashboard_data(user: User, season: int) -> dict:
+    """Data of dashboard depending on user harvests, cached until they change"""
+    seasons = HarvestSeasonRollup.objects.seasons(owner=user)
+
+    recent_harvests = list(Harvest.objects.filter(owner=user).order_by("date").all()[:5])
+
+    # dict with season summary, read from materialized rollups
+    season_summary = HarvestSeasonRollup.objects.season_summary(owner=user, year=season)
+
+    return {"recent_harvests": recent_harvests,
+            "season_summary": season_summary,
+            "seasons": seasons}
+
+
+@conditional_harvests_page
+@reads_from_replica
+def index(request: HttpRequest):
+    """Homepage view displaying seasonal summary and 5 last harvests"""
+    # 5 recent harvests
+    context = {"date": datetime.date.today()}
+
+    if request.user.is_authenticated:
+        season = chosen_season(request)
         context['chosen_season'] = season
-        context['recent_harvests'] = recent_harvests
-        context['season_summary'] = season_summary
-        context['seasons'] = seasons
+        context.update(fragment_context(request))
+        context.update(cached_for_user(request.user, ("index", season),
+                                       partial(dashboard_data, request.user, season)))
 
     return render(request,
                   template_name="harvest/index.html",
-                  context=context)
+                  context=context,
+                  using=template_engine("index"))
 
 
 def sign_up(request: HttpRequest):
@@ -73,39 +152,103 @@ def sign_up(request: HttpRequest):
                   })
 
 
-@login_required
-def harvest_list(request: HttpRequest):
-    """View for listing user harvests with pagination and filtering by year and fruit"""
+# choices of harvests per page offered by list page
+PAGE_LIMITS = range(1, 11)
+
+LIST_FIELDS = {"fruit": "Fruit",
+               "date": "Date",
+               "amount": "Harvested",
+               "price": "Price",
+               "profits": "Profits"}
+
+
+def list_params(request: HttpRequest) -> tuple[QuerySet, str, int, Optional[str]]:
+    """
+    Read filter and pagination parameters of harvest list.
+
+    :return: tuple (harvests of user filtered by fruit, fruit, harvests per page, page number or None in cursor mode)
+    """
     harvests = Harvest.objects.filter(owner=request.user)
-    fruit = request.GET.get(key="fruit")
+    fruit = request.GET.get(key="fruit", default="all")
 
     if fruit and fruit != "all":
         harvests = harvests.filter(fruit=fruit)
 
-    harvests_n = len(harvests)
-    limit = int(request.GET.get(key="harvests-per-page", default=5))
+    try:
+        limit = int(request.GET.get(key="harvests-per-page", default=5))
+    except ValueError:
+        limit = 5
+    # sizes offered in the form only, larger pages would defeat the cap and overflow SQLite integers
+    limit = min(max(limit, PAGE_LIMITS[0]), PAGE_LIMITS[-1])
+
+    return harvests, fruit, limit, request.GET.get(key="page")
+
 
-    paginator = Paginator(harvests, per_page=limit)
-    page_number = request.GET.get(key="page", default=1)
-    page_obj = paginator.get_page(page_number)
+def numbered_page(paginator: Paginator, page_number: Optional[str]) -> tuple[list, int, int]:
+    """Harvests, number of page and total count of harvests, in picklable form for caching"""
+    page = paginator.get_page(page_number)
+    return list(page.object_list), page.number, paginator.count
 
-    fields = {"fruit": "Fruit",
-              "date": "Date",
-              "amount": "Harvested",
-              "price": "Price",
-              "profits": "Profits"}
+
+@login_required
+@conditional_harvests_page
+@reads_from_replica
+def harvest_list(request: HttpRequest):
+    """
+    View for listing user harvests with pagination and filtering by year and fruit
+
+    Pages are located with opaque ?cursor= tokens seeking on (date, id), so deep pages
+    cost the same as the first one. Numbered ?page= links are still served with OFFSET.
+    """
+    harvests, fruit, limit, page_number = list_params(request)
+    cursor_mode = page_number is None
+
+    if cursor_mode:
+        cursor = request.GET.get(key="cursor")
+        page_obj = cached_for_user(request.user, ("list", fruit, "cursor", cursor, limit),
+                                   partial(keyset_paginate, harvests, cursor=cursor, limit=limit))
+        # total is counted from rollups and only if template shows it
+        harvests_n = partial(HarvestSeasonRollup.objects.count_harvests,
+                             owner=request.user, fruit=None if fruit == "all" else fruit)
+    else:
+        paginator = Paginator(harvests, per_page=limit)
+        # count is restored from cache too, so that page links don't query it again
+        object_list, number, paginator.count = cached_for_user(
+            request.user, ("list", fruit, "page", page_number, limit), partial(numbered_page, paginator, page_number))
+        page_obj = Page(object_list, number, paginator)
+        harvests_n = paginator.count
 
     return render(request,
                   template_name="harvest/harvest_list.html",
                   context={
-                      "fields": fields,
+                      "fields": LIST_FIELDS,
+                      "page_limits": PAGE_LIMITS,
                       "limit": limit,
                       "fruit": fruit,
                       "user": request.user,
                       "harvests_n": harvests_n,
+                      "cursor_mode": cursor_mode,
                       "page_obj": page_obj,
-                      "harvests": page_obj.object_list
-                  })
+                      "page_key": f"cursor {cursor}" if cursor_mode else f"page {page_obj.number}",
+                      "harvests": page_obj.object_list,
+                      **fragment_context(request)
+                  },
+                  using=template_engine("harvest_list"))
+
+
+def save_harvest(form: HarvestForm, harvest: Harvest, update_fields: Optional[list] = None) -> bool:
+    """
+    Save harvest together with its rollup update, reporting duplicate created since form validation as form error.
+
+    :return: True if harvest was saved
+    """
+    try:
+        with transaction.atomic():
+            harvest.save(update_fields=update_fields)
+    except IntegrityError:
+        form.add_error(None, "Harvest with given fruit and date already exists")
+        return False
+    return True
 
 
 @login_required
@@ -120,14 +263,29 @@ def harvest_add(request: HttpRequest):
             harvest = Harvest(owner=form.owner, fruit=data['fruit'],
                               date=data['date'], amount=data['amount'],
                               price=data['price'])
-            harvest.save()
-            return redirect(reverse("harvest:harvest-list"), permanent=True)
+            if save_harvest(form, harvest):
+                return redirect(reverse("harvest:harvest-list"), permanent=True)
 
     return render(request,
                   template_name="harvest/harvest_add.html",
                   context={"form": form})
 
 
+@login_required
+def harvest_add_batch(request: HttpRequest):
+    """View for adding many harvests at once, validated together and inserted with one query"""
+    formset = HarvestFormSet(request.user)
+
+    if request.method == "POST":
+        formset = HarvestFormSet(request.user, request.POST)
+        if formset.is_valid() and formset.save() is not None:
+            return redirect(reverse("harvest:harvest-list"), permanent=True)
+
+    return render(request,
+                  template_name="harvest/harvest_add_batch.html",
+                  context={"formset": formset})
+
+
 @login_required
 def harvest_edit(request: HttpRequest, pk: int):
     """View for editing data of specific harvest"""
@@ -135,19 +293,14 @@ def harvest_edit(request: HttpRequest, pk: int):
     if not harvest:
         raise Http404("Harvest not found")
 
-    form = HarvestForm(instance=harvest, owner=harvest.owner)
+    form = HarvestForm(instance=harvest, owner=request.user)
     if request.method == "POST":
-        form = HarvestForm(request.user, pk, request.POST)
+        form = HarvestForm(request.user, pk, request.POST, instance=harvest)
 
         if form.is_valid():
-            data = form.cleaned_data
-            harvest.date = data.get("date")
-            harvest.price = data.get("price")
-            harvest.fruit = data.get("fruit")
-            harvest.amount = data.get("amount")
-            harvest.owner = form.owner
-            harvest.save()
-            return redirect(reverse("harvest:harvest-list"), permanent=True)
+            # ModelForm has already assigned cleaned values to harvest, only changed columns are written
+            if not form.changed_data or save_harvest(form, harvest, update_fields=form.changed_data):
+                return redirect(reverse("harvest:harvest-list"), permanent=True)
 
     return render(request,
                   template_name="harvest/harvest_edit.html",
@@ -168,3 +321,62 @@ def harvest_delete(request: HttpRequest, pk: int):
     return render(request,
                   template_name="harvest/harvest_delete.html",
                   context={"harvest": harvest})
+
+
+EXPORT_FORMATS = {
+    "csv": (stream_csv, "text/csv"),
+    "ndjson": (stream_ndjson, "application/x-ndjson"),
+}
+
+
+@login_required
+@conditional_harvests_page
+def harvest_export(request: HttpRequest):
+    """View streaming user harvests as CSV or NDJSON file, optionally filtered by fruit and year"""
+    try:
+        harvests, export_format, filename = export_params(request)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+
+    stream, content_type = EXPORT_FORMATS[export_format]
+    response = StreamingHttpResponse(stream(harvests), content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+def export_params(request: HttpRequest) -> tuple[QuerySet, str, str]:
+    """
+    Read format and filters of export.
+
+    :return: tuple (filtered harvests of user, export format, name of exported file)
+    :raises ValueError: with message for user when format, fruit or year is invalid
+    """
+    export_format = request.GET.get(key="format", default="csv")
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format, choose one of: {', '.join(EXPORT_FORMATS)}")
+
+    harvests = Harvest.objects.filter(owner=request.user)
+    filename_comp = ["harvests"]
+
+    fruit = request.GET.get(key="fruit")
+    if fruit and fruit != "all":
+        # name of fruit goes to file name in a header too, so only known ones are accepted
+        fruits = [choice for choice, _ in Harvest.FRUITS]
+        if fruit not in fruits:
+            raise ValueError(f"Unknown fruit, choose one of: {', '.join(fruits)}")
+        harvests = harvests.filter(fruit=fruit)
+        filename_comp.append(fruit)
+
+    year = request.GET.get(key="year")
+    if year:
+        try:
+            year_number = int(year)
+        except ValueError:
+            raise ValueError("Year has to be a number")
+        # checked here, out of range year would only fail once rows are streamed, after response headers are sent
+        if not datetime.MINYEAR <= year_number <= datetime.MAXYEAR:
+            raise ValueError(f"Year has to be between {datetime.MINYEAR} and {datetime.MAXYEAR}")
+        harvests = harvests.filter(date__year=year_number)
+        filename_comp.append(str(year_number))
+
+    return harvests, export_format, f"{'_'.join(filename_comp)}_{datetime.date.today()}.{export_format}"